@@ -21,7 +21,8 @@ from djbabel.types import (
 
 from djbabel.serato import (
     read_serato_playlist,
-    to_serato_playlist
+    to_serato_playlist,
+    SeratoWriteReport,
 )
 
 from djbabel.rekordbox import (
@@ -82,26 +83,26 @@ def parse_output_format(arg: str) -> ASoftwareInfo:
             raise ValueError(f'Output format {arg} not supported')
 
 
-def get_playlist(filepath: Path, trans: ATransformation, name: str | None, anchor: Path | None, relative: Path | None) -> APlaylist:
+def get_playlist(filepath: Path, trans: ATransformation, name: str | None, anchor: Path | None, relative: Path | None, stream: bool = False, read_audio: bool = True, jobs: int = 1, processes: bool = False, database: Path | None = None) -> APlaylist:
     match trans.source:
         case ASoftwareInfo(ASoftware.SERATO_DJ_PRO, _):
-            return read_serato_playlist(filepath, trans, anchor, relative)
+            return read_serato_playlist(filepath, trans, anchor, relative, jobs, processes, database)
         case ASoftwareInfo(ASoftware.TRAKTOR, (4, _, _)):
-            return read_traktor_playlist(filepath, name, trans, anchor, relative)
+            return read_traktor_playlist(filepath, name, trans, anchor, relative, stream, read_audio, jobs)
         case ASoftwareInfo(ASoftware.REKORDBOX, (7, _, _)):
-            return read_rekordbox_playlist(filepath, name, trans, anchor, relative)
+            return read_rekordbox_playlist(filepath, name, trans, anchor, relative, stream, read_audio, jobs)
         case _:
             raise ValueError(f'Source format {trans.source} not supported.')
 
 
-def create_playlist(playlist: APlaylist, filepath: Path, trans: ATransformation, overwrite_tags: str) -> None:
+def create_playlist(playlist: APlaylist, filepath: Path, trans: ATransformation, overwrite_tags: str, jobs: int = 1, tag_padding: int | None = None, patch: bool = False) -> SeratoWriteReport | None:
     match trans.target:
         case ASoftwareInfo(ASoftware.REKORDBOX, _):
             return to_rekordbox_playlist(playlist, filepath, trans)
         case ASoftwareInfo(ASoftware.TRAKTOR, _):
             return to_traktor_playlist(playlist, filepath, trans)
         case ASoftwareInfo(ASoftware.SERATO_DJ_PRO, _):
-            return to_serato_playlist(playlist, filepath, trans, overwrite_tags)
+            return to_serato_playlist(playlist, filepath, trans, overwrite_tags, jobs, tag_padding, patch)
         case _:
             raise ValueError(f'Target format {trans.target} not supported.')
 
@@ -167,6 +168,20 @@ def main():
     parser.add_argument('-w', '--overwrite-tags',
                         action='store_const', const='Y', default='n',
                         help="Overwrite the audio file metadata standard tags (title, ...). By default, only DJ software specific tags are overwritten. Use with 'Serato DJ Pro' as target ('sdjpro'))")
+    parser.add_argument('--tag-padding', type=int, metavar='BYTES',
+                        help="With 'Serato DJ Pro' as target, the padding reserved after the tags when an audio file has to be rewritten because its tags grew. Later exports then update the tags in place. By default, 1 KiB + 0.1%% of the audio data.")
+    parser.add_argument('--patch', action='store_true',
+                        help="With 'Serato DJ Pro' as target, only write the Serato tags (cues, loops, beatgrid, ...). When the new tags have the same size as the ones in the audio file, their bytes are overwritten in place, which is much faster than saving the file.")
+    parser.add_argument('--stream', action='store_true',
+                        help="Parse the input file incrementally, keeping in memory only the requested playlist. Useful with very large rekordbox and Traktor collections.")
+    parser.add_argument('--no-audio', dest='read_audio', action='store_false',
+                        help="Don't open the audio files and use the values stored in the rekordbox and Traktor collections. MP3 files are still read when the beatgrid adjustment depends on the encoder (rekordbox).")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Number of threads used to open the audio files, and to write them with 'Serato DJ Pro' as target. Values above 1 speed up network or USB storage.")
+    parser.add_argument('--processes', action='store_true',
+                        help="With a Serato DJ Pro source, decode the audio files on '--jobs' processes instead of threads. Faster on multi-core machines when the files are on fast storage.")
+    parser.add_argument('--database', type=Path,
+                        help="With a Serato DJ Pro source, the library 'database V2' file (in the '_Serato_' folder). Text metadata is read from it, and it's the only metadata source for files that can't be opened, e.g. on offline drives.")
     parser.add_argument('-v', '--version', action='version', version=f'%(prog)s {__version__}')
 
     args = parser.parse_args()
@@ -178,8 +193,14 @@ def main():
         ofile = output_filename(args.ofile, args.ifile, trans)
         name = args.playlist_name if args.playlist_name != '' else None
 
-        playlist = get_playlist(ifile, trans, name, args.anchor, args.relative)
-        create_playlist(playlist, ofile, trans, args.overwrite_tags)
+        playlist = get_playlist(ifile, trans, name, args.anchor, args.relative, args.stream, args.read_audio, args.jobs, args.processes, args.database)
+        report = create_playlist(playlist, ofile, trans, args.overwrite_tags, args.jobs, args.tag_padding, args.patch)
+        if report is not None:
+            for p, err in report.errors:
+                print(f'djbabel: Playlist track error: {p}: {err}')
+            for p in report.rewritten:
+                print(f'djbabel: {p}: tags did not fit, file rewritten')
+            print(f'djbabel: {len(report.written)} files written ({len(report.patched)} patched, {len(report.rewritten)} rewritten), {len(report.unchanged)} unchanged, {len(report.skipped)} skipped, {len(report.errors)} failed')
     except ValueError as err:
         print(f'{err}')
     except MutagenError as err:
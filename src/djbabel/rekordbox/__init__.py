@@ -3,4 +3,4 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 from .write import to_rekordbox_playlist
-from .read import read_rekordbox_playlist
+from .read import read_rekordbox_playlist, read_rekordbox_library
@@ -4,11 +4,14 @@
 
 import binascii
 from datetime import date, datetime
+import itertools
+from mutagen._file import FileType # pyright: ignore
 import os
 from pathlib import Path
 import struct
-from urllib.parse import urlparse
+from urllib.parse import unquote, urlparse
 from urllib.request import url2pathname
+from typing import Any, Iterable
 import warnings
 import xml.etree.ElementTree as ET
 
@@ -34,15 +37,18 @@ from ..utils import (
     file_size,
     kbps_to_bps,
     inverse_dict,
-    maybe_audio,
+    iterparse_subtrees,
     normalize_time,
+    probe_audio_files,
     to_float,
     to_int,
+    track_audio,
+    wants_audio,
     CLASSIC2ABBREV_KEY_MAP
 )
 
 from .utils import (
-    rb_attr_name,
+    REKORDBOX_ATTR_NAMES,
     REKORDBOX_MARKERTYPE_MAP
 )
 
@@ -73,115 +79,139 @@ def get_rb_location(entry: ET.Element) -> Path:
     return Path(path_str)
 
 
-def get_tag_attr(fn: str, element: ET.Element) -> str | None:
-    tn = rb_attr_name(fn)
-    v = element.get(tn)
-    return v if v != '' else None
+REKORDBOX_MARKERTYPE_INVERSE_MAP = inverse_dict(REKORDBOX_MARKERTYPE_MAP)
+ABBREV2CLASSIC_KEY_MAP = inverse_dict(CLASSIC2ABBREV_KEY_MAP)
 
-
-def get_color(element: ET.Element) -> tuple[int,int,int] | None:
-    c = get_tag_attr('color', element)
+def rb_color(c: str | None) -> tuple[int,int,int] | None:
     if c is not None and c.startswith('0x') and len(c) == 8:
         return struct.unpack('BBB',binascii.unhexlify(c[2:]))
     else:
         return None
 
 
-def get_beatgrid(element: ET.Element) -> list[ABeatGridBPM]:
-    bg = []
-    for tempo in element.findall('TEMPO'):
-        bpm = to_float(tempo.get('Bpm'))
-        assert bpm is not None
-        position = to_float(tempo.get('Inizio'))
-        assert position is not None
-        metro_str = tempo.get('Metro')
-        assert metro_str is not None
-        b, m = metro_str.split('/')
-        if b.isnumeric() and m.isnumeric():
-            bg.append(ABeatGridBPM(position, bpm, (to_int(b), to_int(m))))
-        else:
-            bg.append(ABeatGridBPM(position, bpm))
-    return bg
-
-
-def get_markers(element: ET.Element) -> list[AMarker]:
-    mks = []
-    for pm in element.findall('POSITION_MARK'):
-        name = pm.get('Name')
-        assert name is not None
-        ty = pm.get('Type')
-        assert ty is not None
-        kind = inverse_dict(REKORDBOX_MARKERTYPE_MAP)[ty]
-        start = to_float(pm.get('Start'))
-        assert start is not None
-        end_str = pm.get('End')
-        end = to_float(end_str) if end_str != '' else None
-        index = to_int(pm.get('Num'))
-        red = to_int(pm.get('Red'))
-        green = to_int(pm.get('Green'))
-        blue = to_int(pm.get('Blue'))
-        color = closest_color_perceptual((red, green, blue))
-
-        mks.append(AMarker(name, color, start, end, kind, index, False))
-
-    return mks
-
-
-def get_tonality(element: ET.Element) -> str | None:
+def tempo_to_beatgrid(tempo: ET.Element) -> ABeatGridBPM:
+    bpm = to_float(tempo.get('Bpm'))
+    assert bpm is not None
+    position = to_float(tempo.get('Inizio'))
+    assert position is not None
+    metro_str = tempo.get('Metro')
+    assert metro_str is not None
+    b, m = metro_str.split('/')
+    if b.isnumeric() and m.isnumeric():
+        return ABeatGridBPM(position, bpm, (to_int(b), to_int(m)))
+    else:
+        return ABeatGridBPM(position, bpm)
+
+
+def position_mark_to_marker(pm: ET.Element) -> AMarker:
+    name = pm.get('Name')
+    assert name is not None
+    ty = pm.get('Type')
+    assert ty is not None
+    kind = REKORDBOX_MARKERTYPE_INVERSE_MAP[ty]
+    start = to_float(pm.get('Start'))
+    assert start is not None
+    end_str = pm.get('End')
+    end = to_float(end_str) if end_str != '' else None
+    index = to_int(pm.get('Num'))
+    red = to_int(pm.get('Red'))
+    green = to_int(pm.get('Green'))
+    blue = to_int(pm.get('Blue'))
+    color = closest_color_perceptual((red, green, blue))
+    return AMarker(name, color, start, end, kind, index, False)
+
+
+def abbrev_to_classic_key(t: str | None) -> str | None:
     """Rekordbox abbreviated tonality to ATrack format (classic) one.
     """
-    t = get_tag_attr('tonality', element)
-    a2c = inverse_dict(CLASSIC2ABBREV_KEY_MAP)
     if t is None:
         return None
-    elif t in a2c.keys():
-        return a2c[t]
+    elif t in ABBREV2CLASSIC_KEY_MAP:
+        return ABBREV2CLASSIC_KEY_MAP[t]
     else:
-        warnings.warn(f"get_tonality: Tonality {t} is not in the expected abbreviated format.")
+        warnings.warn(f"abbrev_to_classic_key: Tonality {t} is not in the expected abbreviated format.")
         return t
 
 
+def decode_track(entry: ET.Element) -> dict[str, Any]:
+    """Decode a COLLECTION TRACK visiting its attributes and children once.
+
+    Returns:
+      A dictionary with the raw string value of the fields in
+      REKORDBOX_TEXT_FIELDS (None if missing or empty), the 'beatgrid'
+      and the 'markers'.
+    """
+    attrs = entry.attrib
+    out: dict[str, Any] = {}
+    for fn, an in REKORDBOX_ATTR_NAMES:
+        v = attrs.get(an)
+        out[fn] = v if v != '' else None
+    beatgrid = []
+    markers = []
+    for child in entry:
+        match child.tag:
+            case 'TEMPO':
+                beatgrid.append(tempo_to_beatgrid(child))
+            case 'POSITION_MARK':
+                markers.append(position_mark_to_marker(child))
+    out['beatgrid'] = beatgrid
+    out['markers'] = markers
+    return out
+
+
 ###### Main #######################################################
 
-def from_rekordbox(entry: ET.Element, rb_version: list[int], anchor: Path | None = None, relative: Path | None = None) -> ATrack:
+def from_rekordbox(entry: ET.Element, rb_version: list[int], anchor: Path | None = None, relative: Path | None = None, read_audio: bool = True, trans: ATransformation | None = None) -> ATrack:
+    """Convert a COLLECTION TRACK into an ATrack.
 
+    If the audio file isn't read (see 'track_audio'), the size and
+    total time exported by rekordbox are used.
+    """
     location = adjust_location(get_rb_location(entry), anchor, relative)
-    audio = maybe_audio(location)
+    audio = track_audio(location, read_audio, trans)
+    return rekordbox_atrack(entry, location, audio, rb_version)
+
+
+def rekordbox_atrack(entry: ET.Element, location: Path, audio: FileType | None, rb_version: list[int]) -> ATrack:
+    """Convert a COLLECTION TRACK into an ATrack, given its (adjusted)
+    location and the opened audio file, if any.
+    """
+    e = decode_track(entry)
 
     return ATrack(
-        title = get_tag_attr('title', entry),
-        artist = get_tag_attr('artist', entry),
-        grouping = get_tag_attr('grouping', entry),
-        remixer = get_tag_attr('remixer', entry),
-        composer = get_tag_attr('composer', entry),
-        album = get_tag_attr('album', entry),
-        genre = get_tag_attr('genre', entry),
-        track_number = to_int(get_tag_attr('track_number', entry)),
-        disc_number = to_int(get_tag_attr('disc_number', entry)),
-        release_date = to_date(get_tag_attr('release_date', entry)),
-        play_count = to_int(get_tag_attr('play_count', entry)),
-        tonality = get_tonality(entry),
-        label = get_tag_attr('label', entry),
-        comments = get_tag_attr('comments', entry),
-        rating = to_int(get_tag_attr('rating', entry)),
-        size = file_size(audio) if audio is not None else None,
-        total_time = audio_length(audio),
-        bit_rate = kbps_to_bps(to_int(get_tag_attr('bit_rate', entry))),
-        sample_rate = to_float(get_tag_attr('sample_rate', entry)),
+        title = e['title'],
+        artist = e['artist'],
+        grouping = e['grouping'],
+        remixer = e['remixer'],
+        composer = e['composer'],
+        album = e['album'],
+        genre = e['genre'],
+        track_number = to_int(e['track_number']),
+        disc_number = to_int(e['disc_number']),
+        release_date = to_date(e['release_date']),
+        play_count = to_int(e['play_count']),
+        tonality = abbrev_to_classic_key(e['tonality']),
+        label = e['label'],
+        comments = e['comments'],
+        rating = to_int(e['rating']),
+        size = file_size(audio) if audio is not None else to_int(e['size']),
+        total_time = audio_length(audio) if audio is not None else to_float(e['total_time']),
+        bit_rate = kbps_to_bps(to_int(e['bit_rate'])),
+        sample_rate = to_float(e['sample_rate']),
         location = location,
         aformat = audio_file_type(audio) if audio is not None else aformat_from_path(location),
-        beatgrid = get_beatgrid(entry),
-        markers = get_markers(entry),
+        beatgrid = e['beatgrid'],
+        markers = e['markers'],
         locked = False, # no 'locked' entry
-        color = get_color(entry),
-        average_bpm = to_float(get_tag_attr('average_bpm', entry)),
+        color = rb_color(e['color']),
+        average_bpm = to_float(e['average_bpm']),
         loudness = None, # no 'loudness' entry
         data_source = ADataSource(ASoftware.REKORDBOX,
                                   rb_version,
                                   audio_endocer(audio) if audio is not None else None),
         trackID = None,
-        mix = get_tag_attr('mix', entry),
-        date_added = to_date(get_tag_attr('date_added', entry))
+        mix = e['mix'],
+        date_added = to_date(e['date_added'])
     )
 
 
@@ -203,66 +233,244 @@ def get_element_key(element: ET.Element, key_type: RBPlaylistKeyType) -> str | N
         case RBPlaylistKeyType.LOCATION:
             return element.get('Location')
 
-def find_collection_entry(col: ET.Element, key: str | None, key_type: RBPlaylistKeyType) -> ET.Element | None:
+
+# Index of the COLLECTION TRACK elements by playlist key type.
+RBCollectionIndex = dict[RBPlaylistKeyType, dict[str, ET.Element]]
+
+def normalize_rb_location(url: str) -> str:
+    """Normalize a Location URL for lookups.
+
+    rekordbox writes 'file://localhost/...', but the same file may
+    appear as 'file:///...' or with different percent-encoding. We
+    compare the unquoted path component only.
+    """
+    return unquote(urlparse(url).path)
+
+
+def collection_key(key: str, key_type: RBPlaylistKeyType) -> str:
+    match key_type:
+        case RBPlaylistKeyType.TRACK_ID:
+            return key
+        case RBPlaylistKeyType.LOCATION:
+            return normalize_rb_location(key)
+
+
+def index_collection(tracks: Iterable[ET.Element], key_types: Iterable[RBPlaylistKeyType]) -> RBCollectionIndex:
+    """Index the COLLECTION TRACK elements by the keys of 'key_types'.
+
+    Build it once per file and use 'lookup_collection_entry' for each
+    playlist entry, instead of scanning the collection every time.
+    Only the key types used by the playlists to read are needed: the
+    Location keys are normalized, which costs a URL parse per track.
+    If a key appears more than once, the first element wins.
+    """
+    index: RBCollectionIndex = {kt: {} for kt in key_types}
+    for element in tracks:
+        for key_type, keys in index.items():
+            k = get_element_key(element, key_type)
+            if k is not None:
+                keys.setdefault(collection_key(k, key_type), element)
+    return index
+
+
+def lookup_collection_entry(index: RBCollectionIndex, key: str | None, key_type: RBPlaylistKeyType) -> ET.Element | None:
     if key is None:
         return None
     else:
-        out = None
-        for element in col.iter('TRACK'):
-            el_key = get_element_key(element, key_type)
-            if el_key != key:
-                continue
-            else:
-                out = element
-                break
-        return out
+        return index[key_type].get(collection_key(key, key_type))
 
 
-def read_rekordbox_playlist(rb_file: Path, name: str | None, trans: ATransformation, anchor: Path | None = None, relative: Path | None = None) -> APlaylist:
-
-    root = ET.parse(rb_file).getroot()
-    prod = root.find('PRODUCT')
+def get_rb_version(prod: ET.Element | None) -> list[int]:
     if prod is not None:
         v = prod.attrib['Version']
-        rb_version = list(map(int, v.split('.')))
+        return list(map(int, v.split('.')))
     else:
         raise ValueError(f"XML file has not PRODUCT information.")
 
-    # find playlist
-    pls = root.findall('.//NODE[@Type="1"]')
-    pl_name = rb_file.stem if name is None else name
 
+def select_playlist(pls: list[ET.Element], pl_name: str) -> ET.Element:
     pl = list(filter(lambda pl: pl.attrib['Name'] == pl_name, pls))
     if len(pl) == 0:
         raise ValueError(f'Playlist {pl_name} not found.')
     elif len(pl) > 1:
         raise ValueError(f'More than 1 playlist named {pl_name}!')
     else:
-        pl = pl[0]
+        return pl[0]
 
-    # number of entries
+
+def get_playlist_entries(pl: ET.Element) -> int:
     entries = pl.get('Entries')
     assert entries is not None
-    entries = int(entries)
+    return int(entries)
 
-    # key type
-    key_type = get_playlist_key_type(pl)
 
-    # lookup entry in collection
-    col = root.find('COLLECTION')
-    if col is None:
-        raise ValueError(f'No COLLECTION in playlist {pl_name}: Corrupted file.')
+def playlist_tracks(pl: ET.Element, index: RBCollectionIndex, rb_version: list[int], trans: ATransformation, anchor: Path | None = None, relative: Path | None = None, decoded: dict[ET.Element, ATrack] | None = None, read_audio: bool = True, jobs: int = 1) -> list[ATrack]:
+    """Decode the tracks of a playlist NODE.
 
-    ats = []
+    If 'decoded' is given, it's used as a cache of the COLLECTION
+    entries already decoded, such that tracks appearing in several
+    playlists are decoded once and shared. If 'read_audio' is False,
+    audio files are only opened when 'trans' requires it. The audio
+    files are opened on a pool of 'jobs' threads.
+    """
+    key_type = get_playlist_key_type(pl)
+    entries = []
     for t in pl.findall('./TRACK'):
-        k = t.get('Key')
-        e = find_collection_entry(col, k, key_type)
+        e = lookup_collection_entry(index, t.get('Key'), key_type)
         if e is not None:
-            at = from_rekordbox(e, rb_version, anchor, relative)
-            ats.append(normalize_time(at, trans))
-
-    apl = APlaylist(pl_name, ats)
+            entries.append(e)
+
+    if decoded is None:
+        decoded = {}
+    # open the audio files of the entries not yet decoded at once
+    todo = list(dict.fromkeys(e for e in entries if e not in decoded))
+    locations = [adjust_location(get_rb_location(e), anchor, relative) for e in todo]
+    audios = probe_audio_files((loc if wants_audio(loc, read_audio, trans) else None
+                                for loc in locations), jobs)
+    for e, loc, audio in zip(todo, locations, audios):
+        decoded[e] = normalize_time(rekordbox_atrack(e, loc, audio, rb_version), trans)
+    return [decoded[e] for e in entries]
+
+
+def make_playlist(pl: ET.Element, pl_name: str, tracks: list[ATrack], folder: tuple[str, ...] = ()) -> APlaylist:
+    entries = get_playlist_entries(pl)
+    apl = APlaylist(pl_name, tracks, folder)
     if apl.entries != entries:
         warnings.warn(f"Couldn't find all files in playlist {pl_name}.")
-
     return apl
+
+
+def stream_rekordbox_playlist(rb_file: Path, pl_name: str) -> tuple[list[int], ET.Element, RBCollectionIndex]:
+    """Find a playlist and its COLLECTION entries parsing the file incrementally.
+
+    The COLLECTION precedes the PLAYLISTS in the XML file. Hence, a
+    first pass collects the keys of the playlist, and a second one
+    keeps only the matching COLLECTION TRACK elements. All other
+    elements are discarded as soon as they are parsed.
+
+    Returns:
+      The rekordbox version, the playlist NODE and an index of the
+      needed COLLECTION entries.
+    """
+    def is_playlist(tags: list[str], e: ET.Element) -> bool:
+        return (tags == ['DJ_PLAYLISTS', 'PRODUCT'] or
+                (e.tag == 'NODE' and e.get('Type') == '1' and e.get('Name') == pl_name))
+
+    prod = None
+    pls = []
+    for e in iterparse_subtrees(rb_file, is_playlist):
+        if e.tag == 'PRODUCT':
+            prod = e
+        else:
+            pls.append(e)
+    rb_version = get_rb_version(prod)
+    pl = select_playlist(pls, pl_name)
+    key_type = get_playlist_key_type(pl)
+
+    keys = set()
+    for t in pl.findall('./TRACK'):
+        k = t.get('Key')
+        if k is not None:
+            keys.add(collection_key(k, key_type))
+
+    found = set()
+    def is_needed_track(tags: list[str], e: ET.Element) -> bool:
+        if tags != ['DJ_PLAYLISTS', 'COLLECTION', 'TRACK']:
+            return False
+        k = get_element_key(e, key_type)
+        if k is None:
+            return False
+        k = collection_key(k, key_type)
+        if k in keys and k not in found:
+            found.add(k)
+            return True
+        else:
+            return False
+
+    # stop parsing as soon as all entries have been found.
+    tracks = itertools.islice(iterparse_subtrees(rb_file, is_needed_track), len(keys))
+    return rb_version, pl, index_collection(tracks, [key_type])
+
+
+def read_rekordbox_playlist(rb_file: Path, name: str | None, trans: ATransformation, anchor: Path | None = None, relative: Path | None = None, stream: bool = False, read_audio: bool = True, jobs: int = 1) -> APlaylist:
+    """Read a playlist from a rekordbox XML collection file.
+
+    Args:
+      rb_file: The XML file.
+      name: The playlist name. If None, use the file name stem.
+      trans: The transformation being performed.
+      anchor: Path anchor to add to the track paths.
+      relative: Make the track paths relative to this path.
+      stream: Parse the file incrementally, keeping in memory only the
+        playlist and its tracks. Use this for very large collections.
+      read_audio: If False, use the values exported by rekordbox and
+        open the audio files only when 'trans' requires it.
+      jobs: Number of threads used to open the audio files.
+    """
+    pl_name = rb_file.stem if name is None else name
+
+    if stream:
+        rb_version, pl, index = stream_rekordbox_playlist(rb_file, pl_name)
+    else:
+        root = ET.parse(rb_file).getroot()
+        rb_version = get_rb_version(root.find('PRODUCT'))
+        # find playlist
+        pl = select_playlist(root.findall('.//NODE[@Type="1"]'), pl_name)
+        # lookup entry in collection
+        col = root.find('COLLECTION')
+        if col is None:
+            raise ValueError(f'No COLLECTION in playlist {pl_name}: Corrupted file.')
+        index = index_collection(col.iter('TRACK'), [get_playlist_key_type(pl)])
+
+    return make_playlist(pl, pl_name, playlist_tracks(pl, index, rb_version, trans, anchor, relative, read_audio=read_audio, jobs=jobs))
+
+
+def read_rekordbox_library(rb_file: Path, trans: ATransformation, anchor: Path | None = None, relative: Path | None = None, read_audio: bool = True, jobs: int = 1) -> list[APlaylist]:
+    """Read all playlists from a rekordbox XML collection file.
+
+    The file is parsed once and the whole PLAYLISTS NODE tree is
+    walked. Folders (Type="0") are recorded in the 'folder' attribute
+    of the playlists they contain (the root folder is omitted). Each
+    COLLECTION entry is decoded once, and the resulting ATrack is
+    shared by all playlists including it.
+
+    Args:
+      rb_file: The XML file.
+      trans: The transformation being performed.
+      anchor: Path anchor to add to the track paths.
+      relative: Make the track paths relative to this path.
+      read_audio: If False, use the values exported by rekordbox and
+        open the audio files only when 'trans' requires it.
+      jobs: Number of threads used to open the audio files.
+
+    Returns:
+      The playlists in document order.
+    """
+    root = ET.parse(rb_file).getroot()
+    rb_version = get_rb_version(root.find('PRODUCT'))
+    col = root.find('COLLECTION')
+    if col is None:
+        raise ValueError(f'No COLLECTION in file {rb_file}: Corrupted file.')
+    key_types = {get_playlist_key_type(pl) for pl in root.iterfind('./PLAYLISTS//NODE[@Type="1"]')}
+    index = index_collection(col.iter('TRACK'), key_types)
+    decoded: dict[ET.Element, ATrack] = {}
+
+    def walk(node: ET.Element, folder: tuple[str, ...]) -> list[APlaylist]:
+        apls = []
+        for child in node.findall('./NODE'):
+            name = child.get('Name', '')
+            match child.get('Type'):
+                case '0':
+                    apls += walk(child, folder + (name,))
+                case '1':
+                    ats = playlist_tracks(child, index, rb_version, trans, anchor, relative, decoded, read_audio, jobs)
+                    apls.append(make_playlist(child, name, ats, folder))
+                case t:
+                    warnings.warn(f"Ignoring NODE {name} of unknown Type {t}.")
+        return apls
+
+    apls = []
+    # The top NODE is the root folder 'ROOT'.
+    for top in root.findall('./PLAYLISTS/NODE'):
+        apls += walk(top, ())
+    return apls
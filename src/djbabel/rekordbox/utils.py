@@ -75,3 +75,15 @@ def rb_attr_name(s: str) -> str:
     else:
         return ''.join(map(lambda w: w.capitalize(), s.split('_')))
 
+
+
+# ATrack fields read from the attributes of a COLLECTION TRACK element.
+REKORDBOX_TEXT_FIELDS = [
+    'title', 'artist', 'grouping', 'remixer', 'composer', 'album',
+    'genre', 'track_number', 'disc_number', 'release_date', 'play_count',
+    'tonality', 'label', 'comments', 'rating', 'size', 'total_time',
+    'bit_rate', 'sample_rate', 'color', 'average_bpm', 'mix', 'date_added',
+]
+
+# Precomputed (ATrack field, Rekordbox attribute) pairs.
+REKORDBOX_ATTR_NAMES = [(fn, rb_attr_name(fn)) for fn in REKORDBOX_TEXT_FIELDS]
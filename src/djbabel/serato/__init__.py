@@ -2,5 +2,5 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from .read import from_serato, read_serato_playlist
-from .write import to_serato, to_serato_playlist
+from .read import from_serato, read_serato_playlist, read_serato_library
+from .write import SeratoWriteReport, to_serato, to_serato_playlist
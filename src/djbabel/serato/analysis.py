@@ -6,13 +6,13 @@ from dataclasses import dataclass
 from mutagen._file import FileType # pyright: ignore
 
 from .types import SeratoTags, EntryBase
-from .utils import get_serato_metadata
+from .utils import get_serato_metadata, SeratoAudio
 
 @dataclass
 class Analysis(EntryBase):
     version : list[int]
 
-def get_serato_analysis(audio: FileType) -> Analysis | None:
+def get_serato_analysis(audio: FileType | SeratoAudio) -> Analysis | None:
     out = get_serato_metadata(SeratoTags.ANALYSIS, parse)(audio)
     if out is None:
         return None
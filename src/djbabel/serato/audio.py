@@ -0,0 +1,450 @@
+# SPDX-FileCopyrightText: 2025 Federico Beffa <beffa@fbengineering.ch>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Fast opening of audio files for reading Serato metadata.
+
+'mutagen.File' tries every registered format and parses all the
+metadata, including large cover art pictures. Here we sniff the format
+from the file extension and magic bytes, and load only the tags used
+by 'from_serato' (ID3 frames, FLAC blocks or M4A atoms). Only the
+public mutagen API is used. The returned objects are meant for reading
+only: saving them would drop the tags that were not loaded.
+"""
+
+from dataclasses import dataclass
+import io
+import mutagen
+import mutagen.flac
+import mutagen.mp3
+import mutagen.mp4
+from mutagen import MutagenError
+from mutagen.flac import StreamInfo, VCFLACDict
+from mutagen._file import FileType # pyright: ignore
+import os
+from pathlib import Path
+import re
+import struct
+from typing import BinaryIO
+
+from ..types import AFormat
+from ..utils import aformat_from_path
+
+from .types import SeratoTags
+from .utils import map_to_flac_text_tag, map_to_mp3_text_tag, map_to_mp4_tag
+
+###########################################################################
+# Format sniffing
+
+def sniff_aformat(path: Path, header: bytes) -> AFormat | None:
+    """Audio format from the file extension, confirmed by the magic bytes.
+
+    Args:
+      path: The audio file path.
+      header: The first (at least 8) bytes of the file.
+
+    Returns:
+      The audio format, or None if the extension is not supported or
+      doesn't agree with the content.
+    """
+    try:
+        aformat = aformat_from_path(path)
+    except ValueError:
+        return None
+    match aformat:
+        case AFormat.MP3:
+            ok = (header.startswith(b'ID3') or
+                  (len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0))
+        case AFormat.FLAC:
+            ok = header.startswith(b'fLaC')
+        case AFormat.M4A:
+            ok = header[4:8] == b'ftyp'
+        case _:
+            ok = False
+    return aformat if ok else None
+
+
+def load_audio(path: Path) -> FileType | None:
+    """Open an audio file with mutagen, loading all metadata.
+
+    The class is selected by 'sniff_aformat', instead of letting
+    mutagen score every format. Falls back to 'mutagen.File'.
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(16)
+    except OSError:
+        # let mutagen report the error
+        header = b''
+    match sniff_aformat(path, header):
+        case AFormat.MP3:
+            return mutagen.mp3.MP3(path)
+        case AFormat.FLAC:
+            return mutagen.flac.FLAC(path)
+        case AFormat.M4A:
+            return mutagen.mp4.MP4(path)
+        case _:
+            return mutagen.File(path, easy=False) # pyright: ignore
+
+###########################################################################
+# MP3
+
+# Frames decoded for 'from_serato'. ID3v2.3 date frames are merged into
+# TDRC by mutagen.
+MP3_FRAMES = frozenset(
+    [t.split(':')[0] for t in map_to_mp3_text_tag.values() if t is not None] +
+    ['TSSE', 'TYER', 'TDAT', 'TIME', 'COMM', 'TXXX', 'RVA2', 'GEOB']
+)
+
+# Fields stored in the Serato database. For database tracks, their
+# text tags are read from the file only when the database doesn't have
+# them.
+DB_TEXT_FIELDS = ['title', 'artist', 'album', 'genre', 'grouping', 'composer',
+                  'label', 'comments', 'year', 'release_date', 'tonality']
+
+# Frames of the Serato tags, of the encoder and of the database fields.
+MP3_SERATO_FRAMES = frozenset(
+    [t.split(':')[0] for n, t in map_to_mp3_text_tag.items() if n in DB_TEXT_FIELDS and t is not None] +
+    ['TYER', 'TDAT', 'TIME', 'GEOB', 'TSSE']
+)
+
+ID3_HEADER = struct.Struct('>3sBBBL')
+ID3_FRAME_HEADER = struct.Struct('>4sLH')
+
+# ID3 flags not supported: unsynchronisation and extended header.
+ID3_UNSUPPORTED_FLAGS = 0x80 | 0x40
+# ID3v2.4 footer flag.
+ID3_FOOTER_FLAG = 0x10
+
+ID3_FRAME_ID = re.compile(rb'[A-Z0-9]{4}')
+
+
+def synchsafe(n: int) -> int:
+    # as mutagen, the high bit of each byte is ignored
+    return ((n >> 3) & 0xFE00000) | ((n >> 2) & 0x1FC000) | ((n >> 1) & 0x3F80) | (n & 0x7F)
+
+
+def to_synchsafe(n: int) -> int:
+    return ((n & 0xFE00000) << 3) | ((n & 0x1FC000) << 2) | ((n & 0x3F80) << 1) | (n & 0x7F)
+
+
+class SplicedFile(io.RawIOBase):
+    """Read-only file made of 'head' followed by the content of 'f'
+    from the offset 'start'. The content of 'f' is read on demand.
+    """
+
+    def __init__(self, head: bytes, f: BinaryIO, start: int):
+        self.head = head
+        self.f = f
+        self.start = start
+        f.seek(0, os.SEEK_END)
+        self.size = len(head) + max(0, f.tell() - start)
+        self.pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self.pos, os.SEEK_END: self.size}[whence]
+        self.pos = max(0, base + offset)
+        return self.pos
+
+    def tell(self) -> int:
+        return self.pos
+
+    def readinto(self, b) -> int:
+        end = min(self.pos + len(b), self.size)
+        if end <= self.pos:
+            return 0
+        data = self.head[self.pos:end]
+        if end > len(self.head):
+            self.f.seek(self.start + max(0, self.pos - len(self.head)))
+            data += self.f.read(end - max(self.pos, len(self.head)))
+        b[:len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+
+def load_mp3_tags(path: Path, f: BinaryIO, frames: frozenset[str] = MP3_FRAMES) -> mutagen.mp3.MP3 | None:
+    """Open an MP3 file loading only the given ID3v2 frames (by
+    default, those used by 'from_serato').
+
+    The frame headers are read one at a time, and the other frames
+    (pictures, ...) are skipped with a seek. The selected frames are
+    parsed by mutagen from a synthesized ID3 tag, followed by the audio
+    frames of the file, which are read only for the stream info.
+
+    Returns:
+      The MP3 object, or None if the file has to be parsed by mutagen
+      (no ID3v2.3/2.4 tag, unsupported flags or invalid frames).
+    """
+    f.seek(0)
+    header = f.read(ID3_HEADER.size)
+    if len(header) < ID3_HEADER.size:
+        return None
+    magic, major, rev, flags, raw_size = ID3_HEADER.unpack(header)
+    if magic != b'ID3' or major not in (3, 4) or flags & ID3_UNSUPPORTED_FLAGS:
+        return None
+    end = ID3_HEADER.size + synchsafe(raw_size)
+    size_of = synchsafe if major == 4 else int
+    kept = []
+    pos = ID3_HEADER.size
+    while pos + ID3_FRAME_HEADER.size <= end:
+        f.seek(pos)
+        frame_header = f.read(ID3_FRAME_HEADER.size)
+        fid, raw_frame_size, _ = ID3_FRAME_HEADER.unpack(frame_header)
+        if fid.strip(b'\x00') == b'':
+            # padding
+            break
+        size = size_of(raw_frame_size)
+        if ID3_FRAME_ID.fullmatch(fid) is None or pos + ID3_FRAME_HEADER.size + size > end:
+            # e.g. ID3v2.4 sizes written as plain integers
+            return None
+        if fid.decode('latin-1') in frames:
+            kept.append(frame_header + f.read(size))
+        pos += ID3_FRAME_HEADER.size + size
+    if flags & ID3_FOOTER_FLAG:
+        end += ID3_HEADER.size
+
+    data = b''.join(kept)
+    tag = ID3_HEADER.pack(b'ID3', major, rev, 0, to_synchsafe(len(data))) + data
+    return mutagen.mp3.MP3(fileobj=SplicedFile(tag, f, end), filename=os.fspath(path))
+
+###########################################################################
+# FLAC
+
+FLAC_BLOCK_HEADER = struct.Struct('>B3s')
+
+# Vorbis comments read by 'from_serato' (lower case, as keys are case
+# insensitive).
+FLAC_COMMENTS = frozenset(
+    [t.lower() for t in map_to_flac_text_tag.values()] +
+    [stag.value.names[AFormat.FLAC] for stag in SeratoTags] +
+    ['encodedby', 'encoder']
+)
+
+# Comments of the Serato tags, of the encoder and of the database fields.
+FLAC_SERATO_COMMENTS = frozenset(
+    [map_to_flac_text_tag[n].lower() for n in DB_TEXT_FIELDS if n in map_to_flac_text_tag] +
+    [stag.value.names[AFormat.FLAC] for stag in SeratoTags] +
+    ['encodedby', 'encoder']
+)
+
+
+def load_flac_tags(path: Path, f: BinaryIO, comments: frozenset[str] = FLAC_COMMENTS) -> mutagen.flac.FLAC | None:
+    """Open a FLAC file loading only the STREAMINFO and VORBIS_COMMENT
+    blocks. Only the given comments (by default, those used by
+    'from_serato') are kept.
+
+    The two blocks are parsed by mutagen from a synthesized in-memory
+    file. Pictures and the other blocks are skipped with a seek.
+
+    Returns:
+      The FLAC object, or None if the file has to be parsed by mutagen.
+    """
+    f.seek(4)
+    blocks: dict[int, bytes] = {}
+    last = False
+    while not last:
+        header = f.read(FLAC_BLOCK_HEADER.size)
+        if len(header) < FLAC_BLOCK_HEADER.size:
+            return None
+        byte, raw_size = FLAC_BLOCK_HEADER.unpack(header)
+        code = byte & 0x7F
+        last = bool(byte & 0x80)
+        size = int.from_bytes(raw_size, 'big')
+        if code in (StreamInfo.code, VCFLACDict.code) and code not in blocks:
+            blocks[code] = f.read(size)
+        else:
+            f.seek(size, os.SEEK_CUR)
+    if StreamInfo.code not in blocks:
+        return None
+    start = f.tell()
+    f.seek(0, os.SEEK_END)
+    frames_size = f.tell() - start
+
+    data = [b'fLaC']
+    for i, code in enumerate(sorted(blocks)):
+        flag = 0x80 if i == len(blocks) - 1 else 0
+        block = blocks[code]
+        data.append(FLAC_BLOCK_HEADER.pack(code | flag, len(block).to_bytes(3, 'big')) + block)
+    audio = mutagen.flac.FLAC(fileobj=io.BytesIO(b''.join(data)), filename=os.fspath(path))
+    # as mutagen, the bitrate is computed from the size of the frames.
+    if audio.info.length:
+        audio.info.bitrate = int(float(frames_size) * 8 / audio.info.length)
+    if isinstance(audio.tags, VCFLACDict):
+        audio.tags[:] = [(k, v) for k, v in audio.tags if k.lower() in comments]
+    return audio
+
+###########################################################################
+# M4A
+
+MP4_ATOM_HEADER = struct.Struct('>I4s')
+
+
+@dataclass
+class Atom:
+    """An MP4 atom: its name and the position of its data."""
+    name: bytes
+    start: int
+    end: int
+
+
+# ilst atoms read by 'from_serato'.
+M4A_ATOMS = frozenset(
+    list(map_to_mp4_tag.values()) +
+    [stag.value.names[AFormat.M4A] for stag in SeratoTags] +
+    ['\xa9too']
+)
+
+# ilst atoms of the Serato tags, of the encoder and of the database fields.
+M4A_SERATO_ATOMS = frozenset(
+    [map_to_mp4_tag[n] for n in DB_TEXT_FIELDS if n in map_to_mp4_tag] +
+    [stag.value.names[AFormat.M4A] for stag in SeratoTags] +
+    ['\xa9too']
+)
+
+
+def freeform_key(data: bytes) -> str:
+    """The key '----:mean:name' of a freeform atom from its payload.
+    """
+    mean = name = ''
+    pos = 0
+    while pos + 12 <= len(data):
+        size, kind = MP4_ATOM_HEADER.unpack_from(data, pos)
+        if size < 12:
+            break
+        if kind == b'mean':
+            mean = data[pos + 12:pos + size].decode('utf-8', errors='replace')
+        elif kind == b'name':
+            name = data[pos + 12:pos + size].decode('utf-8', errors='replace')
+        pos += size
+    return f'----:{mean}:{name}'
+
+
+def render_atom(name: bytes, data: bytes) -> bytes:
+    return MP4_ATOM_HEADER.pack(MP4_ATOM_HEADER.size + len(data), name) + data
+
+
+def atom_headers(f: BinaryIO, start: int, end: int) -> list[Atom]:
+    """The atoms in 'f' between 'start' and 'end'.
+
+    Raises:
+      ValueError: If an atom size is invalid.
+    """
+    atoms = []
+    pos = start
+    while pos + MP4_ATOM_HEADER.size <= end:
+        f.seek(pos)
+        size, name = MP4_ATOM_HEADER.unpack(f.read(MP4_ATOM_HEADER.size))
+        header = MP4_ATOM_HEADER.size
+        if size == 1:
+            # 64-bit size
+            size, = struct.unpack('>Q', f.read(8))
+            header += 8
+        elif size == 0:
+            # up to the end of the parent
+            size = end - pos
+        if size < header or pos + size > end:
+            raise ValueError(f'Invalid size of atom {name!r}')
+        atoms.append(Atom(name, pos + header, pos + size))
+        pos += size
+    return atoms
+
+
+def find_atom(f: BinaryIO, path: list[bytes], start: int, end: int) -> Atom | None:
+    """The first atom at 'path' (e.g. [b'moov', b'udta']) between
+    'start' and 'end', or None.
+    """
+    atom = None
+    for name in path:
+        atom = next((a for a in atom_headers(f, start, end) if a.name == name), None)
+        if atom is None:
+            return None
+        # 'meta' is a full atom: version and flags precede the children
+        start = atom.start + (4 if name == b'meta' else 0)
+        end = atom.end
+    return atom
+
+
+def read_atom(f: BinaryIO, atom: Atom) -> bytes:
+    f.seek(atom.start)
+    return f.read(atom.end - atom.start)
+
+
+def load_m4a_tags(path: Path, f: BinaryIO, names: frozenset[str] = M4A_ATOMS) -> mutagen.mp4.MP4 | None:
+    """Open an M4A file loading only the given ilst atoms (by default,
+    those used by 'from_serato').
+
+    Cover art ('covr') and other atoms are skipped. The selected atoms
+    are parsed by mutagen from a synthesized in-memory 'moov' atom.
+
+    Returns:
+      The MP4 object, or None if the file has to be parsed by mutagen.
+    """
+    f.seek(0, os.SEEK_END)
+    moov = find_atom(f, [b'moov'], 0, f.tell())
+    if moov is None:
+        return None
+    children = []
+    udta = False
+    for atom in atom_headers(f, moov.start, moov.end):
+        if atom.name != b'udta':
+            children.append(render_atom(atom.name, read_atom(f, atom)))
+        elif not udta:
+            # as mutagen, only the first 'udta' is looked at
+            udta = True
+            ilst = find_atom(f, [b'meta', b'ilst'], atom.start, atom.end)
+            if ilst is None:
+                continue
+            kept = []
+            for item in atom_headers(f, ilst.start, ilst.end):
+                if item.name != b'----' and item.name.decode('latin-1') not in names:
+                    continue
+                data = read_atom(f, item)
+                if item.name == b'----' and freeform_key(data) not in names:
+                    continue
+                kept.append(render_atom(item.name, data))
+            meta = render_atom(b'meta', b'\x00' * 4 + render_atom(b'ilst', b''.join(kept)))
+            children.append(render_atom(b'udta', meta))
+
+    moov_data = render_atom(b'moov', b''.join(children))
+    return mutagen.mp4.MP4(fileobj=io.BytesIO(moov_data), filename=os.fspath(path))
+
+###########################################################################
+
+def load_audio_tags(path: Path, serato_only: bool = False) -> FileType | None:
+    """Open an audio file for reading its Serato metadata.
+
+    The file is opened with 'load_mp3_tags', 'load_flac_tags' or
+    'load_m4a_tags'. Other files, or files on which they fail, are
+    opened with 'load_audio'. The result must not be saved.
+
+    Args:
+      path: The audio file.
+      serato_only: Load only the Serato tags, the encoder tag and
+        the text tags of the fields stored in the Serato database
+        ('DB_TEXT_FIELDS').
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(16)
+            match sniff_aformat(path, header):
+                case AFormat.MP3:
+                    audio = load_mp3_tags(path, f, MP3_SERATO_FRAMES if serato_only else MP3_FRAMES)
+                case AFormat.FLAC:
+                    audio = load_flac_tags(path, f, FLAC_SERATO_COMMENTS if serato_only else FLAC_COMMENTS)
+                case AFormat.M4A:
+                    audio = load_m4a_tags(path, f, M4A_SERATO_ATOMS if serato_only else M4A_ATOMS)
+                case _:
+                    audio = None
+            if audio is not None:
+                return audio
+    except (struct.error, ValueError, IndexError, MutagenError):
+        # unusual or malformed tags: let 'load_audio' parse them, or
+        # report the error
+        pass
+    return load_audio(path)
@@ -5,11 +5,10 @@
 
 from dataclasses import dataclass
 from mutagen._file import FileType # pyright: ignore
-import io
 import struct
 
 from .types import EntryBase, SeratoTags
-from .utils import get_serato_metadata, FMT_VERSION, readbytes
+from .utils import get_serato_metadata, SeratoAudio, FMT_VERSION, VERSION_STRUCT
 
 ###############################################################################
 
@@ -20,7 +19,7 @@ class AutoTags(EntryBase):
     gaindb : float
 
 
-def get_serato_autotags(audio: FileType) -> AutoTags | None:
+def get_serato_autotags(audio: FileType | SeratoAudio) -> AutoTags | None:
     at = get_serato_metadata(SeratoTags.AUTOTAGS, parse)(audio)
     if at is None or len(at) == 0:
         return None
@@ -37,14 +36,13 @@ def get_serato_autotags(audio: FileType) -> AutoTags | None:
 # Original code licensed under the MIT License. See LICENSE/MIT.txt
 
 def parse(data: bytes) -> list[EntryBase]:
-    fp = io.BytesIO(data)
-    version = struct.unpack(FMT_VERSION, fp.read(2))
+    version = VERSION_STRUCT.unpack_from(data)
     assert version == (0x01, 0x01)
 
-    out = []
-    for _ in range(3):
-        data = b''.join(readbytes(fp))
-        out += [float(data.decode('ascii'))]
+    values = data[VERSION_STRUCT.size:].split(b'\x00', 3)
+    # missing values are empty, as when reading past the end.
+    values += [b''] * (3 - len(values))
+    out = [float(v.decode('ascii')) for v in values[:3]]
     return [AutoTags(*out)]
 
 
@@ -4,14 +4,13 @@
 # SPDX-License-Identifier: MIT
 
 from dataclasses import dataclass
-import io
 import struct
 from mutagen._file import FileType # pyright: ignore
 
 from .types import SeratoTags, EntryBase
-from .utils import get_serato_metadata, FMT_VERSION
+from .utils import get_serato_metadata, SeratoAudio, UINT32_STRUCT, VERSION_STRUCT
 
-def get_serato_beatgrid(audio: FileType) -> list[EntryBase] | None:
+def get_serato_beatgrid(audio: FileType | SeratoAudio) -> list[EntryBase] | None:
     return get_serato_metadata(SeratoTags.BEATGRID, parse)(audio)
 
 ###############################################################################
@@ -38,25 +37,27 @@ class Footer(EntryBase):
     unknown : int
 
 
+NON_TERMINAL_STRUCT = struct.Struct('>fI')
+TERMINAL_STRUCT = struct.Struct('>ff')
+FOOTER_STRUCT = struct.Struct('B')
+
 def parse(data: bytes) -> list[EntryBase]:
-    fp = io.BytesIO(data)
-    version = struct.unpack(FMT_VERSION, fp.read(2))
+    version = VERSION_STRUCT.unpack_from(data)
     assert version == (0x01, 0x00)
 
-    num_markers = struct.unpack('>I', fp.read(4))[0]
-    out = []
-    for i in range(num_markers):
-        position = struct.unpack('>f', fp.read(4))[0]
-        data = fp.read(4)
-        if i == num_markers - 1:
-            bpm = struct.unpack('>f', data)[0]
-            out += [TerminalBeatgridMarker(position, bpm)]
-        else:
-            beats_till_next_marker = struct.unpack('>I', data)[0]
-            out += [NonTerminalBeatgridMarker(position, beats_till_next_marker)]
-
+    num_markers = UINT32_STRUCT.unpack_from(data, VERSION_STRUCT.size)[0]
+    start = VERSION_STRUCT.size + UINT32_STRUCT.size
+    footer_pos = start + num_markers * NON_TERMINAL_STRUCT.size
     # TODO: What's the meaning of the footer byte?
-    out += [Footer(struct.unpack('B', fp.read(1))[0])]
+    # Unpacking it first also checks that all markers are present.
+    footer = Footer(FOOTER_STRUCT.unpack_from(data, footer_pos)[0])
+    out: list[EntryBase] = []
+    if num_markers > 0:
+        last_pos = footer_pos - TERMINAL_STRUCT.size
+        out += [NonTerminalBeatgridMarker(*m)
+                for m in NON_TERMINAL_STRUCT.iter_unpack(memoryview(data)[start:last_pos])]
+        out += [TerminalBeatgridMarker(*TERMINAL_STRUCT.unpack_from(data, last_pos))]
+    out += [footer]
     return out
     # In M4A files this assertion may fail. Is it due to our padding?
     # print(fp.read()) # there is a spurious byte '\x00'.
@@ -9,17 +9,20 @@ A Crate consists of a list of header names and width, followed by the
 list of track paths. The full information is extracted with the help
 of the function 'take_fields'.  From the result of 'take_fields', the
 track list (paths) can be extracted with 'get_track_paths'.
+
+To only list the tracks, 'crate_track_paths' memory maps the file and
+lazily yields the paths, walking the field headers by offset.
 """
 
 from dataclasses import make_dataclass, dataclass
+import mmap
+import os
 import struct
 from pathlib import Path
 from enum import Enum
-from io import BytesIO
-from typing import BinaryIO
-from collections.abc import Generator
+from typing import BinaryIO, Callable
+from collections.abc import Iterator
 from ..types import EntryBase
-from functools import reduce
 
 class CrateFieldKind(Enum):
     FIELD_BOOL = b'b'
@@ -149,39 +152,35 @@ TrackPath = created_classes['TrackPath']
 
 ############################################################
 
-def take_field_length(fp: BinaryIO) -> int:
-    data, = struct.unpack('>I', fp.read(4))
-    return data
-
-def parse_bool(fp: BinaryIO) -> Generator[bool, None, None]:
-    data, = struct.unpack('?', fp.read(1))
-    yield data
-
-def take_field_desc(fp: BinaryIO) -> Generator[bytes, None, None]:
-    raw = fp.read(4)
-    l = len(raw)
-    if l < 4:
-        data = b''
-    else:
-        data, = struct.unpack('>4s', raw)
-    yield data
-
-def take_u16_text(fp: BinaryIO) -> Generator[str, None, None]:
-    data = fp.read().decode('utf-16be', errors='replace')
-    yield data
-
-def take_u16(fp: BinaryIO) -> Generator[int, None, None]:
-    data, = struct.unpack('>H', fp.read(2))
-    yield data
-
-def take_u32(fp: BinaryIO) -> Generator[int, None, None]:
-    data, = struct.unpack('>I', fp.read(4))
-    yield data
-
-def take_field_content(fp: BinaryIO) -> Generator[bytes, None, None]:
-    length = take_field_length(fp)
-    data = fp.read(length)
-    yield data
+FIELD_HEADER = struct.Struct('>4sI')
+BOOL_STRUCT = struct.Struct('?')
+U16_STRUCT = struct.Struct('>H')
+U32_STRUCT = struct.Struct('>I')
+
+# A bytes-like object: bytes, memoryview or mmap.
+Buffer = bytes | memoryview | mmap.mmap
+
+def iter_fields(buf: Buffer, start: int = 0, end: int | None = None) -> Iterator[tuple[bytes, int, int]]:
+    """Walk the field headers of a crate buffer without copying the content.
+
+    Args:
+      buf: The crate data.
+      start: Offset of the first field header.
+      end: Offset past the last field (default: end of 'buf').
+
+    Returns:
+      An iterator over (field descriptor, content start, content end) offsets.
+    """
+    end = len(buf) if end is None else end
+    pos = start
+    # A trailing partial descriptor ends the list.
+    while end - pos >= 4:
+        if end - pos < FIELD_HEADER.size:
+            raise struct.error(f"Truncated crate field header at offset {pos}.")
+        desc, length = FIELD_HEADER.unpack_from(buf, pos)
+        content_start = pos + FIELD_HEADER.size
+        pos = content_start + length
+        yield desc, content_start, min(pos, end)
 
 def take_field_type(desc: bytes) -> bytes:
     return desc[0:1]
@@ -191,184 +190,184 @@ def take_field_name(desc: bytes) -> bytes:
 
 ############################################################
 
+BOOL_FIELDS: dict[bytes, type[CEntry]] = {
+    b"bgl": BeatgridLocked,
+    b"mis": Missing,
+    b"rev": ReverseOrder,
+    # b"crt" => ???
+    # b"hrt" => ???
+    # b"iro" => ???
+    # b"itu" => ???
+    # b"krk" => ???
+    # b"ovc" => ???
+    # b"ply" => ???
+    # b"uns" => ???
+    # b"wlb" => ???
+    # b"wll" => ???
+}
+
+U32_FIELDS: dict[bytes, type[CEntry]] = {
+    b"add": DateAdded,
+    b"tme": FileTime,
+    # b"lbl" => ???
+    # b"fsb" => ???
+    # b"tkn" => ???
+    # b"dsc" => ???
+}
+
+PATH_FIELDS: dict[bytes, type[CEntry]] = {
+    b"fil": FilePath,
+    b"trk": TrackPath,
+}
+
+TEXT_FIELDS: dict[bytes, type[CEntry]] = {
+    b"add": DateAddedStr,
+    b"alb": Album,
+    b"art": Artist,
+    b"bit": Bitrate,
+    b"bpm": BPM,
+    b"cmp": Composer,
+    b"com": Comment,
+    b"gen": Genre,
+    b"grp": Grouping,
+    b"key": Key,
+    b"lbl": Label,
+    b"len": Length,
+    b"siz": FileSize,
+    b"smp": SampleRate,
+    b"sng": SongTitle,
+    b"typ": FileType,
+    b"tyr": Year,
+    b"vcn": ColumnName,
+    b"vcw": ColumnWidth,
+    b"vrsn": Version,
+}
+
+CONTAINER_FIELDS: dict[bytes, type[CEntry]] = {
+    b"srt": Sorting,
+    b"trk": Track,
+    b"vct": ColumnTitle,
+}
+
 def parse_field_bool(name: bytes, value: bool) -> CEntry:
-    match name:
-        case b"bgl":
-            field = BeatgridLocked(value)
-        case b"mis":
-            field = Missing(value)
-        case b"rev":
-            field = ReverseOrder(value)
-        # b"crt" => ???
-        # b"hrt" => ???
-        # b"iro" => ???
-        # b"itu" => ???
-        # b"krk" => ???
-        # b"ovc" => ???
-        # b"ply" => ???
-        # b"uns" => ???
-        # b"wlb" => ???
-        # b"wll" => ???
-        case _:
-            field = UnknownBooleanField(name, value)
-    return field
+    cls = BOOL_FIELDS.get(name)
+    return UnknownBooleanField(name, value) if cls is None else cls(value)
 
 def parse_field_u32(name: bytes, value) -> CEntry:
-    match name:
-        case b"add":
-            field = DateAdded(value)
-        case b"tme":
-            field = FileTime(value)
-        # b"lbl" => ???
-        # b"fsb" => ???
-        # b"tkn" => ???
-        # b"dsc" => ???
-        case _:
-            field = UnknownU32Field(name, value)
-    return field
+    cls = U32_FIELDS.get(name)
+    return UnknownU32Field(name, value) if cls is None else cls(value)
 
 def parse_field_path(name: bytes, path: Path) -> CEntry:
-    match name:
-        case b"fil":
-            field = FilePath(path)
-        case  b"trk":
-            field = TrackPath(path)
-        case _:
-            field = UnknownPathField(name, path)
-    return field
+    cls = PATH_FIELDS.get(name)
+    return UnknownPathField(name, path) if cls is None else cls(path)
 
 def parse_field_text(name: bytes, text: str) -> CEntry:
-    match name:
-        case b"add":
-            field = DateAddedStr(text)
-        case b"alb":
-            field = Album(text)
-        case b"art":
-            field = Artist(text)
-        case b"bit":
-            field = Bitrate(text)
-        case b"bpm":
-            field = BPM(text)
-        case b"cmp":
-            field = Composer(text)
-        case b"com":
-            field = Comment(text)
-        case b"gen":
-            field = Genre(text)
-        case b"grp":
-            field = Grouping(text)
-        case b"key":
-            field = Key(text)
-        case b"lbl":
-            field = Label(text)
-        case b"len":
-            field = Length(text)
-        case b"siz":
-            field = FileSize(text)
-        case b"smp":
-            field = SampleRate(text)
-        case b"sng":
-            field = SongTitle(text)
-        case b"typ":
-            field = FileType(text)
-        case b"tyr":
-            field = Year(text)
-        case b"vcn":
-            field = ColumnName(text)
-        case b"vcw":
-            field = ColumnWidth(text)
-        case b"vrsn":
-            field = Version(text)
-        case _:
-            field = UnknownTextField(name, text)
-    return field
+    cls = TEXT_FIELDS.get(name)
+    return UnknownTextField(name, text) if cls is None else cls(text)
 
 def parse_field_container(name: bytes, fields) -> CEntry:
-    match name:
-        case b"srt":
-            field = Sorting(*fields)
-        case b"trk":
-            field =  Track(*fields)
-        case b"vct":
-            field =  ColumnTitle(*fields)
-        case _:
-            field = UnknownContainerField(name, fields)
-    return field
+    cls = CONTAINER_FIELDS.get(name)
+    return UnknownContainerField(name, fields) if cls is None else cls(*fields)
+
+def take_u16_text(buf: Buffer, start: int, end: int) -> str:
+    return bytes(buf[start:end]).decode('utf-16be', errors='replace')
+
+def take_scalar(st: struct.Struct, buf: Buffer, start: int, end: int):
+    # As reading from a stream: a short content is an error.
+    value, = st.unpack(buf[start:min(end, start + st.size)])
+    return value
+
+# Field parsers by kind: (name, buffer, content start, content end) -> CEntry
+FIELD_PARSERS: dict[bytes, Callable[[bytes, Buffer, int, int], CEntry]] = {
+    CrateFieldKind.FIELD_BOOL.value:
+    lambda name, buf, s, e: parse_field_bool(name, take_scalar(BOOL_STRUCT, buf, s, e)),
+    # b"bav": ???
+    CrateFieldKind.FIELD_U16.value:
+    lambda name, buf, s, e: UnknownU16Field(name, take_scalar(U16_STRUCT, buf, s, e)),
+    CrateFieldKind.FIELD_U32.value:
+    lambda name, buf, s, e: parse_field_u32(name, take_scalar(U32_STRUCT, buf, s, e)),
+    CrateFieldKind.FIELD_PATH.value:
+    lambda name, buf, s, e: parse_field_path(name, Path(take_u16_text(buf, s, e))),
+    CrateFieldKind.FIELD_TEXT.value:
+    lambda name, buf, s, e: parse_field_text(name, take_u16_text(buf, s, e)),
+    CrateFieldKind.FIELD_CONTAINER.value:
+    lambda name, buf, s, e: parse_field_container(name, (parse_fields(buf, s, e),)),
+    CrateFieldKind.FIELD_CONTAINER_R.value:
+    lambda name, buf, s, e: UnknownContainerRField(name, parse_fields(buf, s, e)),
+}
 
-def parse_field(content: BinaryIO, name: bytes, field_type: bytes) -> CEntry:
-    match field_type:
-        case CrateFieldKind.FIELD_BOOL.value:
-            value = next(parse_bool(content))
-            field = parse_field_bool(name, value)
-            return field
-        case CrateFieldKind.FIELD_U16.value:
-            value = next(take_u16(content))
-            field = UnknownU16Field(name, value)
-            # b"bav": ???
-            return field
-        case CrateFieldKind.FIELD_U32.value:
-            value = next(take_u32(content))
-            field = parse_field_u32(name, value)
-            return field
-        case CrateFieldKind.FIELD_PATH.value:
-            path = next(take_u16_text(content))
-            path = Path(path)
-            field = parse_field_path(name, path)
-            return field
-        case CrateFieldKind.FIELD_TEXT.value:
-            text = next(take_u16_text(content))
-            field = parse_field_text(name, text)
-            return field
-        case CrateFieldKind.FIELD_CONTAINER.value:
-            fields = take_fields(content)
-            field = parse_field_container(name, (fields,))
-            return field
-        case CrateFieldKind.FIELD_CONTAINER_R.value:
-            fields = take_fields(content)
-            field = UnknownContainerRField(name, fields)
-            return field
-        case _:
-            return Unknown(field_type, name, content)
-
-
-def parse_field_desc(desc: bytes, content: BinaryIO) -> CEntry:
-    match desc:
-        # Special case: `vrsn` is a text field but begins with `v`
-        case b"vrsn":
-            return parse_field(content, desc, CrateFieldKind.FIELD_TEXT.value)
-        case _:
-            typ = take_field_type(desc)
-            name = take_field_name(desc)
-            return parse_field(content, name, typ)
+def parse_field(buf: Buffer, start: int, end: int, name: bytes, field_type: bytes) -> CEntry:
+    parser = FIELD_PARSERS.get(field_type)
+    if parser is None:
+        return Unknown(field_type, name, buf[start:end])
+    else:
+        return parser(name, buf, start, end)
+
+
+def parse_field_desc(desc: bytes, buf: Buffer, start: int, end: int) -> CEntry:
+    # Special case: `vrsn` is a text field but begins with `v`
+    if desc == b"vrsn":
+        return parse_field(buf, start, end, desc, CrateFieldKind.FIELD_TEXT.value)
+    else:
+        return parse_field(buf, start, end, take_field_name(desc), take_field_type(desc))
+
+
+def parse_fields(buf: Buffer, start: int = 0, end: int | None = None) -> list[CEntry]:
+    """Parse the fields of a crate buffer between 'start' and 'end'.
+    """
+    return [parse_field_desc(desc, buf, s, e) for desc, s, e in iter_fields(buf, start, end)]
 
 
 def take_field(fp: BinaryIO) -> CEntry | None:
-    desc = next(take_field_desc(fp))
+    desc = fp.read(4)
     if len(desc) < 4:
         field = None
     else:
-        content = next(take_field_content(fp))
-        fp_content = BytesIO(content)
-        field = parse_field_desc(desc, fp_content)
+        length, = U32_STRUCT.unpack(fp.read(4))
+        content = fp.read(length)
+        field = parse_field_desc(desc, content, 0, len(content))
     return field
 
 def take_fields(fp: BinaryIO) -> list[CEntry]:
-    parsed_fields = []
-    while field := take_field(fp):
-        if field == None:
-            break
-        else:
-            parsed_fields.append(field)
-    return parsed_fields
+    return parse_fields(fp.read())
 
 #################################################################
 
 def get_track_paths(fields: list[CEntry]) -> list[Path]:
-    def get_pp(acc, trk):
+    def get_pp(trk) -> Path | None:
         match trk:
             case Track(value=[v]) if isinstance(v, TrackPath):
-                return acc + [v.value]
+                return v.value
             case _:
-                return acc
-
-    return reduce(get_pp, fields, [])
+                return None
+
+    return [p for p in map(get_pp, fields) if p is not None]
+
+
+def iter_track_paths(buf: Buffer) -> Iterator[Path]:
+    """Lazily extract the track paths of a crate buffer.
+
+    Same as 'get_track_paths(parse_fields(buf))', but only the 'otrk'
+    containers are visited and no other field is decoded.
+    """
+    for desc, start, end in iter_fields(buf):
+        if desc == b"otrk":
+            fields = iter_fields(buf, start, end)
+            first = next(fields, None)
+            # a track with a single path field
+            if first is not None and first[0] == b"ptrk" and next(fields, None) is None:
+                _, s, e = first
+                yield Path(take_u16_text(buf, s, e))
+
+
+def crate_track_paths(crate: Path) -> Iterator[Path]:
+    """Lazily read the track paths of a crate file.
+
+    The file is memory mapped, not read into memory.
+    """
+    with open(crate, "rb") as f:
+        # empty files can't be mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from iter_track_paths(mm)
@@ -0,0 +1,137 @@
+# SPDX-FileCopyrightText: 2025 Federico Beffa <beffa@fbengineering.ch>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Read the Serato DJ Pro library database ('_Serato_/database V2').
+
+The database uses the Crate format: a 'vrsn' field followed by one
+'otrk' container per track, holding the track metadata fields
+('pfil', 'tsng', 'tart', ...). The containers are decoded by offset
+from a memory map, one at a time.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator
+import mmap
+import os
+
+from .crate.read import (
+    Buffer,
+    CEntry,
+    Album,
+    Artist,
+    BPM,
+    BeatgridLocked,
+    Bitrate,
+    Comment,
+    Composer,
+    FileSize,
+    FileType,
+    Genre,
+    Grouping,
+    Key,
+    Label,
+    Length,
+    Missing,
+    SampleRate,
+    SongTitle,
+    Year,
+    iter_fields,
+    parse_fields,
+    take_u16_text,
+)
+
+@dataclass
+class SeratoDbTrack:
+    """Track metadata stored in the Serato DJ Pro database.
+
+    The values are the strings stored by Serato, e.g. '04:17.45'
+    (length), '9.8MB' (size), '320.0kbps' (bitrate), '44.1k' (sample
+    rate).
+    """
+    location: Path # as in crates, without the anchor
+    title: str | None = None
+    artist: str | None = None
+    album: str | None = None
+    genre: str | None = None
+    grouping: str | None = None
+    composer: str | None = None
+    label: str | None = None
+    comments: str | None = None
+    year: str | None = None
+    tonality: str | None = None
+    bpm: str | None = None
+    length: str | None = None
+    size: str | None = None
+    bitrate: str | None = None
+    sample_rate: str | None = None
+    file_type: str | None = None
+    locked: bool | None = None
+    missing: bool | None = None
+
+
+DB_TRACK_FIELDS: dict[type[CEntry], str] = {
+    SongTitle: 'title',
+    Artist: 'artist',
+    Album: 'album',
+    Genre: 'genre',
+    Grouping: 'grouping',
+    Composer: 'composer',
+    Label: 'label',
+    Comment: 'comments',
+    Year: 'year',
+    Key: 'tonality',
+    BPM: 'bpm',
+    Length: 'length',
+    FileSize: 'size',
+    Bitrate: 'bitrate',
+    SampleRate: 'sample_rate',
+    FileType: 'file_type',
+    BeatgridLocked: 'locked',
+    Missing: 'missing',
+}
+
+
+def db_track_path(buf: Buffer, start: int, end: int) -> Path | None:
+    """The 'pfil' path of the track container between 'start' and 'end'."""
+    for desc, s, e in iter_fields(buf, start, end):
+        if desc == b"pfil":
+            return Path(take_u16_text(buf, s, e))
+    return None
+
+
+def db_track(location: Path, fields: list[CEntry]) -> SeratoDbTrack:
+    values = {DB_TRACK_FIELDS[type(f)]: f.value for f in fields # pyright: ignore
+              if type(f) in DB_TRACK_FIELDS}
+    return SeratoDbTrack(location, **values)
+
+
+def iter_database(buf: Buffer, paths: set[Path] | None = None) -> Iterator[SeratoDbTrack]:
+    """Decode the tracks of a database buffer.
+
+    Args:
+      buf: The database content.
+      paths: If given, only the tracks with these paths are decoded.
+    """
+    for desc, start, end in iter_fields(buf):
+        if desc == b"otrk":
+            location = db_track_path(buf, start, end)
+            if location is not None and (paths is None or location in paths):
+                yield db_track(location, parse_fields(buf, start, end))
+
+
+def read_serato_database(db: Path, paths: Iterable[Path] | None = None) -> dict[Path, SeratoDbTrack]:
+    """Index the Serato DJ Pro database by track path.
+
+    Args:
+      db: The 'database V2' file.
+      paths: If given, only index these tracks (paths as in crates).
+    """
+    wanted = None if paths is None else set(paths)
+    with open(db, "rb") as f:
+        # empty files can't be mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            return {}
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return {t.location: t for t in iter_database(mm, wanted)}
@@ -4,7 +4,6 @@
 # SPDX-License-Identifier: MIT
 
 from dataclasses import dataclass, fields
-import io
 import struct
 import enum
 from typing import ClassVar
@@ -14,7 +13,7 @@ from ..types import AFormat
 from ..utils import audio_file_type
 
 from .types import EntryBase, SeratoTags
-from .utils import get_serato_metadata, FMT_VERSION
+from .utils import get_serato_metadata, FMT_VERSION, UINT32_STRUCT, VERSION_STRUCT
 
 def get_serato_markers(audio: FileType) -> list[EntryBase] | None:
     match audio_file_type(audio):
@@ -46,6 +45,13 @@ class EntryType(enum.IntEnum):
     LOOP = 3
 
 
+ENTRY_TYPES = {t.value: t for t in EntryType}
+
+def entry_type(value: int) -> EntryType:
+    t = ENTRY_TYPES.get(value)
+    return EntryType(value) if t is None else t
+
+
 def serato32encode(data: bytes) -> bytes:
     """Encode 3 byte plain text into 4 byte Serato binary format."""
     a, b, c = struct.unpack('BBB', data)
@@ -65,10 +71,22 @@ def serato32decode(data: bytes) -> bytes:
     return struct.pack('BBB', a, b, c)
 
 
+def serato32decode_int(data: bytes) -> int:
+    """Decode 4 byte Serato binary format into an integer.
+
+    Same as unpacking the 3 bytes returned by 'serato32decode' as a big
+    endian unsigned integer.
+    """
+    w, x, y, z = data
+    return ((w & 0x07) << 21) | ((x & 0x7F) << 14) | ((y & 0x7F) << 7) | (z & 0x7F)
+
+
 @dataclass
 class Entry(EntryBase):
     FMT : ClassVar[str]= '>B4sB4s6s4sB?'
     FMT_M4A : ClassVar[str]= '>4s4s5s4sB?'
+    STRUCT : ClassVar[struct.Struct] = struct.Struct(FMT)
+    STRUCT_M4A : ClassVar[struct.Struct] = struct.Struct(FMT_M4A)
     start_position_set : int
     start_position : int | None
     end_position_set : int
@@ -80,80 +98,35 @@ class Entry(EntryBase):
 
     @classmethod
     def load(cls, data):
-        info_size = struct.calcsize(cls.FMT)
-        info = struct.unpack(cls.FMT, data[:info_size])
-        entry_data = []
+        return cls.from_info(cls.STRUCT.unpack_from(data))
 
-        start_position_set = None
-        end_position_set = None
-        for field, value in zip(fields(cls), info):
-            if field.name == 'start_position_set':
-                assert value in (0x00, 0x7F)
-                value = value != 0x7F
-                start_position_set = value
-            elif field.name == 'end_position_set':
-                assert value in (0x00, 0x7F)
-                value = value != 0x7F
-                end_position_set = value
-            elif field.name == 'start_position':
-                assert start_position_set is not None
-                if start_position_set:
-                    value = struct.unpack(
-                        '>I', serato32decode(value).rjust(4, b'\x00'))[0]
-                else:
-                    value = None
-            elif field.name == 'end_position':
-                assert end_position_set is not None
-                if end_position_set:
-                    value = struct.unpack(
-                        '>I', serato32decode(value).rjust(4, b'\x00'))[0]
-                else:
-                    value = None
-            elif field.name == 'type':
-                value = EntryType(value)
-            elif field.name == 'color':
-                value = serato32decode(value)
-
-            entry_data.append(value)
-
-        return cls(*entry_data)
+    @classmethod
+    def from_info(cls, info):
+        """Build an entry from the values unpacked with 'STRUCT'."""
+        start_set, start, end_set, end, field5, color, typ, is_locked = info
+        assert start_set in (0x00, 0x7F)
+        assert end_set in (0x00, 0x7F)
+        start_set = start_set != 0x7F
+        end_set = end_set != 0x7F
+        return cls(start_set, serato32decode_int(start) if start_set else None,
+                   end_set, serato32decode_int(end) if end_set else None,
+                   field5, serato32decode_int(color).to_bytes(3, 'big'),
+                   entry_type(typ), is_locked)
 
 
     @classmethod
     def load_m4a(cls, data):
-        info_size = struct.calcsize(cls.FMT_M4A)
-        info = struct.unpack(cls.FMT_M4A, data[:info_size])
-        entry_data = []
-
-        flds = list(filter(lambda f: not f.name.endswith('_set'), fields(cls)))
+        return cls.from_info_m4a(cls.STRUCT_M4A.unpack_from(data))
 
-        for field, value in zip(flds, info):
-            value_set = None
-            if field.name == 'start_position':
-                if value != b'\xff\xff\xff\xff':
-                    value_set = True
-                    value = struct.unpack('>I', value)[0]
-                else:
-                    value_set = False
-                    value = None
-            elif field.name == 'end_position':
-                if value != b'\xff\xff\xff\xff':
-                    value_set = True
-                    value = struct.unpack('>I', value)[0]
-                else:
-                    value_set = False
-                    value = None
-            elif field.name == 'type':
-                value = EntryType(value)
-            elif field.name == 'color':
-                value = value[1:]
-
-            if value_set is None:
-                entry_data.append(value)
-            else:
-                entry_data += [value_set, value]
-
-        return cls(*entry_data)
+    @classmethod
+    def from_info_m4a(cls, info):
+        """Build an entry from the values unpacked with 'STRUCT_M4A'."""
+        start, end, field5, color, typ, is_locked = info
+        start_set = start != b'\xff\xff\xff\xff'
+        end_set = end != b'\xff\xff\xff\xff'
+        return cls(start_set, int.from_bytes(start, 'big') if start_set else None,
+                   end_set, int.from_bytes(end, 'big') if end_set else None,
+                   field5, color[1:], entry_type(typ), is_locked)
 
 
     def dump(self):
@@ -219,33 +192,18 @@ class Entry(EntryBase):
 @dataclass
 class Color(EntryBase):
     FMT : ClassVar[str] = '>4s'
+    STRUCT : ClassVar[struct.Struct] = struct.Struct(FMT)
     color : bytes
 
     @classmethod
     def load(cls, data):
-        info_size = struct.calcsize(cls.FMT)
-        info = struct.unpack(cls.FMT, data[:info_size])
-        color_data = []
-
-        for field, value in zip(fields(cls), info):
-            if field.name == 'color':
-                value = serato32decode(value)
-            color_data.append(value)
-
-        return cls(*color_data)
+        color, = cls.STRUCT.unpack_from(data)
+        return cls(serato32decode(color))
 
     @classmethod
     def load_m4a(cls, data):
-        info_size = struct.calcsize(cls.FMT)
-        info = struct.unpack(cls.FMT, data[:info_size])
-        color_data = []
-
-        for field, value in zip(fields(cls), info):
-            if field.name == 'color':
-                value = value[1:]
-            color_data.append(value)
-
-        return cls(*color_data)
+        color, = cls.STRUCT.unpack_from(data)
+        return cls(color[1:])
 
     def dump(self):
         color_data = []
@@ -266,36 +224,26 @@ class Color(EntryBase):
         return struct.pack(self.FMT, *color_data)
 
 
-def parse(data: bytes) -> list[EntryBase]:
-    fp = io.BytesIO(data)
-    assert struct.unpack(FMT_VERSION, fp.read(2)) == (0x02, 0x05)
+def _parse_entries(data: bytes, st: struct.Struct, from_info) -> tuple[list[EntryBase], int]:
+    assert VERSION_STRUCT.unpack_from(data) == (0x02, 0x05)
+    num_entries = UINT32_STRUCT.unpack_from(data, VERSION_STRUCT.size)[0]
+    start = VERSION_STRUCT.size + UINT32_STRUCT.size
+    # the complete entries available, the count is checked after decoding.
+    available = min(num_entries, (len(data) - start) // st.size)
+    end = start + available * st.size
+    out = [from_info(info) for info in st.iter_unpack(memoryview(data)[start:end])]
+    assert available == num_entries
+    return out, end
 
-    num_entries = struct.unpack('>I', fp.read(4))[0]
-    out = []
-    for _ in range(num_entries):
-        entry_data = fp.read(0x16)
-        assert len(entry_data) == 0x16
 
-        entry = Entry.load(entry_data)
-        out.append(entry)
-
-    return out  + [Color.load(fp.read())]
+def parse(data: bytes) -> list[EntryBase]:
+    out, end = _parse_entries(data, Entry.STRUCT, Entry.from_info)
+    return out + [Color.load(data[end:])]
 
 
 def parse_m4a(data: bytes) -> list[EntryBase]:
-    fp = io.BytesIO(data)
-    assert struct.unpack(FMT_VERSION, fp.read(2)) == (0x02, 0x05)
-
-    num_entries = struct.unpack('>I', fp.read(4))[0]
-    out = []
-    for _ in range(num_entries):
-        entry_data = fp.read(0x13)
-        assert len(entry_data) == 0x13
-
-        entry = Entry.load_m4a(entry_data)
-        out.append(entry)
-
-    return out  + [Color.load_m4a(fp.read())]
+    out, end = _parse_entries(data, Entry.STRUCT_M4A, Entry.from_info_m4a)
+    return out + [Color.load_m4a(data[end:])]
 
 
 def dump(new_entries : list[Entry | Color]) -> bytes:
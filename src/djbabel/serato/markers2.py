@@ -4,19 +4,34 @@
 # SPDX-License-Identifier: MIT
 
 import struct
-import base64
 from dataclasses import dataclass, fields
-import io
+import functools
 from mutagen._file import FileType # pyright: ignore
-from typing import ClassVar
+from typing import Callable, ClassVar
 
 from .types import SeratoTags, EntryBase
-from .utils import get_serato_metadata, FMT_VERSION, readbytes
+from .utils import b64decode_lines, get_serato_metadata, SeratoAudio, UINT32_STRUCT, VERSION_STRUCT
 
-def get_serato_markers_v2(audio: FileType) -> list[EntryBase]:
-    m = get_serato_metadata(SeratoTags.MARKERS2, parse)(audio)
+# Entries used to build an ATrack. FLIP entries are Serato specific.
+ATRACK_ENTRIES = frozenset(['BPMLOCK', 'COLOR', 'CUE', 'LOOP'])
+
+def get_serato_markers_v2(audio: FileType | SeratoAudio, names: frozenset[str] | None = None) -> list[EntryBase]:
+    """Serato Markers2 entries of an audio file.
+
+    Args:
+      audio: The audio file.
+      names: If given, only decode the entries with these names
+        (e.g. ATRACK_ENTRIES).
+    """
+    m = get_serato_metadata(SeratoTags.MARKERS2, entries_parser(names))(audio)
     return m if isinstance(m, list) else []
 
+
+@functools.cache
+def entries_parser(names: frozenset[str] | None) -> Callable[[bytes], list[EntryBase]]:
+    # The same function for the same 'names', as it's used as cache key.
+    return functools.partial(parse, names=names)
+
 ###############################################################################
 # Code below this line adapted from https://github.com/Holzhaus/serato-tags
 #
@@ -40,11 +55,12 @@ class UnknownEntry(EntryBase):
 class BpmLockEntry(EntryBase):
     NAME : ClassVar[str] = 'BPMLOCK'
     FMT : ClassVar[str] = '?'
+    STRUCT : ClassVar[struct.Struct] = struct.Struct(FMT)
     enabled : bool
 
     @classmethod
     def load(cls, data):
-        return cls(*struct.unpack(cls.FMT, data))
+        return cls(*cls.STRUCT.unpack(data))
 
     def dump(self):
         return struct.pack(self.FMT, *(getattr(self, f.name) for f in fields(self)))
@@ -54,12 +70,13 @@ class BpmLockEntry(EntryBase):
 class ColorEntry(EntryBase):
     NAME : ClassVar[str] = 'COLOR'
     FMT : ClassVar[str] = 'c3s'
+    STRUCT : ClassVar[struct.Struct] = struct.Struct(FMT)
     field1 : bytes
     color : bytes
 
     @classmethod
     def load(cls, data):
-        return cls(*struct.unpack(cls.FMT, data))
+        return cls(*cls.STRUCT.unpack(data))
 
     def dump(self):
         return struct.pack(self.FMT, *(getattr(self, f.name) for f in fields(self)))
@@ -69,6 +86,7 @@ class ColorEntry(EntryBase):
 class CueEntry(EntryBase):
     NAME : ClassVar[str] = 'CUE'
     FMT : ClassVar[str] = '>cBIc3s2s'
+    STRUCT : ClassVar[struct.Struct] = struct.Struct(FMT)
     field1 : bytes
     index : int
     position : int
@@ -79,13 +97,11 @@ class CueEntry(EntryBase):
 
     @classmethod
     def load(cls, data):
-        info_size = struct.calcsize(cls.FMT)
-        info = struct.unpack(cls.FMT, data[:info_size])
+        info_size = cls.STRUCT.size
+        info = cls.STRUCT.unpack_from(data)
         assert len(info) == 6
-        name, nullbyte, other = data[info_size:].partition(b'\x00')
-        assert nullbyte == b'\x00'
-        assert other == b''
-        return cls(*info, name.decode('utf-8'))
+        assert data.find(b'\x00', info_size) == len(data) - 1
+        return cls(*info, data[info_size:-1].decode('utf-8'))
 
     def dump(self):
         struct_fields = fields(self)[:-1]
@@ -100,6 +116,7 @@ class CueEntry(EntryBase):
 class LoopEntry(EntryBase):
     NAME : ClassVar[str] = 'LOOP'
     FMT : ClassVar[str] = '>cBII4sc3sc?'
+    STRUCT : ClassVar[struct.Struct] = struct.Struct(FMT)
     field1 : bytes
     index : int
     startposition : int
@@ -114,13 +131,11 @@ class LoopEntry(EntryBase):
 
     @classmethod
     def load(cls, data):
-        info_size = struct.calcsize(cls.FMT)
-        info = struct.unpack(cls.FMT, data[:info_size])
+        info_size = cls.STRUCT.size
+        info = cls.STRUCT.unpack_from(data)
         assert len(info) == 9
-        name, nullbyte, other = data[info_size:].partition(b'\x00')
-        assert nullbyte == b'\x00'
-        assert other == b''
-        return cls(*info, name.decode('utf-8'))
+        assert data.find(b'\x00', info_size) == len(data) - 1
+        return cls(*info, data[info_size:-1].decode('utf-8'))
 
     def dump(self):
         struct_fields = fields(self)[:-1]
@@ -176,32 +191,47 @@ class FlipEntry(EntryBase):
         raise NotImplementedError('FLIP entry dumps are not implemented!')
 
 
+ENTRY_TYPES = {cls.NAME: cls for cls in (BpmLockEntry, ColorEntry, CueEntry, LoopEntry, FlipEntry)}
+# Known entries by encoded name, to dispatch without decoding it.
+ENTRY_TYPES_RAW = {name.encode('utf-8'): cls for name, cls in ENTRY_TYPES.items()}
+
 def get_entry_type(entry_name):
-    entry_type = UnknownEntry
-    for entry_cls in (BpmLockEntry, ColorEntry, CueEntry, LoopEntry, FlipEntry):
-        if entry_cls.NAME == entry_name:
-            entry_type = entry_cls
-            break
-    return entry_type
-
-def parse(data: bytes) -> list[EntryBase]:
-    versionlen = struct.calcsize(FMT_VERSION)
-    version = struct.unpack(FMT_VERSION, data[:versionlen])
+    return ENTRY_TYPES.get(entry_name, UnknownEntry)
+
+def parse(data: bytes, names: frozenset[str] | None = None) -> list[EntryBase]:
+    """Parse the Serato Markers2 tag.
+
+    Args:
+      data: The tag content.
+      names: If given, the entries with other names are skipped
+        without decoding them.
+    """
+    versionlen = VERSION_STRUCT.size
+    version = VERSION_STRUCT.unpack_from(data)
     assert version == (0x01, 0x01)
 
-    b64data = data[versionlen:data.index(b'\x00', versionlen)].replace(b'\n', b'')
-    padding = b'A==' if len(b64data) % 4 == 1 else (b'=' * (-len(b64data) % 4))
-    payload = base64.b64decode(b64data + padding)
-    fp = io.BytesIO(payload)
-    assert struct.unpack(FMT_VERSION, fp.read(2)) == (0x01, 0x01)
+    payload = b64decode_lines(data[versionlen:data.index(b'\x00', versionlen)])
+    assert VERSION_STRUCT.unpack_from(payload) == (0x01, 0x01)
+    # walk the entries by offset: no intermediate stream and copies.
+    pos = versionlen
     out = []
     while True:
-        entry_name = b''.join(readbytes(fp)).decode('utf-8')
-        if not entry_name:
-            break
-        entry_len = struct.unpack('>I', fp.read(4))[0]
+        end = payload.find(b'\x00', pos)
+        if end < 0:
+            end = len(payload)
+        raw_name = payload[pos:end]
+        entry_type = ENTRY_TYPES_RAW.get(raw_name)
+        if entry_type is None:
+            entry_name = raw_name.decode('utf-8')
+            if not entry_name:
+                break
+            entry_type = UnknownEntry
+        else:
+            entry_name = entry_type.NAME
+        entry_len = UINT32_STRUCT.unpack_from(payload, end + 1)[0]
         assert entry_len > 0
-
-        entry_type = get_entry_type(entry_name)
-        out += [entry_type.load(fp.read(entry_len))]
+        pos = end + 1 + UINT32_STRUCT.size
+        if names is None or entry_name in names:
+            out.append(entry_type.load(payload[pos:pos + entry_len]))
+        pos += entry_len
     return out
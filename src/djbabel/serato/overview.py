@@ -4,25 +4,42 @@
 # SPDX-License-Identifier: MIT
 
 from dataclasses import dataclass
-import struct
-import io
+import functools
 from PIL import Image
 from PIL import ImageColor
-from typing import Iterator
 from mutagen._file import FileType # pyright: ignore
 
 from .types import EntryBase, SeratoTags
-from .utils import get_serato_metadata, FMT_VERSION
+from .utils import get_serato_metadata, VERSION_STRUCT
 
 ###############################################################################
 
+# Overview size: 240 columns of 16 values.
+OVERVIEW_WIDTH = 240
+OVERVIEW_HEIGHT = 16
+
 @dataclass
 class Overview(EntryBase):
-    img : Image.Image
+    data : bytes # the column values, without the version header
+
+    @functools.cached_property
+    def img(self) -> Image.Image:
+        """The waveform image, rendered when first accessed."""
+        return render_waveform(self.data)
+
+
+def parse_overview(data: bytes) -> list[EntryBase]:
+    version = VERSION_STRUCT.unpack_from(data)
+    assert version == (0x01, 0x05)
+    start = VERSION_STRUCT.size
+    end = start + OVERVIEW_WIDTH * OVERVIEW_HEIGHT
+    # trailing bytes are ignored
+    assert len(data) >= end, "Short overview data"
+    return [Overview(data[start:end])]
 
 
 def get_serato_overview(audio: FileType) -> Overview | None:
-    ov = get_serato_metadata(SeratoTags.OVERVIEW, lambda x: draw_waveform(parse(x)))(audio)
+    ov = get_serato_metadata(SeratoTags.OVERVIEW, parse_overview)(audio)
     if ov is None:
         return None
     else:
@@ -30,6 +47,39 @@ def get_serato_overview(audio: FileType) -> Overview | None:
         assert isinstance(ov[0], Overview)
         return ov[0]
 
+# The color of a value depends on the value and on the number of low
+# values (< 0x80) in its column. Instead of formatting and parsing a
+# color per pixel, the colors of the 17 x 256 combinations are
+# computed once, as one translation table per channel and count.
+
+LOW_VALUES = bytes(1 if v < 0x80 else 0 for v in range(256))
+
+@functools.cache
+def waveform_palette() -> list[tuple[bytes, bytes, bytes]]:
+    """(R, G, B) translation tables by number of low values in a column."""
+    palette = []
+    for count in range(OVERVIEW_HEIGHT + 1):
+        rgbs = [waveform_color(count / OVERVIEW_HEIGHT, v) for v in range(256)]
+        palette.append(tuple(bytes(c[ch] for c in rgbs) for ch in range(3)))
+    return palette
+
+
+def render_waveform(data: bytes) -> Image.Image:
+    """Render the overview column values as a 240x16 RGB image.
+    """
+    palette = waveform_palette()
+    low = data.translate(LOW_VALUES)
+    channels = [bytearray(len(data)) for _ in range(3)]
+    for start in range(0, len(data), OVERVIEW_HEIGHT):
+        end = start + OVERVIEW_HEIGHT
+        column = data[start:end]
+        for channel, table in zip(channels, palette[low.count(1, start, end)]):
+            channel[start:end] = column.translate(table)
+    # The data is column major: build the transposed image, then flip it.
+    size = (OVERVIEW_HEIGHT, len(data) // OVERVIEW_HEIGHT)
+    bands = [Image.frombytes('L', size, bytes(ch)) for ch in channels]
+    return Image.merge('RGB', bands).transpose(Image.Transpose.TRANSPOSE)
+
 ###############################################################################
 # Code below this line adapted from https://github.com/Holzhaus/serato-tags
 #
@@ -37,34 +87,16 @@ def get_serato_overview(audio: FileType) -> Overview | None:
 #
 # Original code licensed under the MIT License. See LICENSE/MIT.txt
 
-def parse(data: bytes) -> Iterator[bytearray]:
-    fp = io.BytesIO(data)
-    version = struct.unpack(FMT_VERSION, fp.read(2))
-    assert version == (0x01, 0x05)
-
-    for x in iter(lambda: fp.read(16), b''):
-        assert len(x) == 16
-        yield bytearray(x)
-
-
-def draw_waveform(data) -> list[EntryBase]:
-    img = Image.new('RGB', (240, 16), "black")
-    pixels = img.load()
-
-    for i in range(img.size[0]):
-        rowdata = next(data)
-        factor = (len([x for x in rowdata if x < 0x80]) / len(rowdata))
-
-        for j, value in enumerate(rowdata):
-            # The algorithm to derive the colors from the data has no real
-            # mathematical background and was found by experimenting with
-            # different values.
-            color = 'hsl({hue:.2f}, {saturation:d}%, {luminance:.2f}%)'.format(
-                hue=(factor * 1.5 * 360) % 360,
-                saturation=40,
-                luminance=(value / 0xFF) * 100,
-            )
-            assert pixels is not None, "Enpty image"
-            pixels[i, j] = ImageColor.getrgb(color)
+def waveform_color(factor: float, value: int) -> tuple[int, int, int]:
+    # The algorithm to derive the colors from the data has no real
+    # mathematical background and was found by experimenting with
+    # different values.
+    color = 'hsl({hue:.2f}, {saturation:d}%, {luminance:.2f}%)'.format(
+        hue=(factor * 1.5 * 360) % 360,
+        saturation=40,
+        luminance=(value / 0xFF) * 100,
+    )
+    rgb = ImageColor.getrgb(color)
+    assert len(rgb) == 3
+    return rgb
 
-    return [Overview(img)]
@@ -0,0 +1,304 @@
+# SPDX-FileCopyrightText: 2025 Federico Beffa <beffa@fbengineering.ch>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Patch the Serato tags of audio files in place.
+
+When a new Serato tag payload has the same size as the one in the file
+(Markers2 payloads are padded to a minimum size, BeatGrid and Autotags
+often keep their size), the bytes of the payload are overwritten with a
+positioned write. The file is not parsed and saved by mutagen.
+
+The payloads are located by offset: the object data of the 'GEOB'
+frames (MP3), the value of the Vorbis comments (FLAC) and the 'data'
+atom of the '----' freeform atoms (M4A).
+"""
+
+from mutagen.flac import VCFLACDict
+from mutagen.id3 import Frames
+from mutagen.mp4 import AtomDataType
+import os
+from pathlib import Path
+import struct
+from typing import BinaryIO, Callable
+
+from ..types import AFormat
+from .audio import (
+    FLAC_BLOCK_HEADER,
+    ID3_FRAME_HEADER,
+    ID3_HEADER,
+    ID3_UNSUPPORTED_FLAGS,
+    MP4_ATOM_HEADER,
+    atom_headers,
+    find_atom,
+    freeform_key,
+    read_atom,
+    synchsafe,
+)
+from .types import SeratoTags
+
+# Payload location in the file: (offset, length).
+Location = tuple[int, int]
+
+UINT32_LE = struct.Struct('<I')
+# 'data' atom header: size, name, version and type, locale
+MP4_DATA_HEADER = struct.Struct('>I4sII')
+# Data types of the Serato freeform atoms (version 0).
+MP4_SERATO_DATA_TYPES = (AtomDataType.IMPLICIT, AtomDataType.UTF8)
+
+
+def add_location(found: dict[str, Location | None], name: str, loc: Location) -> None:
+    # a duplicated tag is ambiguous: it can't be patched
+    found[name] = None if name in found else loc
+
+
+###########################################################################
+# MP3
+
+ID3_EMPTY_FRAME = b'\x00' * ID3_FRAME_HEADER.size
+
+
+def count_id3_frames(data: bytes, size: Callable[[int], int]) -> tuple[int, int]:
+    """Number of known frames found reading the frame sizes with 'size',
+    and how far past the end of 'data' the last frame ends.
+    """
+    pos = 0
+    count = 0
+    while pos < len(data) - ID3_FRAME_HEADER.size:
+        if data[pos:pos + ID3_FRAME_HEADER.size] == ID3_EMPTY_FRAME:
+            return count, -((len(data) - pos) % ID3_FRAME_HEADER.size)
+        fid, raw_size, _ = ID3_FRAME_HEADER.unpack_from(data, pos)
+        pos += ID3_FRAME_HEADER.size + size(raw_size)
+        if fid.decode('latin-1') in Frames:
+            count += 1
+    return count, pos - len(data)
+
+
+def id3_frame_size(data: bytes, major: int) -> Callable[[int], int]:
+    """How the frame sizes of an ID3 tag are encoded.
+
+    Some taggers write plain integers in ID3v2.4. As mutagen, the
+    encoding is decided once for the whole tag, by the one that finds
+    more known frames.
+
+    Args:
+      data: The frames of the tag (after the header).
+      major: The ID3v2 major version.
+    """
+    if major < 4:
+        return int
+    asbpi, bpioff = count_id3_frames(data, synchsafe)
+    asint, intoff = count_id3_frames(data, int)
+    if asint > asbpi or (asint == asbpi and bpioff >= 1 and intoff <= 1):
+        return int
+    return synchsafe
+
+
+def find_terminator(data: bytes, start: int, wide: bool) -> int:
+    """Index of the string terminator in 'data' from 'start' or -1.
+    """
+    if not wide:
+        return data.find(b'\x00', start)
+    i = data.find(b'\x00\x00', start)
+    while i >= 0 and (i - start) % 2 != 0:
+        i = data.find(b'\x00\x00', i + 1)
+    return i
+
+
+def geob_fields(body: bytes) -> tuple[str, int] | None:
+    """Description and offset of the object data of a GEOB frame.
+
+    Returns None if the frame is malformed.
+    """
+    if len(body) < 1:
+        return None
+    enc = body[0]
+    wide = enc in (1, 2)
+    codec = ['latin-1', 'utf-16', 'utf-16-be', 'utf-8'][enc] if enc < 4 else 'latin-1'
+    tlen = 2 if wide else 1
+    # the MIME type is always latin-1
+    i = body.find(b'\x00', 1)
+    if i < 0:
+        return None
+    # file name
+    j = find_terminator(body, i + 1, wide)
+    if j < 0:
+        return None
+    # description
+    k = find_terminator(body, j + tlen, wide)
+    if k < 0:
+        return None
+    return body[j + tlen:k].decode(codec, errors='replace'), k + tlen
+
+
+def locate_mp3_payloads(f: BinaryIO, names: set[str]) -> dict[str, Location | None]:
+    """Locate the object data of the GEOB frames with description in
+    'names' (e.g. 'Serato Markers2').
+
+    Frames with format flags (compression, ...) are not located.
+    """
+    found: dict[str, Location | None] = {}
+    f.seek(0)
+    header = f.read(ID3_HEADER.size)
+    if len(header) < ID3_HEADER.size:
+        return found
+    magic, major, _, flags, raw_size = ID3_HEADER.unpack(header)
+    if magic != b'ID3' or major not in (3, 4) or flags & ID3_UNSUPPORTED_FLAGS:
+        return found
+    data = f.read(synchsafe(raw_size))
+    size_of = id3_frame_size(data, major)
+    pos = 0
+    while pos + ID3_FRAME_HEADER.size <= len(data):
+        fid, raw_size, frame_flags = ID3_FRAME_HEADER.unpack_from(data, pos)
+        if fid.strip(b'\x00') == b'':
+            # padding
+            break
+        start = pos + ID3_FRAME_HEADER.size
+        pos = start + size_of(raw_size)
+        if fid == b'GEOB' and frame_flags & 0xFF == 0 and pos <= len(data):
+            fields = geob_fields(data[start:pos])
+            if fields is not None and fields[0] in names:
+                desc, data_offset = fields
+                offset = ID3_HEADER.size + start + data_offset
+                add_location(found, desc, (offset, pos - start - data_offset))
+    return found
+
+###########################################################################
+# FLAC
+
+def locate_flac_payloads(f: BinaryIO, names: set[str]) -> dict[str, Location | None]:
+    """Locate the values of the Vorbis comments with key in 'names'
+    (lower case, e.g. 'serato_markers_v2').
+    """
+    found: dict[str, Location | None] = {}
+    f.seek(4)
+    last = False
+    while not last:
+        header = f.read(FLAC_BLOCK_HEADER.size)
+        if len(header) < FLAC_BLOCK_HEADER.size:
+            break
+        byte, raw_size = FLAC_BLOCK_HEADER.unpack(header)
+        last = bool(byte & 0x80)
+        size = int.from_bytes(raw_size, 'big')
+        start = f.tell()
+        if byte & 0x7F == VCFLACDict.code:
+            data = f.read(size)
+            pos = UINT32_LE.size + UINT32_LE.unpack_from(data, 0)[0]
+            count, = UINT32_LE.unpack_from(data, pos)
+            pos += UINT32_LE.size
+            for _ in range(count):
+                length, = UINT32_LE.unpack_from(data, pos)
+                pos += UINT32_LE.size
+                eq = data.find(b'=', pos, pos + length)
+                if eq >= 0:
+                    key = data[pos:eq].decode('ascii', errors='replace').lower()
+                    if key in names:
+                        add_location(found, key, (start + eq + 1, pos + length - eq - 1))
+                pos += length
+        f.seek(start + size)
+    return found
+
+###########################################################################
+# M4A
+
+def locate_m4a_payloads(f: BinaryIO, names: set[str]) -> dict[str, Location | None]:
+    """Locate the payload of the freeform atoms with key in 'names'
+    (e.g. '----:com.serato.dj:markersv2').
+
+    Atoms with several values, or with a value not of the data type
+    written by Serato, are not located.
+    """
+    found: dict[str, Location | None] = {}
+    f.seek(0, os.SEEK_END)
+    ilst = find_atom(f, [b'moov', b'udta', b'meta', b'ilst'], 0, f.tell())
+    if ilst is None:
+        return found
+    for atom in atom_headers(f, ilst.start, ilst.end):
+        if atom.name != b'----':
+            continue
+        data = read_atom(f, atom)
+        key = freeform_key(data)
+        if key not in names:
+            continue
+        values = []
+        pos = 0
+        while pos + MP4_ATOM_HEADER.size <= len(data):
+            size, kind = MP4_ATOM_HEADER.unpack_from(data, pos)
+            if size < MP4_ATOM_HEADER.size:
+                break
+            if kind == b'data' and size >= MP4_DATA_HEADER.size:
+                _, _, dtype, locale = MP4_DATA_HEADER.unpack_from(data, pos)
+                ok = dtype in MP4_SERATO_DATA_TYPES and locale == 0
+                values.append((atom.start + pos + MP4_DATA_HEADER.size, size - MP4_DATA_HEADER.size) if ok else None)
+            pos += size
+        if len(values) == 1 and values[0] is not None:
+            add_location(found, key, values[0])
+        else:
+            found[key] = None
+    return found
+
+###########################################################################
+
+def payload_key(stag: SeratoTags, aformat: AFormat) -> str:
+    """Key of the Serato tag as located by 'locate_payloads'."""
+    tag = stag.value.names[aformat]
+    match aformat:
+        case AFormat.MP3:
+            return tag.split(':')[1]
+        case AFormat.FLAC:
+            return tag.lower()
+        case _:
+            return tag
+
+
+def locate_payloads(f: BinaryIO, aformat: AFormat, names: set[str]) -> dict[str, Location | None]:
+    match aformat:
+        case AFormat.MP3:
+            return locate_mp3_payloads(f, names)
+        case AFormat.FLAC:
+            return locate_flac_payloads(f, names)
+        case AFormat.M4A:
+            return locate_m4a_payloads(f, names)
+        case _:
+            return {}
+
+
+def patch_serato_payloads(path: Path, aformat: AFormat, payloads: dict[SeratoTags, bytes]) -> bool | None:
+    """Overwrite the Serato tag payloads of an audio file in place.
+
+    Args:
+      path: The audio file.
+      aformat: The audio file format.
+      payloads: The new payload of the Serato tags, as stored in the
+        file: the GEOB object data (MP3), the envelope (FLAC, M4A).
+
+    Returns:
+      Whether the file was modified, or None if it can't be patched: it
+      can't be opened for writing, or a tag is missing, duplicated, or
+      its size differs. The file is then left untouched.
+    """
+    keys = {stag: payload_key(stag, aformat) for stag in payloads}
+    try:
+        f = open(path, 'r+b')
+    except OSError:
+        # missing or read-only: reported by the normal write path
+        return None
+    with f:
+        try:
+            found = locate_payloads(f, aformat, set(keys.values()))
+        except Exception:
+            # malformed tags: left to mutagen
+            return None
+        writes = []
+        for stag, data in payloads.items():
+            loc = found.get(keys[stag])
+            if loc is None or loc[1] != len(data):
+                return None
+            offset, length = loc
+            f.seek(offset)
+            if f.read(length) != data:
+                writes.append((offset, data))
+        for offset, data in writes:
+            f.seek(offset)
+            f.write(data)
+    return len(writes) > 0
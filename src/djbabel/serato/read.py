@@ -3,11 +3,13 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 from .analysis import get_serato_analysis
+from .audio import load_audio_tags
 from .autotags import get_serato_autotags
 from .beatgrid import get_serato_beatgrid
 # from djbabel.serato.markers import get_serato_markers
 from .markers2 import (
     get_serato_markers_v2,
+    ATRACK_ENTRIES,
     CueEntry,
     BpmLockEntry,
     LoopEntry,
@@ -30,14 +32,14 @@ from ..types import (
 )
 
 from .utils import (
-    audio_file_type,
+    SeratoAudio,
+    as_serato_audio,
     parse_color,
-    map_to_aformat,
     map_to_mp4_tag,
-    get_tags
 )
 
 from ..utils import (
+    aformat_from_path,
     audio_length,
     path_anchor,
     get_leading_base64_part,
@@ -45,19 +47,22 @@ from ..utils import (
     file_size,
     ms_to_s,
     audio_endocer,
-    to_int
+    thread_map,
+    to_int,
+    warn_audio_inaccessible
 )
 
-from .crate.read import take_fields, get_track_paths
+from .crate.read import crate_track_paths
+from .database import SeratoDbTrack, read_serato_database
 
 import base64
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
 from datetime import date
-import io
-import mutagen
 from mutagen.mp4 import MP4FreeForm, AtomDataType
 from mutagen._file import FileType # pyright: ignore
-import os
 from pathlib import Path
+import re
 from typing import TypeVar, Any
 import warnings
 
@@ -125,20 +130,22 @@ def parse_flac_m4a_tag_value(tags: dict[str, Any], tag: str) -> str | None:
 ###########################################################################
 # metadata from standard tags
 
-def std_tag_text(name: str | None, audio: FileType) -> str | None:
+def std_tag_text(name: str | None, audio: FileType | SeratoAudio) -> str | None:
     if name is None:
         return None
 
-    tags = get_tags(audio)
-    aformat = audio_file_type(audio)
-    tag_map = map_to_aformat[aformat]
+    view = as_serato_audio(audio)
+    tags = view.tags
+    tag_keys = view.tag_keys
+    aformat = view.aformat
+    tag_map = view.tag_map
 
     match aformat:
         case AFormat.MP3:
             if name in tag_map.keys():
                 tag = tag_map[name]
                 # .text field in not of type str
-                return str(head(tags[tag].text)) if tag in tags.keys() else None
+                return str(head(tags[tag].text)) if tag in tag_keys else None
             else:
                 return None
 
@@ -146,7 +153,6 @@ def std_tag_text(name: str | None, audio: FileType) -> str | None:
         case AFormat.FLAC:
             if name in tag_map.keys():
                 tag = tag_map[name]
-                tag_keys = tags.keys()
                 if tag.lower() in tag_keys:
                     v = parse_flac_m4a_tag_value(tags, tag)
                     return v if v is not None and v != '' else None
@@ -159,7 +165,6 @@ def std_tag_text(name: str | None, audio: FileType) -> str | None:
         case AFormat.M4A:
             if name in tag_map.keys():
                 tag = tag_map[name]
-                tag_keys = tags.keys()
                 if tag in tag_keys:
                     v = parse_flac_m4a_tag_value(tags, tag)
                     return v if v is not None and v != '' else None
@@ -172,22 +177,23 @@ def std_tag_text(name: str | None, audio: FileType) -> str | None:
             raise ValueError(f"std_tag_text: File type {aformat} is not supported")
 
 
-def std_comments_tag(audio: FileType) -> str | None:
-    tags = get_tags(audio)
+def std_comments_tag(audio: FileType | SeratoAudio) -> str | None:
+    view = as_serato_audio(audio)
+    tags = view.tags
 
-    match audio_file_type(audio):
+    match view.aformat:
         case AFormat.MP3:
             tag = head(list(filter(lambda s: s.startswith('COMM'), tags.keys())))
             return tags[tag].text[0] if tag is not None else None
         case AFormat.FLAC:
-            return std_tag_text('comments', audio)
+            return std_tag_text('comments', view)
         case AFormat.M4A:
-            return std_tag_text('©cmt', audio)
+            return std_tag_text('©cmt', view)
         case _:
             return None
 
 
-def release_date(audio: FileType):
+def release_date(audio: FileType | SeratoAudio):
     s = std_tag_text('release_date', audio)
     if s is None:
         # try with year
@@ -204,7 +210,7 @@ def release_date(audio: FileType):
 ###########################################################################
 # other metadata
 
-def beatgrid(audio: FileType) -> list[ABeatGridBPM]:
+def beatgrid(audio: FileType | SeratoAudio) -> list[ABeatGridBPM]:
     def from_serato(bg: list) -> list[ABeatGridBPM]:
         if len(bg) < 2:
             return []
@@ -266,33 +272,33 @@ def color(mkrs: list[EntryBase]) -> tuple[int, int, int] | None:
     color = filter(lambda e: isinstance(e, ColorEntry), mkrs)
     return head(list(map(from_serato, color)))
 
-def average_bpm(audio: FileType) -> float | None:
+def average_bpm(audio: FileType | SeratoAudio) -> float | None:
     at = get_serato_autotags(audio)
     return at.bpm if at is not None else None
 
-def loudness(audio: FileType) -> ALoudness | None:
+def loudness(audio: FileType | SeratoAudio) -> ALoudness | None:
     at = get_serato_autotags(audio)
     return ALoudness(at.autogain, at.gaindb) if at is not None else None
 
-def data_source(audio: FileType) -> ADataSource:
+def data_source(audio: FileType | SeratoAudio) -> ADataSource:
     an = get_serato_analysis(audio)
     v = an.version if an is not None else []
-    enc = audio_endocer(audio)
+    enc = audio_endocer(as_serato_audio(audio).audio)
     return ADataSource(ASoftware.SERATO_DJ_PRO, v, enc)
 
-def location(audio: FileType) -> Path:
+def location(audio: FileType | SeratoAudio) -> Path:
     if audio.filename is not None:
         return Path(audio.filename)
     else:
         raise ValueError("Required file path is missing")
 
-def bitrate(audio: FileType) -> int:
+def bitrate(audio: FileType | SeratoAudio) -> int:
     if audio.info is not None and audio.info.bitrate is not None:
         return audio.info.bitrate
     else:
         raise ValueError(f"No bitrate info for file {audio.filename}.")
 
-def samplerate(audio: FileType) -> int:
+def samplerate(audio: FileType | SeratoAudio) -> int:
     if audio.info is not None and audio.info.sample_rate is not None:
         return audio.info.sample_rate
     else:
@@ -300,9 +306,11 @@ def samplerate(audio: FileType) -> int:
 
 ###########################################################################
 
-def from_serato(audio: FileType) -> ATrack:
+def from_serato(audio: FileType | SeratoAudio) -> ATrack:
 
-    mkrs: list[EntryBase] = get_serato_markers_v2(audio)
+    # resolve the format and tags, and decode each Serato tag, once.
+    audio = as_serato_audio(audio)
+    mkrs: list[EntryBase] = get_serato_markers_v2(audio, ATRACK_ENTRIES)
 
     return ATrack(
         title = std_tag_text('title', audio),
@@ -320,12 +328,12 @@ def from_serato(audio: FileType) -> ATrack:
         label = std_tag_text('label', audio),
         comments = std_comments_tag(audio),
         rating = None, # Serato doens't have a rating or star feature.
-        size = file_size(audio),
-        total_time = audio_length(audio),
+        size = file_size(audio.audio),
+        total_time = audio_length(audio.audio),
         bit_rate = bitrate(audio),
         sample_rate = samplerate(audio),
         location = location(audio),
-        aformat = audio_file_type(audio),
+        aformat = audio.aformat,
         beatgrid = beatgrid(audio),
         markers = get_markers(mkrs),
         locked = locked(mkrs),
@@ -338,27 +346,271 @@ def from_serato(audio: FileType) -> ATrack:
         date_added = None
     )
 
-def read_serato_playlist(crate: Path, trans: ATransformation, anchor: Path | None = None, relative: Path | None = None) -> APlaylist:
+###########################################################################
+# Serato database
+
+def db_length(s: str | None) -> float | None:
+    """Track length in seconds from a database value, e.g. '04:17.45'."""
+    if s is None:
+        return None
+    try:
+        return sum(float(x) * 60**i for i, x in enumerate(reversed(s.split(':'))))
+    except ValueError:
+        return None
+
+DB_SIZE_RE = re.compile(r'([0-9]+(?:\.[0-9]*)?)\s*([KMG]?)B', re.IGNORECASE)
+DB_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024**2, 'G': 1024**3}
+
+def db_size(s: str | None) -> int | None:
+    """File size in bytes from a database value, e.g. '9.8MB'.
+
+    The database value is rounded, hence so is the result.
+    """
+    m = DB_SIZE_RE.fullmatch(s.strip()) if s is not None else None
+    if m is None:
+        return None
+    return round(float(m.group(1)) * DB_SIZE_UNITS[m.group(2).upper()])
+
+DB_RATE_RE = re.compile(r'([0-9]+(?:\.[0-9]*)?)\s*(k?)(bps)?', re.IGNORECASE)
+
+def db_rate(s: str | None) -> float | None:
+    """Bit or sample rate from a database value, e.g. '320.0kbps', '44.1k'."""
+    m = DB_RATE_RE.fullmatch(s.strip()) if s is not None else None
+    if m is None:
+        return None
+    return float(m.group(1)) * (1000 if m.group(2) else 1)
+
+def db_float(s: str | None) -> float | None:
+    try:
+        return float(s) if s is not None else None
+    except ValueError:
+        return None
+
+def db_release_date(s: str | None) -> date | None:
+    # Serato writes year 0 for tracks without a year.
+    try:
+        return date(int(s), 1, 1) if s is not None else None
+    except ValueError:
+        return None
+
+
+def from_serato_database(rec: SeratoDbTrack, location: Path) -> ATrack:
+    """ATrack with the metadata of a database track, without its audio file.
+
+    Used when the audio file can't be opened: there are no cues and no
+    beatgrid, as they are stored in the audio file.
+    """
+    bit_rate = db_rate(rec.bitrate)
+    return ATrack(
+        title = rec.title,
+        artist = rec.artist,
+        grouping = rec.grouping,
+        remixer = None,
+        composer = rec.composer,
+        album = rec.album,
+        genre = rec.genre,
+        track_number = None,
+        disc_number = None,
+        release_date = db_release_date(rec.year),
+        play_count = None,
+        tonality = rec.tonality,
+        label = rec.label,
+        comments = rec.comments,
+        rating = None,
+        size = db_size(rec.size),
+        total_time = db_length(rec.length),
+        bit_rate = round(bit_rate) if bit_rate is not None else None,
+        sample_rate = db_rate(rec.sample_rate),
+        average_bpm = db_float(rec.bpm),
+        aformat = aformat_from_path(location),
+        location = location,
+        markers = [],
+        beatgrid = [],
+        locked = rec.locked if rec.locked is not None else False,
+        color = None,
+        loudness = None,
+        data_source = ADataSource(ASoftware.SERATO_DJ_PRO, []),
+        trackID = None,
+        mix = None,
+        date_added = None
+    )
+
+
+def from_serato_payloads(audio: FileType | SeratoAudio, rec: SeratoDbTrack) -> ATrack:
+    """ATrack with the metadata of a database track, and the Serato tags
+    of its audio file (see 'open_serato_payloads').
+
+    Cues, beatgrid, color and loudness are only stored in the audio
+    file. Size, length and rates come from the file, as the database
+    stores rounded values. The other values come from the database, or
+    from the file when the database doesn't have them.
+    """
+    audio = as_serato_audio(audio)
+    mkrs: list[EntryBase] = get_serato_markers_v2(audio, ATRACK_ENTRIES)
+    at = from_serato_database(rec, location(audio))
+    text = {name: getattr(at, name) if getattr(at, name) is not None else std_tag_text(name, audio)
+            for name in ['title', 'artist', 'grouping', 'composer', 'album', 'genre', 'tonality', 'label']}
+    return replace(
+        at,
+        **text,
+        release_date = at.release_date if at.release_date is not None else release_date(audio),
+        comments = at.comments if at.comments is not None else std_comments_tag(audio),
+        size = file_size(audio.audio),
+        total_time = audio_length(audio.audio),
+        bit_rate = bitrate(audio),
+        sample_rate = samplerate(audio),
+        average_bpm = at.average_bpm if at.average_bpm is not None else average_bpm(audio),
+        locked = rec.locked if rec.locked is not None else locked(mkrs),
+        beatgrid = beatgrid(audio),
+        markers = get_markers(mkrs),
+        color = color(mkrs),
+        loudness = loudness(audio),
+        data_source = data_source(audio)
+    )
+
+###########################################################################
+
+def open_serato_audio(path: Path) -> FileType | None:
+    return load_audio_tags(path)
+
+
+def open_serato_payloads(path: Path) -> FileType | None:
+    return load_audio_tags(path, serato_only=True)
+
+
+def open_serato_track(path: Path, rec: SeratoDbTrack | None) -> FileType | None:
+    """Open an audio file: only its Serato tags if it's in the database."""
+    return open_serato_audio(path) if rec is None else open_serato_payloads(path)
+
+
+def decode_serato_track(audio: FileType | None, rec: SeratoDbTrack | None) -> ATrack | None:
+    if audio is None:
+        return None
+    return from_serato(audio) if rec is None else from_serato_payloads(audio, rec)
+
+
+def serato_track_from_path(path: Path, rec: SeratoDbTrack | None = None) -> tuple[ATrack | None, list[tuple[Warning, type[Warning]]]]:
+    """Open and decode an audio file in a worker process.
+
+    Returns:
+      The ATrack (None if the file could not be read) and the
+      warnings raised while decoding it, to be re-emitted by the
+      parent process.
+    """
+    with warnings.catch_warnings(record=True) as ws:
+        warnings.simplefilter('always')
+        at = decode_serato_track(open_serato_track(path, rec), rec)
+    return at, [(w.message if isinstance(w.message, Warning) else w.category(w.message), w.category) for w in ws]
+
+
+def read_serato_tracks_processes(paths: list[Path], recs: list[SeratoDbTrack | None], jobs: int) -> list[ATrack | None]:
+    """Decode the tracks of a crate on a pool of 'jobs' processes.
+
+    The warnings of the workers are re-emitted in crate order.
+    """
+    chunksize = max(1, len(paths) // (4 * jobs))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(serato_track_from_path, paths, recs, chunksize=chunksize))
+    atrks = []
+    for at, ws in results:
+        for message, category in ws:
+            warnings.warn(message, category)
+        atrks.append(at)
+    return atrks
+
+
+def read_serato_tracks(paths: list[Path], anchor: Path | None, relative: Path | None, jobs: int, processes: bool, index: dict[Path, SeratoDbTrack]) -> list[ATrack | None]:
+    """Decode the tracks with the given crate paths.
+
+    Args:
+      paths: Track paths, as stored in crates.
+      index: Database tracks by path (see 'read_serato_database').
+      See 'read_serato_playlist' for the other arguments.
+
+    Returns:
+      The ATracks in the order of 'paths' (None if the file could not
+      be read).
+    """
+    prs = [p.relative_to(relative) if relative is not None else p for p in paths]
+    fullpaths = [path_anchor(anchor) / pr for pr in prs]
+    # Files of database tracks may be offline: don't try to open them.
+    offline = [p in index and not fp.is_file() for p, fp in zip(paths, fullpaths)]
+    for fp, off in zip(fullpaths, offline):
+        if off:
+            warn_audio_inaccessible(fp)
+    online = [(fp, index.get(p)) for p, fp, off in zip(paths, fullpaths, offline) if not off]
+    if processes and jobs > 1:
+        decoded = read_serato_tracks_processes([fp for fp, _ in online], [rec for _, rec in online], jobs)
+    else:
+        opened = thread_map(lambda a: open_serato_track(*a), online, jobs)
+        decoded = [decode_serato_track(a, rec) for a, (_, rec) in zip(opened, online)]
+    it = iter(decoded)
+    tracks = []
+    for p, fp, off in zip(paths, fullpaths, offline):
+        at = None if off else next(it)
+        rec = index.get(p)
+        if at is None and rec is not None:
+            try:
+                at = from_serato_database(rec, fp)
+            except ValueError: # unsupported audio format
+                at = None
+        if at is None:
+            print(f'File {p} could not be read.')
+        tracks.append(at)
+    return tracks
+
+
+def read_serato_playlist(crate: Path, trans: ATransformation, anchor: Path | None = None, relative: Path | None = None, jobs: int = 1, processes: bool = False, database: Path | None = None) -> APlaylist:
     """Read a Serato DJ Pro Crate.
 
     Args:
     -----
       crate: Crate path
       anchor: Path anchor to add to the track paths in the crate
+      jobs: Number of threads used to open the audio files
+      processes: Use a pool of 'jobs' processes to open and decode
+        the files. Decoding the Serato tags is CPU bound, hence this
+        uses all cores on large crates with files in the page cache.
+      database: Serato 'database V2' file. The metadata of its tracks
+        is taken from it, and the audio files are opened only for
+        the Serato tags (cues, beatgrid, ...). It's the only metadata
+        source for the tracks whose audio file can't be opened (e.g.,
+        offline drives).
     """
-    with open(crate, "rb") as f:
-        data = f.read()
-
-    fp = io.BytesIO(data)
-    paths = get_track_paths(take_fields(fp))
-    audios = []
-    for p in paths:
-        pr = p.relative_to(relative) if relative is not None else p
-        a = mutagen.File(path_anchor(anchor) / pr, easy=False) # pyright: ignore
-        if a is None:
-            print(f'File {p} could not be read.')
-        else:
-            audios.append(a)
+    paths = list(crate_track_paths(crate))
+    index = read_serato_database(database, paths) if database is not None else {}
+    tracks = read_serato_tracks(paths, anchor, relative, jobs, processes, index)
     name = crate.stem
-    atrks = list(map(from_serato, audios))
-    return APlaylist(name, atrks)
+    return APlaylist(name, [at for at in tracks if at is not None])
+
+
+# Separator of the parent crate names in a sub-crate file name,
+# e.g. 'Parent%%Child.crate'.
+SUBCRATE_SEP = '%%'
+
+def read_serato_library(subcrates: Path, trans: ATransformation, anchor: Path | None = None, relative: Path | None = None, jobs: int = 1, processes: bool = False, database: Path | None = None) -> list[APlaylist]:
+    """Read all Crates of a Serato DJ Pro 'Subcrates' directory.
+
+    Nested crates are stored as 'Parent%%Child.crate': the parent
+    crate names are recorded in the 'folder' attribute of the
+    playlists. Each distinct audio file is decoded once, and the
+    resulting ATrack is shared by all playlists including it.
+
+    Args:
+      subcrates: The '_Serato_/Subcrates' directory.
+      See 'read_serato_playlist' for the other arguments.
+
+    Returns:
+      The playlists, parents before their sub-crates.
+    """
+    crates = sorted(subcrates.glob('*.crate'), key=lambda c: c.stem.split(SUBCRATE_SEP))
+    crate_paths = [list(crate_track_paths(c)) for c in crates]
+    distinct = list(dict.fromkeys(p for paths in crate_paths for p in paths))
+    index = read_serato_database(database, distinct) if database is not None else {}
+    tracks = dict(zip(distinct, read_serato_tracks(distinct, anchor, relative, jobs, processes, index)))
+    apls = []
+    for crate, paths in zip(crates, crate_paths):
+        *folder, name = crate.stem.split(SUBCRATE_SEP)
+        ats = [tracks[p] for p in paths if tracks[p] is not None]
+        apls.append(APlaylist(name, ats, folder))
+    return apls
@@ -2,7 +2,7 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import base64
+import binascii
 from mutagen.mp4 import MP4FreeForm
 from mutagen._file import FileType       # pyright: ignore
 from mutagen.id3 import GEOB, TXXX, RVA2 # pyright: ignore
@@ -115,14 +115,46 @@ def get_tags(audio: FileType):
 
 ###################################################################
 
+class SeratoAudio:
+    """View on an audio file for reading its Serato DJ Pro metadata.
+
+    The audio format, the tags and the tag map are resolved once, and
+    the decoded Serato tags are memoized by 'get_serato_metadata'. It
+    exposes the 'FileType' attributes used by the field extractors.
+    """
+
+    def __init__(self, audio: FileType):
+        self.audio = audio
+        self.filename = audio.filename
+        self.info = audio.info
+        self.mime = audio.mime
+        self.aformat = audio_file_type(audio)
+        self.tags = get_tags(audio)
+        # FLAC tags compute the keys at each call.
+        self.tag_keys = set(self.tags.keys())
+        self.tag_map = map_to_aformat[self.aformat]
+        self.decoded: dict[tuple[SeratoTags, Callable], list[EntryBase] | None] = {}
+
+
+def as_serato_audio(audio: FileType | SeratoAudio) -> SeratoAudio:
+    return audio if isinstance(audio, SeratoAudio) else SeratoAudio(audio)
+
+###################################################################
+
+def b64decode_lines(data: bytes) -> bytes:
+    """Decode base64 data split in lines and without padding, as written by Serato.
+    """
+    # 'a2b_base64' skips the newlines (non-strict mode): no need to remove them.
+    n = len(data) - data.count(b'\n')
+    padding = b'A==' if n % 4 == 1 else (b'=' * (-n % 4))
+    return binascii.a2b_base64(data + padding if padding else data)
+
 def parse_serato_envelope(data: bytes, prefix: bytes) -> bytes:
     """Parses the Serato tags envelope found in FLAC/M4A metadata.
     """
 
     try:
-        b64data = data.replace(b'\n', b'')
-        padding = b'A==' if len(b64data) % 4 == 1 else (b'=' * (-len(b64data) % 4))
-        decoded = base64.b64decode(b64data + padding)
+        decoded = b64decode_lines(data)
     except Exception as e:
         raise ValueError(f"Base64 decoding failed: {e}")
 
@@ -157,10 +189,10 @@ def serato_tag_name(tag: SeratoTags, fmt: AFormat):
 def serato_tag_marker(tag: SeratoTags):
     return tag.value.marker
 
-def serato_metadata(audio: FileType, stag: SeratoTags) -> bytes | None:
+def serato_metadata(audio: FileType | SeratoAudio, stag: SeratoTags) -> bytes | None:
     """Audio file Serato metadata content.
     """
-    ty = audio_file_type(audio)
+    ty = audio.aformat if isinstance(audio, SeratoAudio) else audio_file_type(audio)
     tag_name = serato_tag_name(stag, ty)
     env_marker = serato_tag_marker(stag)
     if ty in [AFormat.MP3, AFormat.FLAC, AFormat.M4A]:
@@ -170,18 +202,30 @@ def serato_metadata(audio: FileType, stag: SeratoTags) -> bytes | None:
         data = None
     if ty in [AFormat.FLAC, AFormat.M4A] and isinstance(data, bytes):
         return parse_serato_envelope(data, env_marker)
-    else:
+    elif isinstance(data, bytes):
         return data
+    else:
+        # RVA2 frames have no Serato payload.
+        return None
 
 def get_serato_metadata(stag: SeratoTags,
                         parser: Callable[[bytes], list[EntryBase]]):
-    def get_metadata(audio: FileType) -> list[EntryBase] | None:
+    def decode(audio: FileType | SeratoAudio) -> list[EntryBase] | None:
         data = serato_metadata(audio, stag)
         if data != None:
             return parser(data)
         else:
             return None
 
+    def get_metadata(audio: FileType | SeratoAudio) -> list[EntryBase] | None:
+        if isinstance(audio, SeratoAudio):
+            key = (stag, parser)
+            if key not in audio.decoded:
+                audio.decoded[key] = decode(audio)
+            return audio.decoded[key]
+        else:
+            return decode(audio)
+
     return get_metadata
 
 
@@ -197,6 +241,10 @@ def pack_color(color: tuple[int, int, int]) -> bytes:
 
 FMT_VERSION = 'BB'
 
+# Precompiled structures shared by the parsers.
+VERSION_STRUCT = struct.Struct(FMT_VERSION)
+UINT32_STRUCT = struct.Struct('>I')
+
 def readbytes(fp):
     for x in iter(lambda: fp.read(1), b''):
         if x == b'\00':
@@ -2,27 +2,34 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import base64
+import binascii
+from dataclasses import dataclass, field
 from datetime import date
+from enum import StrEnum, auto
 import io
+import itertools
 import mutagen
 import mutagen.id3
 import mutagen.mp3
 from mutagen.id3 import Frame, GEOB, Encoding # pyright: ignore
 from mutagen.mp4 import AtomDataType, MP4FreeForm
 from mutagen._file import FileType # pyright: ignore
+from mutagen._tags import PaddingInfo # pyright: ignore
 from pathlib import Path
 import struct
-from typing import Literal, Callable, TypeVar, Optional
+import threading
+from typing import BinaryIO, Iterable, Literal, Callable, TypeVar, Optional
 import warnings
 
 from .analysis import Analysis
+from .audio import load_audio, load_audio_tags
 from .autotags import dump as dump_autotags, AutoTags
 from .beatgrid import NonTerminalBeatgridMarker, TerminalBeatgridMarker, Footer
 from .markers import EntryType, Entry, Color
 from .markers import dump as dump_markers
 from .markers import dump_m4a as dump_markers_m4a
 from .markers2 import BpmLockEntry, ColorEntry, CueEntry, LoopEntry
+from .patch import patch_serato_payloads
 from ..types import (
     AFormat,
     AMarker,
@@ -33,7 +40,7 @@ from ..types import (
     APlaylist,
 )
 from .types import SeratoTags
-from ..utils import s_to_ms
+from ..utils import s_to_ms, thread_map
 from .utils import (
     pack_color,
     FMT_VERSION,
@@ -41,8 +48,7 @@ from .utils import (
     get_tags,
     map_to_aformat
 )
-from .crate.write import (
-    write_fields,
+from .crate.read import (
     Version,
     Sorting,
     ColumnName,
@@ -52,6 +58,7 @@ from .crate.write import (
     Track,
     TrackPath,
 )
+from .crate.write import write_fields
 
 #########################################################################
 
@@ -125,17 +132,17 @@ def insert_newlines(data: bytes, period:int = 72) -> bytes:
     if len(data) <= 72:
         return data
     else:
-        byte_list = list(data)
-        modified_list = []
-        for i, byte_char in enumerate(byte_list):
-            modified_list.append(byte_char)
-            if (i + 1) % period == 0 and (i + 1) < len(byte_list):
-                modified_list.append(ord(b'\n'))
-        return bytes(modified_list)
+        view = memoryview(data)
+        return b'\n'.join([view[i:i + period] for i in range(0, len(data), period)])
 
 
 def remove_b64padding(data: bytes) -> bytes:
-    return data.replace(b'A=', b'').replace(b'=', b'')
+    # Only the tail from the first '=' (and the char before it) changes.
+    start = data.find(b'=')
+    if start < 0:
+        return data
+    start = max(start - 1, 0)
+    return data[:start] + data[start:].replace(b'A=', b'').replace(b'=', b'')
 
 
 def dump_serato_markers_v2(entries: list[ColorEntry | CueEntry | LoopEntry | BpmLockEntry]) -> bytes:
@@ -158,7 +165,8 @@ def dump_serato_markers_v2(entries: list[ColorEntry | CueEntry | LoopEntry | Bpm
         # data
         data.write(payload)
 
-    b64data = base64.b64encode(data.getvalue() + null)
+    data.write(null)
+    b64data = binascii.b2a_base64(data.getbuffer(), newline=False)
     # Serato seems to remove b64 encoding padding.
     b64data = remove_b64padding(b64data)
 
@@ -171,7 +179,7 @@ def dump_serato_markers_v2(entries: list[ColorEntry | CueEntry | LoopEntry | Bpm
     # 470 bytes. If it's shorter, it's null padded. (2 bytes header excluded)
     padding = b'\x00' * (468 - b64data_len) if b64data_len < 468 else b''
 
-    return oneone + b64data + padding
+    return b''.join([oneone, b64data, padding])
 
 ###### Markers ######
 
@@ -378,7 +386,7 @@ def add_envelope(data: bytes, stag: SeratoTags) -> bytes:
     min_len = envelope_padding_min_len(stag)
     data_trimmed_len = len(data_trimmed)
     padding = b'\x00' * (min_len - data_trimmed_len) if data_trimmed_len < min_len else b''
-    b64data = base64.b64encode(prefix + data_trimmed + padding)
+    b64data = binascii.b2a_base64(b''.join([prefix, data_trimmed, padding]), newline=False)
     return remove_b64padding(insert_newlines(b64data))
 
 #########################################################################
@@ -476,14 +484,65 @@ def format_std_tags(field_name: str, tag: str, value, aformat: AFormat) -> Frame
             raise ValueError(f"format_std_tags: File format {aformat} not supported")
 
 
-def add_std_tags(at: ATrack, audio: FileType, overwrite: str) -> tuple[FileType, str]:
+def encoded_tag(value) -> list:
+    """Comparable encoding of a tag value, as stored in the file."""
+    match value:
+        case Frame():
+            # the public content of the frame: text frames and COMM hold
+            # a list of strings, GEOB frames binary data
+            text = [str(t) for t in getattr(value, 'text', [])]
+            return [(value.HashKey, text, getattr(value, 'data', None))]
+        case MP4FreeForm():
+            return [(value.dataformat, bytes(value))]
+        case str():
+            return [value.encode('utf-8')]
+        case list():
+            return [v for x in value for v in encoded_tag(x)]
+        case _:
+            return [value]
+
+
+def tag_differs(audio: FileType, key: str, value) -> bool:
+    """Whether storing 'value' under 'key' would change the file tags.
+
+    The encoded values are compared. ID3 frames are looked up by their
+    'HashKey' (e.g. 'COMM:ID3v1 Comment:eng'), which is the key they
+    get when the file is loaded.
+    """
+    tags = get_tags(audio)
+    if isinstance(value, Frame):
+        key = value.HashKey
+    if key not in tags:
+        return True
+    return encoded_tag(tags[key]) != encoded_tag(value)
+
+
+STD_TAG_FIELDS = ['title', 'artist', 'grouping', 'remixer', 'composer', 'album', 'genre', 'track_number', 'disc_number', 'tonality', 'label', 'release_date', 'comments' ]
+
+def add_std_tags(at: ATrack, audio: FileType, overwrite: str, accepted: frozenset[str] | None = None) -> tuple[FileType, str, bool]:
+    """Write the standard tags of 'at' into 'audio'.
+
+    Tags already holding the value are left untouched.
+
+    Args:
+      overwrite: The overwrite state, see 'handle_existing_tag'.
+      accepted: If given, the existing tags to overwrite, as resolved by
+        'resolve_overwrite'. The user is not asked.
+
+    Returns:
+      The audio file, the overwrite state and whether a tag changed.
+    """
+    changed = False
     tags = get_tags(audio)
     tag_map = map_to_aformat[at.aformat]
 
-    for field_name in ['title', 'artist', 'grouping', 'remixer', 'composer', 'album', 'genre', 'track_number', 'disc_number', 'tonality', 'label', 'release_date', 'comments' ]:
+    for field_name in STD_TAG_FIELDS:
         tag = tag_map[field_name]
 
-        action, overwrite = handle_existing_tag(tag, tags, overwrite, at.location)
+        if accepted is None:
+            action, overwrite = handle_existing_tag(tag, tags, overwrite, at.location)
+        else:
+            action = "continue" if tag in tags and tag not in accepted else "process"
         match action:
             case 'break':
                 break
@@ -495,9 +554,10 @@ def add_std_tags(at: ATrack, audio: FileType, overwrite: str) -> tuple[FileType,
             continue
 
         tag_value = format_std_tags(field_name, tag, v, at.aformat)
-        if tag_value is not None:
+        if tag_value is not None and tag_differs(audio, tag, tag_value):
             audio[tag] = tag_value
-    return audio, overwrite
+            changed = True
+    return audio, overwrite, changed
 
 
 def split_tag_name(tag: str) -> tuple[str, str, str]:
@@ -513,84 +573,363 @@ def split_tag_name(tag: str) -> tuple[str, str, str]:
 
 
 A = TypeVar('A')
-def add_serato_tag(at: ATrack, audio: FileType, stag: SeratoTags, to_low: Callable[[ATrack], Optional[A]], dump: Callable[[A], bytes]) -> FileType:
-    tag = stag.value.names[at.aformat]
+def serato_payload(at: ATrack, stag: SeratoTags, to_low: Callable[[ATrack], Optional[A]], dump: Callable[[A], bytes]) -> bytes | None:
+    """The Serato tag 'stag' of 'at' as stored in the audio file: the
+    GEOB object data (MP3) or the envelope (FLAC, M4A).
+
+    Returns None if the track has no data for this tag.
+    """
     low = to_low(at)
-    if low != [] and low is not None:
-        data = dump(low)
-        match at.aformat:
-            case AFormat.MP3:
-                _, tag_desc, _ = split_tag_name(tag)
-                frame = GEOB(encoding=Encoding.UTF8,
-                             mime="application/octet-stream",
-                             desc=tag_desc,
-                             data=data)
-                if audio.tags is None:
-                    assert isinstance(audio, mutagen.mp3.MP3)
-                    audio.tags = mutagen.id3.ID3()
-                audio.tags.add(frame)
-            case AFormat.FLAC:
-                audio[tag] = add_envelope(data, stag).decode('ascii')
-            case AFormat.M4A:
-                audio[tag] = MP4FreeForm(data=add_envelope(data, stag))
-            case _:
-                raise ValueError(f"add_serato_markers: file format {at.aformat} not supported")            
-    return audio
+    if low == [] or low is None:
+        return None
+    data = dump(low)
+    match at.aformat:
+        case AFormat.MP3:
+            return data
+        case AFormat.FLAC | AFormat.M4A:
+            return add_envelope(data, stag)
+        case _:
+            raise ValueError(f"serato_payload: file format {at.aformat} not supported")
+
+
+def serato_tag_encoders(aformat: AFormat) -> list[tuple[SeratoTags, Callable, Callable]]:
+    """The Serato tags written by 'to_serato' with their conversion and
+    dump functions."""
+    return [
+        (SeratoTags.MARKERS, to_serato_markers,
+         lambda es: dump_serato_markers(es, aformat)),
+        (SeratoTags.MARKERS2, to_serato_markers_v2, dump_serato_markers_v2),
+        (SeratoTags.BEATGRID, to_serato_beatgrid, dump_serato_beatgrid),
+        (SeratoTags.ANALYSIS, to_serato_analysis, dump_serato_analysis),
+        (SeratoTags.AUTOTAGS, to_serato_autotags, dump_serato_autotags),
+    ]
+
+
+def add_serato_tag(at: ATrack, audio: FileType, stag: SeratoTags, to_low: Callable[[ATrack], Optional[A]], dump: Callable[[A], bytes]) -> tuple[FileType, bool]:
+    """Encode the Serato tag 'stag' of 'at' into 'audio'.
+
+    Returns:
+      The audio file and whether the tag changed. A tag already holding
+      the same bytes is left untouched.
+    """
+    tag = stag.value.names[at.aformat]
+    payload = serato_payload(at, stag, to_low, dump)
+    if payload is None:
+        return audio, False
+    match at.aformat:
+        case AFormat.MP3:
+            _, tag_desc, _ = split_tag_name(tag)
+            frame = GEOB(encoding=Encoding.UTF8,
+                         mime="application/octet-stream",
+                         desc=tag_desc,
+                         data=payload)
+            if not tag_differs(audio, tag, frame):
+                return audio, False
+            if audio.tags is None:
+                assert isinstance(audio, mutagen.mp3.MP3)
+                audio.tags = mutagen.id3.ID3()
+            audio.tags.add(frame)
+        case AFormat.FLAC:
+            value = payload.decode('ascii')
+            if not tag_differs(audio, tag, value):
+                return audio, False
+            audio[tag] = value
+        case AFormat.M4A:
+            value = MP4FreeForm(data=payload)
+            if not tag_differs(audio, tag, value):
+                return audio, False
+            audio[tag] = value
+        case _:
+            raise ValueError(f"add_serato_markers: file format {at.aformat} not supported")
+    return audio, True
+
+#########################################################################
+#### Padding ####
+
+class TagPadding:
+    """mutagen padding callback keeping the tags in place.
+
+    As long as the tags fit in the space of the file tags (ID3 padding,
+    FLAC 'PADDING' block, MP4 'free' atom), the remaining space is kept
+    as padding and the audio data is not moved. In particular, unlike
+    the mutagen default, a large padding is never shrunk. Otherwise the
+    file has to be rewritten, and 'headroom' bytes are reserved for
+    later updates.
+
+    Attributes:
+      headroom: Padding in bytes after a rewrite. If None, as mutagen:
+        1 KiB + 0.1% of the audio data.
+      rewritten: Whether the last save rewrote the file.
+    """
+
+    def __init__(self, headroom: int | None = None):
+        self.headroom = headroom
+        self.rewritten = False
+
+    def __call__(self, info: PaddingInfo) -> int:
+        if info.padding >= 0:
+            return info.padding
+        self.rewritten = True
+        if self.headroom is None:
+            return 1024 + info.size // 1000
+        return self.headroom
 
 #########################################################################
 #### Main ####
 
-def to_serato(at: ATrack, trans: ATransformation, overwrite: str = 'n') -> str:
+class SaveResult(StrEnum):
+    """How 'to_serato' updated an audio file."""
+    UNCHANGED = auto()  # already holding the metadata, not saved
+    IN_PLACE = auto()   # tags updated within the existing space
+    REWRITTEN = auto()  # the whole file was rewritten
+    PATCHED = auto()    # Serato payloads overwritten (see 'patch_serato')
+    SKIPPED = auto()    # the file could not be opened, not written
+
+def to_serato(at: ATrack, trans: ATransformation, overwrite: str = 'n', accepted: frozenset[str] | None = None, headroom: int | None = None, std_tags: bool = True) -> tuple[str, SaveResult]:
     """Convert an ATrack instance into 'Serato DJ Pro' metadata.
 
     The metadta is written to the tags expected by Serato in the audio
     file specified by the 'location' attribute of the ATrack instance.
+    Every tag is encoded and compared with the one in the file: the
+    file is only saved when its metadata changes. The padding is
+    managed by 'TagPadding'.
 
     Args:
       at: The ATrack instance.
       trans: ATransformation instance specifying the configuration.
+      accepted: The existing standard tags to overwrite, when already
+        resolved (see 'resolve_overwrite').
+      headroom: Padding reserved when the file has to be rewritten
+        (see 'TagPadding').
+      std_tags: If False, only the Serato tags are written.
 
     Returns:
-      The overwrite state ('n', 'N', 'y', 'Y').
+      The overwrite state ('n', 'N', 'y', 'Y') and how the file was
+      saved.
     """
 
-    audio = mutagen.File(at.location, easy=False) # pyright: ignore
+    # All tags are loaded, as they are saved back.
+    audio = load_audio(at.location)
     if audio is None:
         warnings.warn(f"to_serato: file {at.location} not accessible")
-        return overwrite
+        return overwrite, SaveResult.SKIPPED
 
+    changed = False
+    padding = TagPadding(headroom)
     try:
-        audio, overwrite = add_std_tags(at, audio, overwrite)
+        if std_tags:
+            audio, overwrite, changed = add_std_tags(at, audio, overwrite, accepted)
 
         # XXX play_count (tag 'TXXX:SERATO_PLAYCOUNT'): encoding not
         # reverse engineered.
 
-        audio = add_serato_tag(at, audio,
-                               SeratoTags.MARKERS,
-                               to_serato_markers,
-                               lambda es: dump_serato_markers(es, at.aformat))
-        audio = add_serato_tag(at, audio,
-                               SeratoTags.MARKERS2,
-                               to_serato_markers_v2,
-                               dump_serato_markers_v2)
-        audio = add_serato_tag(at, audio,
-                               SeratoTags.BEATGRID,
-                               to_serato_beatgrid,
-                               dump_serato_beatgrid)
-        audio = add_serato_tag(at, audio,
-                               SeratoTags.ANALYSIS,
-                               to_serato_analysis,
-                               dump_serato_analysis)
-        audio = add_serato_tag(at, audio,
-                               SeratoTags.AUTOTAGS,
-                               to_serato_autotags,
-                               dump_serato_autotags)
+        for stag, to_low, dump in serato_tag_encoders(at.aformat):
+            audio, tag_changed = add_serato_tag(at, audio, stag, to_low, dump)
+            changed = changed or tag_changed
     finally:
-        audio.save()
-    return overwrite
+        if changed:
+            audio.save(padding=padding)
+    if not changed:
+        return overwrite, SaveResult.UNCHANGED
+    return overwrite, SaveResult.REWRITTEN if padding.rewritten else SaveResult.IN_PLACE
+
+def patch_serato(at: ATrack) -> SaveResult | None:
+    """Write the Serato tags of 'at' by overwriting the payloads in the
+    audio file, without parsing and saving it with mutagen.
+
+    Only possible when every payload is already in the file with the
+    same size (see 'patch_serato_payloads'). The standard tags are not
+    written.
+
+    Returns:
+      UNCHANGED or PATCHED, or None if the file can't be patched.
+    """
+    payloads = {}
+    for stag, to_low, dump in serato_tag_encoders(at.aformat):
+        payload = serato_payload(at, stag, to_low, dump)
+        if payload is not None:
+            payloads[stag] = payload
+    match patch_serato_payloads(at.location, at.aformat, payloads):
+        case None:
+            return None
+        case True:
+            return SaveResult.PATCHED
+        case False:
+            return SaveResult.UNCHANGED
+
+
+def write_serato_track(at: ATrack, trans: ATransformation, overwrite: str = 'n', accepted: frozenset[str] | None = None, headroom: int | None = None, patch: bool = False) -> tuple[str, SaveResult]:
+    """Write the tags of 'at' with 'to_serato'.
+
+    With 'patch', only the Serato tags are written, trying first with
+    'patch_serato'.
+    """
+    if patch:
+        result = patch_serato(at)
+        if result is not None:
+            return overwrite, result
+    return to_serato(at, trans, overwrite, accepted, headroom, std_tags=not patch)
+
+#########################################################################
+#### Crates ####
+
+CRATE_HEADER = [
+    Version(value='1.0/Serato ScratchLive Crate'),
+    Sorting(value=[ColumnName(value='#'), ReverseOrder(value=False)]),
+    ColumnTitle(value=[ColumnName(value='playCount'), ColumnWidth(value='0')]),
+    ColumnTitle(value=[ColumnName(value='artist'), ColumnWidth(value='0')]),
+    ColumnTitle(value=[ColumnName(value='song'), ColumnWidth(value='0')]),
+    ColumnTitle(value=[ColumnName(value='bpm'), ColumnWidth(value='0')]),
+    ColumnTitle(value=[ColumnName(value='key'), ColumnWidth(value='0')]),
+    ColumnTitle(value=[ColumnName(value='album'), ColumnWidth(value='0')]),
+    ColumnTitle(value=[ColumnName(value='length'), ColumnWidth(value='0')]),
+    ColumnTitle(value=[ColumnName(value='comment'), ColumnWidth(value='0')]),
+]
 
 
-def to_serato_playlist(playlist: APlaylist, ofile: Path, trans: ATransformation, overwrite: str = 'n') -> None:
+def write_serato_crate(fp: BinaryIO, locations: Iterable[Path]) -> int:
+    """Write a Serato DJ Pro Crate listing the audio files 'locations'.
+
+    The tracks are streamed to 'fp' as they are encoded.
+
+    Returns:
+      The number of bytes written.
+    """
+    # In Crates, Serato removes the drive and root components
+    tracks = (Track([TrackPath(p.relative_to(p.anchor))]) for p in locations)
+    return write_fields(fp, itertools.chain(CRATE_HEADER, tracks))
+
+#########################################################################
+#### Parallel writes ####
+
+@dataclass
+class SeratoWriteReport:
+    """Outcome of writing the tags of a playlist.
+
+    Attributes:
+      written: The files whose tags were written.
+      unchanged: The files already holding the metadata (not saved).
+      rewritten: The written files whose tags didn't fit in the
+        available space: the whole file was rewritten.
+      patched: The written files whose Serato payloads were
+        overwritten in place.
+      skipped: The files that could not be opened (e.g., unsupported
+        format): nothing was written.
+      errors: The files that could not be written, with the error.
+    """
+    written: list[Path] = field(default_factory=list)
+    unchanged: list[Path] = field(default_factory=list)
+    rewritten: list[Path] = field(default_factory=list)
+    patched: list[Path] = field(default_factory=list)
+    skipped: list[Path] = field(default_factory=list)
+    errors: list[tuple[Path, Exception]] = field(default_factory=list)
+
+    def add(self, location: Path, result: SaveResult) -> None:
+        match result:
+            case SaveResult.UNCHANGED:
+                self.unchanged.append(location)
+            case SaveResult.IN_PLACE:
+                self.written.append(location)
+            case SaveResult.REWRITTEN:
+                self.written.append(location)
+                self.rewritten.append(location)
+            case SaveResult.PATCHED:
+                self.written.append(location)
+                self.patched.append(location)
+            case SaveResult.SKIPPED:
+                self.skipped.append(location)
+
+
+def probe_std_tags(at: ATrack) -> dict | None:
+    """The tags of the audio file of 'at', to check which standard
+    tags exist. Empty if mutagen can't open the file, None on errors
+    (they are reported when writing).
+    """
+    try:
+        audio = load_audio_tags(at.location)
+    except Exception:
+        return None
+    # an unreadable file has no existing tags
+    return get_tags(audio) if audio is not None else {}
+
+
+def resolve_overwrite(at: ATrack, tags: dict | None, overwrite: str) -> tuple[frozenset[str] | None, str]:
+    """Ask the standard tags overwrite questions of a track.
+
+    The questions are the ones asked by 'to_serato', in the same order,
+    so that the file can then be written without questions.
+
+    Args:
+      tags: The tags of the audio file (see 'probe_std_tags').
+      overwrite: The overwrite state, see 'handle_existing_tag'.
+
+    Returns:
+      The existing tags to overwrite, and the new overwrite state. None
+      means that the track is handled by the final state ('Y' or 'N')
+      without questions.
+    """
+    if overwrite in ['Y', 'N']:
+        return None, overwrite
+    if tags is None:
+        return frozenset(), overwrite
+    tag_map = map_to_aformat[at.aformat]
+    accepted = set()
+    for field_name in STD_TAG_FIELDS:
+        tag = tag_map[field_name]
+        action, overwrite = handle_existing_tag(tag, tags, overwrite, at.location)
+        if action == "process" and tag in tags:
+            accepted.add(tag)
+    return frozenset(accepted), overwrite
+
+
+def write_serato_tags(tracks: list[ATrack], trans: ATransformation, overwrite: str = 'n', jobs: int = 1, headroom: int | None = None, patch: bool = False) -> SeratoWriteReport:
+    """Write the Serato tags of 'tracks' on a pool of 'jobs' threads.
+
+    Each audio file is written by a single thread: a file listed
+    several times in 'tracks' is written once, from its first entry,
+    and all its entries get that result in the report. Each thread
+    reads the existing tags of its file, then asks the overwrite
+    questions (see 'resolve_overwrite') one file at a time, and writes
+    the file. An error in a file doesn't stop the other writes: it's
+    recorded in the report.
+    """
+    files: dict[Path, ATrack] = {}
+    for at in tracks:
+        files.setdefault(at.location, at)
+    unique = list(files.values())
+
+    lock = threading.Lock()
+    state = [overwrite]
+
+    def accepted_tags(at: ATrack) -> frozenset[str] | None:
+        # no standard tags, no questions
+        if patch or state[0] in ['Y', 'N']:
+            return None
+        tags = probe_std_tags(at)
+        with lock:
+            accepted, state[0] = resolve_overwrite(at, tags, state[0])
+        return accepted
+
+    def write(at: ATrack) -> SaveResult | Exception:
+        try:
+            accepted = accepted_tags(at)
+            _, result = write_serato_track(at, trans, state[0], accepted, headroom, patch)
+            return result
+        except Exception as err:
+            return err
+
+    results = dict(zip(files, thread_map(write, unique, jobs)))
+    report = SeratoWriteReport()
+    for at in tracks:
+        res = results[at.location]
+        if isinstance(res, SaveResult):
+            report.add(at.location, res)
+        else:
+            report.errors.append((at.location, res))
+    return report
+
+
+def to_serato_playlist(playlist: APlaylist, ofile: Path, trans: ATransformation, overwrite: str = 'n', jobs: int = 1, headroom: int | None = None, patch: bool = False) -> SeratoWriteReport:
     """Generate a Serato DJ Pro Crate playlist and write tags to audio files.
 
     Args:
@@ -598,29 +937,21 @@ def to_serato_playlist(playlist: APlaylist, ofile: Path, trans: ATransformation,
       playlist: the playlist to convert.
       ofile: output file name.
       trans: information about the source and target format.
-    """
-    # header
-    crate = [
-        Version(value='1.0/Serato ScratchLive Crate'),
-        Sorting(value=[ColumnName(value='#'), ReverseOrder(value=False)]),
-        ColumnTitle(value=[ColumnName(value='playCount'), ColumnWidth(value='0')]),
-        ColumnTitle(value=[ColumnName(value='artist'), ColumnWidth(value='0')]),
-        ColumnTitle(value=[ColumnName(value='song'), ColumnWidth(value='0')]),
-        ColumnTitle(value=[ColumnName(value='bpm'), ColumnWidth(value='0')]),
-        ColumnTitle(value=[ColumnName(value='key'), ColumnWidth(value='0')]),
-        ColumnTitle(value=[ColumnName(value='album'), ColumnWidth(value='0')]),
-        ColumnTitle(value=[ColumnName(value='length'), ColumnWidth(value='0')]),
-        ColumnTitle(value=[ColumnName(value='comment'), ColumnWidth(value='0')]),
-    ]
+      jobs: Number of threads writing the audio files (see
+        'write_serato_tags'). Errors are collected in the report
+        instead of stopping the conversion, and the crate is written
+        after all files.
+      headroom: Padding reserved in the files that have to be
+        rewritten (see 'TagPadding').
+      patch: Only write the Serato tags, overwriting the existing
+        payloads in place when possible (see 'patch_serato').
 
-    for at in playlist.tracks:
-        # write tags to audio file
-        overwrite = to_serato(at, trans, overwrite)
-        # In Crates, Serato removes the drive and root components
-        p = at.location.relative_to(at.location.anchor)
-        crate.append(Track([TrackPath(p)]))
+    Returns:
+      The files written and the errors.
+    """
+    report = write_serato_tags(playlist.tracks, trans, overwrite, jobs, headroom, patch)
 
     with open(ofile, "wb") as f:
-        write_fields(f, crate)
+        write_serato_crate(f, [at.location for at in playlist.tracks])
 
-    return None
+    return report
@@ -3,4 +3,4 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 from .write import to_traktor_playlist
-from .read import read_traktor_playlist
+from .read import read_traktor_playlist, read_traktor_library
@@ -3,7 +3,10 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 from datetime import date, datetime
+import itertools
+from mutagen._file import FileType # pyright: ignore
 from pathlib import Path
+from typing import Any, Iterable
 import warnings
 import xml.etree.ElementTree as ET
 
@@ -19,14 +22,9 @@ from ..types import (
 )
 
 from .utils import (
+    TRAKTOR_ENTRY_ATTRS_MAP,
     TRAKTOR_MARKERTYPE_MAP,
-    TRAKTOR_MARKERTYPE_MAP,
-    is_album_tag_attr,
-    is_entry_tag_attr,
-    is_tempo_tag_attr,
-    is_info_tag_attr,
-    traktor_attr_name,
-    is_musical_key_attr
+    TRAKTOR_TEXT_FIELDS
 )
 
 from ..utils import (
@@ -37,41 +35,21 @@ from ..utils import (
     OPEN_KEY2MUSICAL_KEY_MAP,
     audio_endocer,
     file_size,
-    maybe_audio,
     normalize_time,
     inverse_dict,
+    iterparse_subtrees,
     ms_to_s,
     to_int,
+    probe_audio_files,
     to_float,
+    track_audio,
+    wants_audio,
 )
 
 ###################################################################
 
 ########## Helpers ######################
 
-def get_tag_attr(fn: str, tag: ET.Element) -> str | None:
-    tn = traktor_attr_name(fn)
-    match tn:
-        case None:
-            return None
-        case 'BITRATE':
-            v = tag.get(tn)
-            return v if v != "-1" else None
-        case _:
-            return tag.get(tn)
-
-
-def make_get_subtag(xpath: str):
-    def get_subtag(fn: str, entry: ET.Element) -> str | None:
-        tag = entry.find(xpath)
-        if tag is not None:
-            return get_tag_attr(fn, tag)
-        else:
-            return None
-
-    return get_subtag
-
-
 def to_date(d: str | None) -> date | None:
     if d is None:
         return d
@@ -88,28 +66,9 @@ def to_bool(l: str | None) -> bool:
         return False
 
 
-########## ALBUM ######################
-
-get_album_subtag = make_get_subtag('./ALBUM')
-
-########## MODIFICATION_INFO ######################
-
-# get_modification_info_subtag = make_get_subtag('./MODIFICATION_INFO')
-
-########## INFO ######################
-
-get_info_subtag = make_get_subtag('./INFO')
-
-########## TEMPO ######################
-
-get_tempo_subtag = make_get_subtag('./TEMPO')
-
 ########## LOCATION ######################
 
-def get_location(entry: ET.Element) -> Path:
-    loc = entry.find('./LOCATION')
-    assert loc is not None, "location tag missing"
-
+def location_path(loc: ET.Element) -> Path:
     vol = loc.get('VOLUME')
     d = loc.get('DIR')
     name = loc.get('FILE')
@@ -124,208 +83,398 @@ def get_location(entry: ET.Element) -> Path:
 
 ########## LOUDNESS ######################
 
-def get_loudness(entry: ET.Element):
-    ldns = entry.find('./LOUDNESS')
-    if ldns is None:
+def loudness_from(ldns: ET.Element) -> ALoudness | None:
+    perc_db = ldns.get('PERCEIVED_DB')
+    if perc_db is None:
         return None
     else:
-        perc_db = ldns.get('PERCEIVED_DB')
-        if perc_db is None:
-            return None
-        else:
-            return ALoudness(
-                autogain=float(perc_db),
-                gain_db=0.0
-            )
+        return ALoudness(
+            autogain=float(perc_db),
+            gain_db=0.0
+        )
 
 
 ########## MUSICAL_KEY ######################
 
-get_musical_key_subtag = make_get_subtag('./MUSICAL_KEY')
+MUSICAL_KEY2OPEN_KEY_MAP = inverse_dict(OPEN_KEY2MUSICAL_KEY_MAP)
+OPEN_KEY2CLASSIC_KEY_MAP = inverse_dict(CLASSIC2OPEN_KEY_MAP)
 
 def musical_key_to_classic_key(mk: str | None) -> str | None:
     if mk is None:
         return None
     elif mk.isnumeric():
-        ok = inverse_dict(OPEN_KEY2MUSICAL_KEY_MAP)[int(mk)]
-        return inverse_dict(CLASSIC2OPEN_KEY_MAP)[ok]
+        ok = MUSICAL_KEY2OPEN_KEY_MAP[int(mk)]
+        return OPEN_KEY2CLASSIC_KEY_MAP[ok]
     else:
         warnings.warn(f"Can't convert key {mk} to Classical key.")
         return None
 
 ########## CUE_V2 ######################
 
-def get_cue_v2_beatgrid(entry: ET.Element) -> list[ABeatGridBPM]:
-    mkrs = entry.findall('./CUE_V2[@TYPE="4"]')
-    out = []
-    for m in mkrs:
-        pos = m.get('START')
-        assert pos is not None
-        grid = m.find('./GRID')
-        assert grid is not None
-        bpm = grid.get('BPM')
-        assert bpm is not None
-        out += [ABeatGridBPM(
-            position = ms_to_s(float(pos)),
-            bpm = float(bpm),
-        )]
-    return out
+TRAKTOR_MARKERTYPE_INVERSE_MAP = inverse_dict(TRAKTOR_MARKERTYPE_MAP)
+
+def cue_v2_to_beatgrid(m: ET.Element) -> ABeatGridBPM:
+    pos = m.get('START')
+    assert pos is not None
+    grid = m.find('./GRID')
+    assert grid is not None
+    bpm = grid.get('BPM')
+    assert bpm is not None
+    return ABeatGridBPM(
+        position = ms_to_s(float(pos)),
+        bpm = float(bpm),
+    )
 
 
-def get_cue_v2_cues(entry: ET.Element) -> list[AMarker]:
-    mkrs = entry.findall('./CUE_V2[@TYPE!="4"]')
-    out = []
-    for m in mkrs:
-        name = m.get('NAME')
-        assert name is not None
-        start = m.get('START')
-        assert start is not None
-        length = m.get('LEN')
-        assert length is not None
-        kind = m.get('TYPE')
-        assert kind is not None
-        idx = m.get('HOTCUE')
-        assert idx is not None
-        out += [AMarker(
-            name = name,
-            color = None,
-            start = ms_to_s(float(start)),
-            end = ms_to_s(float(start) + float(length)) if float(length) != 0.0 else None,
-            kind = inverse_dict(TRAKTOR_MARKERTYPE_MAP)[kind],
-            index = int(idx),
-            locked = False,
-        )]
-    return out
+def cue_v2_to_marker(m: ET.Element) -> AMarker:
+    name = m.get('NAME')
+    assert name is not None
+    start = m.get('START')
+    assert start is not None
+    length = m.get('LEN')
+    assert length is not None
+    kind = m.get('TYPE')
+    assert kind is not None
+    idx = m.get('HOTCUE')
+    assert idx is not None
+    return AMarker(
+        name = name,
+        color = None,
+        start = ms_to_s(float(start)),
+        end = ms_to_s(float(start) + float(length)) if float(length) != 0.0 else None,
+        kind = TRAKTOR_MARKERTYPE_INVERSE_MAP[kind],
+        index = int(idx),
+        locked = False,
+    )
 
 
 ########## MAIN ######################
 
-def get_str_attr(fn: str, entry: ET.Element) -> str | None:
-    if is_entry_tag_attr(fn):
-        return get_tag_attr(fn, entry)
-    elif is_album_tag_attr(fn):
-        return get_album_subtag(fn, entry)
-    elif is_info_tag_attr(fn):
-        return get_info_subtag(fn, entry)
-    elif is_tempo_tag_attr(fn):
-        return get_tempo_subtag(fn, entry)
-    elif is_musical_key_attr(fn):
-        return get_musical_key_subtag(fn, entry)
-    else:
-        return None
+def decode_entry(entry: ET.Element) -> dict[str, Any]:
+    """Decode an ENTRY visiting its attributes and sub-tags once.
+
+    Returns:
+      A dictionary with the raw string value of the fields in
+      TRAKTOR_TEXT_FIELDS (None if missing), the (unadjusted) 'location',
+      the 'beatgrid', the 'markers' and the 'loudness'.
+    """
+    out: dict[str, Any] = dict.fromkeys(TRAKTOR_TEXT_FIELDS)
+    for an, fn in TRAKTOR_ENTRY_ATTRS_MAP['ENTRY']:
+        out[fn] = entry.get(an)
+    out['location'] = None
+    out['loudness'] = None
+    beatgrid = []
+    markers = []
+    seen = set()
+    for tag in entry:
+        if tag.tag == 'CUE_V2':
+            if tag.get('TYPE') == '4':
+                beatgrid.append(cue_v2_to_beatgrid(tag))
+            else:
+                markers.append(cue_v2_to_marker(tag))
+        elif tag.tag in seen:
+            # as 'find', only consider the first sub-tag
+            continue
+        else:
+            seen.add(tag.tag)
+            if tag.tag in TRAKTOR_ENTRY_ATTRS_MAP:
+                for an, fn in TRAKTOR_ENTRY_ATTRS_MAP[tag.tag]:
+                    out[fn] = tag.get(an)
+            elif tag.tag == 'LOCATION':
+                out['location'] = location_path(tag)
+            elif tag.tag == 'LOUDNESS':
+                out['loudness'] = loudness_from(tag)
+    if out['bit_rate'] == "-1":
+        out['bit_rate'] = None
+    assert out['location'] is not None, "location tag missing"
+    out['beatgrid'] = beatgrid
+    out['markers'] = markers
+    return out
 
 
-def from_traktor(entry: ET.Element, nml_version: int, anchor: Path | None = None, relative: Path | None = None) -> ATrack:
+def from_traktor(entry: ET.Element, nml_version: int, anchor: Path | None = None, relative: Path | None = None, read_audio: bool = True, trans: ATransformation | None = None) -> ATrack:
+    """Convert a COLLECTION ENTRY into an ATrack.
 
-    location = adjust_location(get_location(entry), anchor, relative)
-    audio = maybe_audio(location)
+    The audio file is opened only if needed (see 'track_audio').
+    """
+    e = decode_entry(entry)
+    location = adjust_location(e['location'], anchor, relative)
+    audio = track_audio(location, read_audio, trans)
+    return traktor_atrack(e, location, audio, nml_version)
 
+
+def traktor_atrack(e: dict[str, Any], location: Path, audio: FileType | None, nml_version: int) -> ATrack:
+    """Make an ATrack from a decoded ENTRY (see 'decode_entry'), given
+    its (adjusted) location and the opened audio file, if any.
+    """
     return ATrack(
-        title = get_str_attr('title', entry),
-        artist = get_str_attr('artist', entry),
-        grouping = get_str_attr('grouping', entry),
-        remixer = get_str_attr('remixer', entry),
-        composer = get_str_attr('composer', entry),
-        album = get_str_attr('album', entry),
-        genre = get_str_attr('genre', entry),
-        track_number = to_int(get_str_attr('track_number', entry)),
-        disc_number = to_int(get_str_attr('disc_number', entry)),
-        release_date = to_date(get_str_attr('release_date', entry)),
-        play_count = to_int(get_str_attr('play_count', entry)),
-        tonality = musical_key_to_classic_key(get_str_attr('tonality', entry)),
-        label = get_str_attr('label', entry),
-        comments = get_str_attr('comments', entry),
-        rating = to_int(get_str_attr('rating', entry)),
+        title = e['title'],
+        artist = e['artist'],
+        grouping = e['grouping'],
+        remixer = e['remixer'],
+        composer = e['composer'],
+        album = e['album'],
+        genre = e['genre'],
+        track_number = to_int(e['track_number']),
+        disc_number = to_int(e['disc_number']),
+        release_date = to_date(e['release_date']),
+        play_count = to_int(e['play_count']),
+        tonality = musical_key_to_classic_key(e['tonality']),
+        label = e['label'],
+        comments = e['comments'],
+        rating = to_int(e['rating']),
         # Traktor gives an integer in kbytes. However, Rekordbox
         # expects the numberof octets. If we have access to the file,
         # we determine the exact number, otherwise we let the target
         # software determine it.
         size = file_size(audio) if audio is not None else None,
-        total_time = to_float(get_str_attr('total_time', entry)),
-        bit_rate = to_int(get_str_attr('bit_rate', entry)),
-        sample_rate = to_float(get_str_attr('sample_rate', entry)),
+        total_time = to_float(e['total_time']),
+        bit_rate = to_int(e['bit_rate']),
+        sample_rate = to_float(e['sample_rate']),
         location = location,
-        aformat = audio_file_type(audio) if audio is not None else aformat_from_path(get_location(entry)),
-        beatgrid = get_cue_v2_beatgrid(entry),
-        markers = get_cue_v2_cues(entry),
-        locked = to_bool(get_str_attr('locked', entry)),
+        aformat = audio_file_type(audio) if audio is not None else aformat_from_path(e['location']),
+        beatgrid = e['beatgrid'],
+        markers = e['markers'],
+        locked = to_bool(e['locked']),
         color = None, # XXX extract track color
-        average_bpm = to_float(get_str_attr('average_bpm', entry)),
-        loudness = get_loudness(entry),
+        average_bpm = to_float(e['average_bpm']),
+        loudness = e['loudness'],
         data_source = ADataSource(ASoftware.TRAKTOR,
                                   [nml_version],
                                   audio_endocer(audio) if audio is not None else None),
         trackID = None, # XXX use AUDIO_ID?
         mix = None,
-        date_added = to_date(get_str_attr('date_added', entry))
+        date_added = to_date(e['date_added'])
     )
 
 
-def find_collection_entry(col: ET.Element, key: str | None) -> ET.Element | None:
-    if key is None:
+def entry_primary_key(element: ET.Element) -> str | None:
+    """The key used by PLAYLIST PRIMARYKEY elements to refer to a COLLECTION ENTRY.
+    """
+    loc = element.find('./LOCATION')
+    if loc is None:
+        return None
+
+    vol = loc.get('VOLUME')
+    d = loc.get('DIR')
+    name = loc.get('FILE')
+
+    if vol is None or d is None or name is None:
         return None
     else:
-        out = None
-        for element in col.iter('ENTRY'):
-            loc = element.find('./LOCATION')
-            if loc is None:
-                continue
+        return vol + d + name
 
-            vol = loc.get('VOLUME')
-            d = loc.get('DIR')
-            name = loc.get('FILE')
 
-            if not any(e is None for e in [vol, d, name]) and key == (vol + d + name): # pyright: ignore
-                out = element
-                break
-        return out
+def index_collection(entries: Iterable[ET.Element]) -> dict[str, ET.Element]:
+    """Index the COLLECTION ENTRY elements by their primary key.
 
+    'entries' can be any iterable, including one producing the
+    elements while the file is parsed. If a key appears more than
+    once, the first element wins.
+    """
+    index = {}
+    for element in entries:
+        k = entry_primary_key(element)
+        if k is not None:
+            index.setdefault(k, element)
+    return index
 
-def read_traktor_playlist(nml_file: Path, name: str | None, trans: ATransformation, anchor: Path | None = None, relative: Path | None = None) -> APlaylist:
 
-    root = ET.parse(nml_file).getroot()
-    nml_version = root.get('VERSION')
-    if nml_version is not None:
-        nml_version = int(nml_version)
+def get_nml_version(v: str | None) -> int:
+    if v is not None:
+        return int(v)
     else:
         raise ValueError(f"NML file has not VERSION information.")
 
-    # find playlist
-    pls = root.findall('.//NODE[@TYPE="PLAYLIST"]')
-    pl_name = nml_file.stem if name is None else name
-    
+
+def select_playlist(pls: list[ET.Element], pl_name: str) -> ET.Element:
     pl = list(filter(lambda pl: pl.attrib['NAME'] == pl_name, pls))
     if len(pl) == 0:
         raise ValueError(f'Playlist {pl_name} not found.')
     elif len(pl) > 1:
         raise ValueError(f'More than 1 playlist named {pl_name}!')
     else:
-        pl = pl[0]
+        return pl[0]
+
 
-    # entries
+def get_playlist_entries(pl: ET.Element, pl_name: str) -> int:
     entries = pl.find('./PLAYLIST[@TYPE="LIST"]')
     if entries is not None:
         entries = entries.get('ENTRIES')
         assert entries is not None
-        entries = int(entries)
+        return int(entries)
     else:
         raise ValueError(f"Can't find ENTRIES in playlist {pl_name}: Corrupted file.")
-        
-    # lookup entry in collection
-    col = root.find('COLLECTION')
-    if col is None:
-        raise ValueError(f'No COLLECTION in playlist {pl_name}: Corrupted file.')
 
-    ats = []
-    for t in pl.findall('./PLAYLIST/ENTRY/PRIMARYKEY'):
-        k = t.get('KEY')
-        e = find_collection_entry(col, k)
-        if e is not None:
-            at = from_traktor(e, nml_version, anchor, relative)
-            ats.append(normalize_time(at, trans))
 
-    apl = APlaylist(pl_name, ats)
+def get_playlist_keys(pl: ET.Element) -> list[str | None]:
+    return [t.get('KEY') for t in pl.findall('./PLAYLIST/ENTRY/PRIMARYKEY')]
+
+
+def playlist_tracks(pl: ET.Element, index: dict[str, ET.Element], nml_version: int, trans: ATransformation, anchor: Path | None = None, relative: Path | None = None, decoded: dict[ET.Element, ATrack] | None = None, read_audio: bool = True, jobs: int = 1) -> list[ATrack]:
+    """Decode the tracks of a playlist NODE.
+
+    If 'decoded' is given, it's used as a cache of the COLLECTION
+    entries already decoded, such that tracks appearing in several
+    playlists are decoded once and shared. If 'read_audio' is False,
+    audio files are only opened when 'trans' requires it. The audio
+    files are opened on a pool of 'jobs' threads.
+    """
+    entries = []
+    for k in get_playlist_keys(pl):
+        e = index.get(k) if k is not None else None
+        if e is not None:
+            entries.append(e)
+
+    if decoded is None:
+        decoded = {}
+    # open the audio files of the entries not yet decoded at once
+    todo = list(dict.fromkeys(e for e in entries if e not in decoded))
+    des = list(map(decode_entry, todo))
+    locations = [adjust_location(de['location'], anchor, relative) for de in des]
+    audios = probe_audio_files((loc if wants_audio(loc, read_audio, trans) else None
+                                for loc in locations), jobs)
+    for e, de, loc, audio in zip(todo, des, locations, audios):
+        decoded[e] = normalize_time(traktor_atrack(de, loc, audio, nml_version), trans)
+    return [decoded[e] for e in entries]
+
+
+def make_playlist(pl: ET.Element, pl_name: str, tracks: list[ATrack], folder: tuple[str, ...] = ()) -> APlaylist:
+    entries = get_playlist_entries(pl, pl_name)
+    apl = APlaylist(pl_name, tracks, folder)
     if apl.entries != entries:
         warnings.warn(f"Couldn't find all files in playlist {pl_name}.")
-        
     return apl
+
+
+def stream_traktor_playlist(nml_file: Path, pl_name: str) -> tuple[int, ET.Element, dict[str, ET.Element]]:
+    """Find a playlist and its COLLECTION entries parsing the file incrementally.
+
+    The COLLECTION precedes the PLAYLISTS in the NML file. Hence, a
+    first pass collects the primary keys of the playlist, and a second
+    one keeps only the matching COLLECTION ENTRY elements. All other
+    elements, including the CUE_V2 subtrees of the other entries, are
+    discarded as soon as they are parsed.
+
+    Returns:
+      The NML version, the playlist NODE and an index of the needed
+      COLLECTION entries.
+    """
+    version = None
+    pls = []
+    def is_playlist(tags: list[str], e: ET.Element) -> bool:
+        nonlocal version
+        if tags == ['NML']:
+            version = e.get('VERSION')
+            return False
+        else:
+            return (e.tag == 'NODE' and e.get('TYPE') == 'PLAYLIST' and e.get('NAME') == pl_name)
+
+    for e in iterparse_subtrees(nml_file, is_playlist):
+        pls.append(e)
+    nml_version = get_nml_version(version)
+    pl = select_playlist(pls, pl_name)
+    keys = set(k for k in get_playlist_keys(pl) if k is not None)
+
+    def is_entry(tags: list[str], e: ET.Element) -> bool:
+        return tags == ['NML', 'COLLECTION', 'ENTRY']
+
+    # The key is in the LOCATION sub-element: we can only check it
+    # once the ENTRY is complete.
+    found = set()
+    def is_needed(e: ET.Element) -> bool:
+        k = entry_primary_key(e)
+        if k in keys and k not in found:
+            found.add(k)
+            return True
+        else:
+            return False
+
+    # stop parsing as soon as all entries have been found.
+    entries = filter(is_needed, iterparse_subtrees(nml_file, is_entry))
+    return nml_version, pl, index_collection(itertools.islice(entries, len(keys)))
+
+
+def read_traktor_playlist(nml_file: Path, name: str | None, trans: ATransformation, anchor: Path | None = None, relative: Path | None = None, stream: bool = False, read_audio: bool = True, jobs: int = 1) -> APlaylist:
+    """Read a playlist from a Traktor NML file.
+
+    Args:
+      nml_file: The NML file.
+      name: The playlist name. If None, use the file name stem.
+      trans: The transformation being performed.
+      anchor: Path anchor to add to the track paths.
+      relative: Make the track paths relative to this path.
+      stream: Parse the file incrementally, keeping in memory only the
+        playlist and its tracks. Use this with a large 'collection.nml'.
+      read_audio: If False, use the values exported by Traktor and
+        open the audio files only when 'trans' requires it.
+      jobs: Number of threads used to open the audio files.
+    """
+    pl_name = nml_file.stem if name is None else name
+
+    if stream:
+        nml_version, pl, index = stream_traktor_playlist(nml_file, pl_name)
+    else:
+        root = ET.parse(nml_file).getroot()
+        nml_version = get_nml_version(root.get('VERSION'))
+        # find playlist
+        pl = select_playlist(root.findall('.//NODE[@TYPE="PLAYLIST"]'), pl_name)
+        # lookup entry in collection
+        col = root.find('COLLECTION')
+        if col is None:
+            raise ValueError(f'No COLLECTION in playlist {pl_name}: Corrupted file.')
+        index = index_collection(col.iter('ENTRY'))
+
+    return make_playlist(pl, pl_name, playlist_tracks(pl, index, nml_version, trans, anchor, relative, read_audio=read_audio, jobs=jobs))
+
+
+def read_traktor_library(nml_file: Path, trans: ATransformation, anchor: Path | None = None, relative: Path | None = None, read_audio: bool = True, jobs: int = 1) -> list[APlaylist]:
+    """Read all playlists from a Traktor NML file.
+
+    The file is parsed once and the whole PLAYLISTS NODE tree is
+    walked, FOLDER nodes and their SUBNODES included. Folders are
+    recorded in the 'folder' attribute of the playlists they contain
+    (the '$ROOT' folder is omitted). Each COLLECTION entry is decoded
+    once, and the resulting ATrack is shared by all playlists
+    including it.
+
+    Args:
+      nml_file: The NML file, e.g., 'collection.nml'.
+      trans: The transformation being performed.
+      anchor: Path anchor to add to the track paths.
+      relative: Make the track paths relative to this path.
+      read_audio: If False, use the values exported by Traktor and
+        open the audio files only when 'trans' requires it.
+      jobs: Number of threads used to open the audio files.
+
+    Returns:
+      The playlists in document order.
+    """
+    root = ET.parse(nml_file).getroot()
+    nml_version = get_nml_version(root.get('VERSION'))
+    col = root.find('COLLECTION')
+    if col is None:
+        raise ValueError(f'No COLLECTION in file {nml_file}: Corrupted file.')
+    index = index_collection(col.iter('ENTRY'))
+    decoded: dict[ET.Element, ATrack] = {}
+
+    def walk(node: ET.Element, folder: tuple[str, ...]) -> list[APlaylist]:
+        apls = []
+        for child in node.findall('./SUBNODES/NODE'):
+            name = child.get('NAME', '')
+            match child.get('TYPE'):
+                case 'FOLDER':
+                    apls += walk(child, folder + (name,))
+                case 'PLAYLIST':
+                    ats = playlist_tracks(child, index, nml_version, trans, anchor, relative, decoded, read_audio, jobs)
+                    apls.append(make_playlist(child, name, ats, folder))
+                case _:
+                    # SMARTLIST nodes are queries, not lists of tracks.
+                    pass
+        return apls
+
+    apls = []
+    # The top NODE is the root folder '$ROOT'.
+    for top in root.findall('./PLAYLISTS/NODE'):
+        apls += walk(top, ())
+    return apls
@@ -102,6 +102,42 @@ def traktor_attr_name(s: str) -> str | None:
         return s.upper()
 
 
+def traktor_attr_tag(s: str) -> str:
+    """Name of the NML tag holding the attribute of an ATrack field (as a string).
+    """
+    if is_entry_tag_attr(s):
+        return 'ENTRY'
+    elif is_album_tag_attr(s):
+        return 'ALBUM'
+    elif is_tempo_tag_attr(s):
+        return 'TEMPO'
+    elif is_musical_key_attr(s):
+        return 'MUSICAL_KEY'
+    else:
+        return 'INFO'
+
+
+# ATrack fields stored as text attributes of an ENTRY or of its sub-tags.
+TRAKTOR_TEXT_FIELDS = [
+    'title', 'artist', 'grouping', 'remixer', 'composer', 'album',
+    'genre', 'track_number', 'disc_number', 'release_date', 'play_count',
+    'tonality', 'label', 'comments', 'rating', 'total_time', 'bit_rate',
+    'sample_rate', 'locked', 'average_bpm', 'date_added',
+]
+
+def make_entry_attrs_map(fns: list[str]) -> dict[str, list[tuple[str, str]]]:
+    """Map each NML tag to the (attribute, ATrack field name) pairs it holds.
+    """
+    out = {}
+    for fn in fns:
+        an = traktor_attr_name(fn)
+        if an is not None:
+            out.setdefault(traktor_attr_tag(fn), []).append((an, fn))
+    return out
+
+TRAKTOR_ENTRY_ATTRS_MAP = make_entry_attrs_map(TRAKTOR_TEXT_FIELDS)
+
+
 #########################################################################
 
 def traktor_path(p: Path) -> str:
@@ -205,11 +205,13 @@ class APlaylist:
     name: str
     entries: int # number of tracks
     tracks: list[ATrack]
+    folder: tuple[str, ...] = () # enclosing folders, outermost first
 
-    def __init__(self, name, tracks):
+    def __init__(self, name, tracks, folder=()):
         self.name = name
         self.tracks = tracks
         self.entries = len(tracks)
+        self.folder = tuple(folder)
 
 @dataclass
 class ASoftwareInfo:
@@ -3,18 +3,20 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 from basic_colormath import get_delta_e
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import replace
 from datetime import date
 import mutagen.mp3
 from mutagen._file import FileType # pyright: ignore
 from pathlib import Path, PosixPath, WindowsPath
+from typing import Callable, Iterable, Iterator
 
-import itertools
 import os
 import re
 import typing
 import types
 import warnings
+import xml.etree.ElementTree as ET
 
 from .types import (
     AudioFileInaccessibleWarning,
@@ -124,21 +126,54 @@ def to_float(x: str | None) -> float | None:
             raise ValueError(f"Can't convert {x} to a float.")
 
 # base64 format: https://datatracker.ietf.org/doc/html/rfc4648.html
+BASE64_LEADING_RE = re.compile(rb'[A-Za-z0-9+/=]*')
+
 def get_leading_base64_part(byte_string: bytes) -> bytes:
     """Base64 leading part of a byte string.
     """
-    base64_chars = frozenset(b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=")
+    m = BASE64_LEADING_RE.match(byte_string)
+    assert m is not None # the pattern matches the empty string
+    return m.group()
 
-    def is_base64_char(byte_char: int) -> bool:
-        return byte_char in base64_chars
 
-    result_bytes = bytearray(itertools.takewhile(is_base64_char, iter(byte_string)))
+def inverse_dict(d: dict) -> dict:
+    return {value: key for key, value in d.items()}
 
-    return bytes(result_bytes)
+###### XML ######
 
+def iterparse_subtrees(xml_file: Path, select: Callable[[list[str], ET.Element], bool]) -> Iterator[ET.Element]:
+    """Incrementally parse an XML file and yield the selected elements.
 
-def inverse_dict(d: dict) -> dict:
-    return {value: key for key, value in d.items()}
+    'select' is called when an element starts with the list of tags
+    from the root to the element, and the element itself (its
+    attributes are available, its children are not). Selected
+    elements are yielded once complete, together with their subtree.
+
+    Every complete element that is not inside a selected subtree is
+    detached from its parent (selected ones after being yielded).
+    Memory use is therefore bounded by the subtrees kept by the
+    caller, not by the size of the file.
+    """
+    tags: list[str] = []
+    parents: list[ET.Element] = []
+    depth = None # depth of the selected element being parsed
+    with open(xml_file, 'rb') as f:
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                tags.append(elem.tag)
+                parents.append(elem)
+                if depth is None and select(tags, elem):
+                    depth = len(tags)
+            else:
+                if depth == len(tags):
+                    yield elem
+                    depth = None
+                parents.pop()
+                tags.pop()
+                if depth is None and len(parents) > 0:
+                    # previous siblings are already detached: this is
+                    # the first child.
+                    parents[-1].remove(elem)
 
 ###### COLORS ######
 
@@ -240,6 +275,15 @@ def beatgrid_offset(at: ATrack, trans: ATransformation, offset_sign: int) -> flo
             raise ValueError(f'{trans.target.software} currently not supported.')
 
 
+def needs_audio_encoder(aformat: AFormat, trans: ATransformation) -> bool:
+    """Whether 'beatgrid_offset' depends on the audio encoder for 'trans'.
+
+    This is the case for MP3 files converted from or to rekordbox.
+    """
+    return (aformat == AFormat.MP3 and
+            ASoftware.REKORDBOX in (trans.source.software, trans.target.software))
+
+
 def marker_offset(at: ATrack, trans: ATransformation, offset_sign: int) -> float:
     """Marker offset relative to Serato DJ Pro 3.3.2 in seconds.
 
@@ -377,21 +421,91 @@ def audio_endocer(audio: FileType) -> AEncoder | None:
             raise ValueError(f'audio_encoder: file format not supported.')
 
 
-def maybe_audio(path: Path) -> FileType | None:
+def open_audio(path: Path) -> FileType | None:
+    """Open an audio file with mutagen. Returns None if it doesn't exist.
+    """
     if path.exists() and path.is_file():
         audio = mutagen.File(path, easy=False) # pyright: ignore
         assert isinstance(audio, FileType)
         return audio
     else:
-        warnings.warn(
-            f"File {path} not found.\n"
-            f"For best Cue and beatgrid timing adjustment, djbabel needs access\n"
-            f"to the file (for reading).\n"
-            f"Further occurrences of similar messages will new be suppressed.",
-            AudioFileInaccessibleWarning
-        )
         return None
 
+
+def warn_audio_inaccessible(path: Path) -> None:
+    warnings.warn(
+        f"File {path} not found.\n"
+        f"For best Cue and beatgrid timing adjustment, djbabel needs access\n"
+        f"to the file (for reading).\n"
+        f"Further occurrences of similar messages will new be suppressed.",
+        AudioFileInaccessibleWarning
+    )
+
+
+def maybe_audio(path: Path) -> FileType | None:
+    audio = open_audio(path)
+    if audio is None:
+        warn_audio_inaccessible(path)
+    return audio
+
+
+def wants_audio(path: Path, read_audio: bool = True, trans: ATransformation | None = None) -> bool:
+    """Whether the audio file of a track has to be opened.
+
+    Args:
+      path: The audio file path.
+      read_audio: If False, the file is only needed when 'trans'
+        needs the audio encoder (see 'needs_audio_encoder').
+      trans: The transformation being performed.
+    """
+    return (read_audio or
+            (trans is not None and needs_audio_encoder(aformat_from_path(path), trans)))
+
+
+def track_audio(path: Path, read_audio: bool = True, trans: ATransformation | None = None) -> FileType | None:
+    """Open the audio file of a track when it's needed (see 'wants_audio').
+    """
+    return maybe_audio(path) if wants_audio(path, read_audio, trans) else None
+
+
+T = typing.TypeVar('T')
+R = typing.TypeVar('R')
+
+def thread_map(fn: Callable[[T], R], items: Iterable[T], jobs: int = 1) -> list[R]:
+    """Like 'map', but run 'fn' on a pool of 'jobs' threads.
+
+    The results are in the order of 'items'. If a call raises, the
+    exception of the first failing item is propagated.
+    """
+    if jobs <= 1:
+        return list(map(fn, items))
+    else:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            return list(executor.map(fn, items))
+
+
+def probe_audio_files(paths: Iterable[Path | None], jobs: int = 1) -> list[FileType | None]:
+    """Open audio files on a pool of 'jobs' threads.
+
+    Opening files is I/O bound and dominates the reading time on slow
+    storage. The warnings for inaccessible files are emitted after
+    probing, in the order of 'paths', independently of 'jobs'.
+
+    Args:
+      paths: The audio files. None entries are skipped.
+      jobs: Number of threads.
+
+    Returns:
+      The opened files (None if skipped or inaccessible) in the order
+      of 'paths'.
+    """
+    paths = list(paths)
+    audios = thread_map(lambda p: open_audio(p) if p is not None else None, paths, jobs)
+    for p, a in zip(paths, audios):
+        if p is not None and a is None:
+            warn_audio_inaccessible(p)
+    return audios
+
 #######################################################################
 # Predicates
 
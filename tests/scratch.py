@@ -39,7 +39,7 @@ from djbabel.serato.markers2 import CueEntry, LoopEntry, get_serato_markers_v2,
 from djbabel.serato.utils import audio_file_type, readbytes, serato_metadata, maybe_metadata, FMT_VERSION, readbytes
 from djbabel.serato.types import STag, SeratoTags, EntryBase
 from djbabel.serato.autotags import get_serato_autotags
-from djbabel.serato.overview import get_serato_overview, draw_waveform
+from djbabel.serato.overview import get_serato_overview
 from djbabel.serato.beatgrid import get_serato_beatgrid
 from djbabel.serato.markers import get_serato_markers
 from djbabel.serato.analysis import get_serato_analysis
@@ -947,7 +947,7 @@ for i, m in enumerate(a1.beatgrid):
 
 from datetime import datetime
 
-from djbabel.traktor.read import find_collection_entry, from_traktor, get_str_attr, is_entry_tag_attr, get_tag_attr, is_album_tag_attr, get_album_subtag, is_info_tag_attr, get_info_subtag, traktor_attr_name, get_album_subtag, is_musical_key_attr, to_date, get_location, to_bool, get_cue_v2_beatgrid, get_cue_v2_cues, get_loudness, read_traktor_playlist
+from djbabel.traktor.read import decode_entry, index_collection, from_traktor, to_date, to_bool, read_traktor_playlist
 
 trans = ATransformation(parse_input_format('traktor4'),
                         parse_output_format('rb7'))
@@ -960,17 +960,19 @@ pls = nml_root.findall('.//NODE[@TYPE="PLAYLIST"]')
 pl = pls[0]
 pl_keys = pl.findall('./PLAYLIST/ENTRY/PRIMARYKEY')
 
-e0 = find_collection_entry(nml_col, pl_keys[0].get('KEY'))
-e1 = find_collection_entry(nml_col, pl_keys[1].get('KEY'))
+nml_index = index_collection(nml_col.iter('ENTRY'))
+e0 = nml_index[pl_keys[0].get('KEY')]
+e1 = nml_index[pl_keys[1].get('KEY')]
 
-t0_title = get_str_attr('title', e0)
+de0 = decode_entry(e0)
+t0_title = de0['title']
 
 e0_cues = e0.findall('./CUE_V2[@TYPE!="4"]')
 
-e0_bg = get_cue_v2_beatgrid(e0)
-e0_cues = get_cue_v2_cues(e0)
+e0_bg = de0['beatgrid']
+e0_cues = de0['markers']
 
-e0_ldns = get_loudness(e0)
+e0_ldns = de0['loudness']
 
 at0 = from_traktor(e0, 20)
 at1 = from_traktor(e1, 20)
@@ -1022,7 +1024,7 @@ audio_pif = mutagen.File(file_pif, easy=False)
 # RekordBox read
 
 from datetime import datetime
-from djbabel.rekordbox.read import read_rekordbox_playlist, get_color
+from djbabel.rekordbox.read import read_rekordbox_playlist, rb_color
 from urllib.request import url2pathname
 from urllib.parse import urlparse
 from djbabel.serato.read import parse_color
@@ -20,17 +20,19 @@ from djbabel.rekordbox.write import (
 
 from djbabel.rekordbox.types import RBPlaylistKeyType
 
+from djbabel.rekordbox.utils import REKORDBOX_TEXT_FIELDS, rb_attr_name
+
 from djbabel.rekordbox.read import(
-    find_collection_entry,
-    get_tag_attr,
-    get_tonality,
+    abbrev_to_classic_key,
+    decode_track,
     file_size,
     audio_length,
-    get_beatgrid,
-    get_markers,
-    get_color,
     get_playlist_key_type,
     get_rb_location,
+    index_collection,
+    stream_rekordbox_playlist,
+    lookup_collection_entry,
+    read_rekordbox_library,
     read_rekordbox_playlist
 )
 
@@ -208,8 +210,9 @@ class TestRekordboxReadTags:
     pls = root.findall('.//NODE[@Type="1"]')
     pl = list(filter(lambda pl: pl.attrib['Name'] == 'rbxml_test', pls))[0]
     pl_keys = pl.findall('./TRACK')
-    e0 = find_collection_entry(col, pl_keys[0].get('Key'), RBPlaylistKeyType.TRACK_ID)
-    e1 = find_collection_entry(col, pl_keys[1].get('Key'), RBPlaylistKeyType.TRACK_ID)
+    index = index_collection(col.iter('TRACK'), [RBPlaylistKeyType.TRACK_ID])
+    e0 = lookup_collection_entry(index, pl_keys[0].get('Key'), RBPlaylistKeyType.TRACK_ID)
+    e1 = lookup_collection_entry(index, pl_keys[1].get('Key'), RBPlaylistKeyType.TRACK_ID)
 
 
     @pytest.mark.parametrize("fn, expected", [
@@ -218,15 +221,15 @@ class TestRekordboxReadTags:
         ('not_defined', None),
         ('', None),
     ])
-    def test_rekordbox_get_tag_attr(self, fn, expected):
+    def test_rekordbox_decode_track_attr(self, fn, expected):
         assert self.e0 is not None
-        result = get_tag_attr(fn, self.e0)
+        result = decode_track(self.e0).get(fn)
         assert result == expected
 
 
-    def test_rekordbox_get_tonality(self):
+    def test_rekordbox_decode_track_tonality(self):
         assert self.e0 is not None
-        result = get_tonality(self.e0)
+        result = abbrev_to_classic_key(decode_track(self.e0)['tonality'])
         assert result == 'Bbmaj'
 
 
@@ -236,9 +239,9 @@ class TestRekordboxReadTags:
         assert result.as_posix() == path_anchor(None).as_posix() + 'tests/audio/crate_write_test.mp3'
 
 
-    def test_rekordbox_get_beatgrid(self):
+    def test_rekordbox_decode_track_beatgrid(self):
         assert self.e0 is not None
-        result = get_beatgrid(self.e0)
+        result = decode_track(self.e0)['beatgrid']
         assert result == [
             ABeatGridBPM(
                 position=5.803330421447754,
@@ -253,9 +256,9 @@ class TestRekordboxReadTags:
         ]
 
 
-    def test_rekordbox_get_markers(self):
+    def test_rekordbox_decode_track_markers(self):
         assert self.e0 is not None
-        result = get_markers(self.e0)
+        result = decode_track(self.e0)['markers']
         assert result == [
             AMarker(name='intro',
                     color=AMarkerColors.MAGENTA,
@@ -303,6 +306,36 @@ class TestRekordboxReadTags:
         ]
 
 
+    @pytest.mark.parametrize("entry", [e0, e1])
+    def test_rekordbox_decode_track(self, entry):
+        assert entry is not None
+        e = decode_track(entry)
+        for fn in REKORDBOX_TEXT_FIELDS:
+            assert e[fn] == (entry.get(rb_attr_name(fn)) or None)
+        assert len(e['beatgrid']) == len(entry.findall('TEMPO'))
+        assert len(e['markers']) == len(entry.findall('POSITION_MARK'))
+
+
+    @pytest.mark.parametrize("key, key_type", [
+        ('0', RBPlaylistKeyType.TRACK_ID),
+        ('file://localhost/tests/audio/crate_write_test.mp3', RBPlaylistKeyType.LOCATION),
+        ('file:///tests/audio/crate%5Fwrite%5Ftest.mp3', RBPlaylistKeyType.LOCATION),
+    ])
+    def test_rekordbox_lookup_collection_entry(self, key, key_type):
+        index = index_collection(self.col.iter('TRACK'), [key_type])
+        result = lookup_collection_entry(index, key, key_type)
+        assert result is self.e0
+
+
+    def test_rekordbox_index_collection_key_types(self):
+        # Location keys are only normalized when asked for
+        assert list(self.index) == [RBPlaylistKeyType.TRACK_ID]
+        assert self.col is not None
+        index = index_collection(self.col.iter('TRACK'), RBPlaylistKeyType)
+        assert list(index) == list(RBPlaylistKeyType)
+        assert index[RBPlaylistKeyType.TRACK_ID] == self.index[RBPlaylistKeyType.TRACK_ID]
+
+
     def test_rekordbox_read_playlist(self):
         assert self.e0 is not None
         result = read_rekordbox_playlist(self.xml_path, None, self.trans)
@@ -313,3 +346,57 @@ class TestRekordboxReadTags:
             'Pump Up The Volume',
             'Go',
         ]
+
+
+    def test_rekordbox_stream_playlist(self):
+        rb_version, pl, index = stream_rekordbox_playlist(self.xml_path, 'rbxml_test')
+        assert rb_version == [7, 1, 3]
+        assert [t.get('Key') for t in pl.findall('./TRACK')] == ['0', '1', '2']
+        assert sorted(index[RBPlaylistKeyType.TRACK_ID].keys()) == ['0', '1', '2']
+        e0 = index[RBPlaylistKeyType.TRACK_ID]['0']
+        assert len(e0.findall('POSITION_MARK')) == 5
+        assert len(e0.findall('TEMPO')) == 2
+
+
+    def test_rekordbox_read_playlist_stream(self):
+        result = read_rekordbox_playlist(self.xml_path, None, self.trans, stream=True)
+        expected = read_rekordbox_playlist(self.xml_path, None, self.trans)
+        assert result == expected
+
+
+    def test_rekordbox_read_playlist_jobs(self):
+        result = read_rekordbox_playlist(self.xml_path, None, self.trans, jobs=3)
+        expected = read_rekordbox_playlist(self.xml_path, None, self.trans)
+        assert result == expected
+
+
+    def test_rekordbox_read_playlist_no_audio(self):
+        result = read_rekordbox_playlist(self.xml_path, None, self.trans, read_audio=False)
+        expected = read_rekordbox_playlist(self.xml_path, None, self.trans)
+        # MP3 files are still read for the encoder dependent beatgrid offset
+        assert result.tracks[0] == expected.tracks[0]
+        assert result.tracks[1].size == 20794
+        assert result.tracks[1].total_time == 1.0
+        assert result.tracks[1].aformat == expected.tracks[1].aformat
+        assert result.tracks[1].data_source.encoder is None
+
+
+    def test_rekordbox_read_library(self, tmp_path):
+        root = ET.parse(self.xml_path).getroot()
+        top = root.find('./PLAYLISTS/NODE')
+        assert top is not None
+        folder = ET.SubElement(top, 'NODE', Type="0", Name="house", Count="1")
+        pl = ET.SubElement(folder, 'NODE', Name="go", Type="1", KeyType="0", Entries="2")
+        ET.SubElement(pl, 'TRACK', Key="2")
+        ET.SubElement(pl, 'TRACK', Key="0")
+        xml_path = tmp_path / 'library.xml'
+        ET.ElementTree(root).write(xml_path, "utf-8", True)
+
+        result = read_rekordbox_library(xml_path, self.trans)
+        assert [(apl.folder, apl.name, apl.entries) for apl in result] == [
+            ((), 'rbxml_test', 3),
+            (('house',), 'go', 2),
+        ]
+        # tracks are decoded once and shared between playlists
+        assert result[1].tracks[0] is result[0].tracks[2]
+        assert result[1].tracks[1] is result[0].tracks[0]
@@ -2,9 +2,13 @@
 #
 # SPDX-License-Identifier: CC0-1.0
 
+import base64
 from datetime import date
 import datetime
 import mutagen
+from mutagen.flac import Picture
+from mutagen.id3 import APIC, GEOB # pyright: ignore
+from mutagen.mp4 import AtomDataType, MP4Cover, MP4FreeForm
 from pathlib import Path, PurePosixPath, PureWindowsPath
 import pytest
 
@@ -22,12 +26,14 @@ from djbabel.types import (
     AMarkerType,
     AMarkerColors,
     AEncoder,
-    AEncoderMode
+    AEncoderMode,
+    AudioFileInaccessibleWarning
 )
 
-from djbabel.utils import to_float
+from djbabel.utils import audio_file_type, to_float
 
 from djbabel.serato.markers2 import (
+    ATRACK_ENTRIES,
     CueEntry,
     get_serato_markers_v2,
     ColorEntry,
@@ -36,19 +42,25 @@ from djbabel.serato.markers2 import (
 )
 
 from djbabel.serato.utils import (
+    SeratoAudio,
+    b64decode_lines,
+    parse_serato_envelope,
+    serato_tag_marker,
     serato_metadata,
     maybe_metadata,
     serato_tag_name
 )
 
 from djbabel.serato.types import SeratoTags
+from djbabel.serato.audio import load_audio_tags
+from djbabel.serato.patch import locate_payloads, patch_serato_payloads, payload_key
+from djbabel.serato import markers
 
 from djbabel.serato.read import (
     std_tag_text,
     track_number,
     release_date,
     location,
-    audio_file_type,
     beatgrid,
     get_markers,
     locked,
@@ -57,8 +69,12 @@ from djbabel.serato.read import (
     data_source,
     get_serato_markers_v2,
     from_serato,
+    open_serato_audio,
+    read_serato_library,
     read_serato_playlist
 )
+import djbabel.serato.read as serato_read
+import djbabel.serato.write as serato_write
 
 from djbabel.serato.write import (
     to_serato_analysis,
@@ -72,9 +88,45 @@ from djbabel.serato.write import (
     dump_serato_markers_v2,
     add_envelope,
     dump_serato_markers,
+    insert_newlines,
+    remove_b64padding,
+    probe_std_tags,
+    resolve_overwrite,
+    SeratoWriteReport,
     to_serato_playlist,
+    write_serato_crate,
 )
 
+from djbabel.serato.crate.read import (
+    Artist,
+    BPM,
+    BeatgridLocked,
+    Bitrate,
+    ColumnName,
+    FilePath,
+    FileSize,
+    FileType,
+    Key,
+    Length,
+    Missing,
+    ReverseOrder,
+    SampleRate,
+    SongTitle,
+    Sorting,
+    Track,
+    TrackPath,
+    UnknownTextField,
+    Version,
+    Year,
+    crate_track_paths,
+    get_track_paths,
+    iter_track_paths,
+    parse_fields,
+    take_fields,
+)
+from djbabel.serato.crate.write import write_fields
+from djbabel.serato.database import read_serato_database
+
 ###############################################################
 # Read files
 
@@ -327,6 +379,120 @@ class TestSeratoReadTags:
         result = data_source(audio)
         assert result == expected
 
+    @pytest.mark.parametrize("audio", [audio_mp3, audio_flac, audio_m4a])
+    def test_serato_audio_view(self, audio):
+        view = SeratoAudio(audio)
+        assert from_serato(view) == from_serato(audio)
+        # each Serato tag is decoded once
+        assert sorted(stag.name for stag, _ in view.decoded) == [
+            'ANALYSIS', 'AUTOTAGS', 'BEATGRID', 'MARKERS2'
+        ]
+
+
+    @pytest.mark.parametrize("audio", [audio_mp3, audio_flac, audio_m4a])
+    def test_serato_markers_v2_entries(self, audio):
+        entries = get_serato_markers_v2(audio)
+        result = get_serato_markers_v2(audio, ATRACK_ENTRIES)
+        assert result == [e for e in entries if e.NAME in ATRACK_ENTRIES]
+        assert get_serato_markers_v2(audio, frozenset(['BPMLOCK'])) == [
+            e for e in entries if isinstance(e, BpmLockEntry)
+        ]
+
+
+    @pytest.mark.parametrize("audio, parse, dump", [
+        (audio_mp3, markers.parse, markers.dump),
+        (audio_m4a, markers.parse_m4a, markers.dump_m4a),
+    ])
+    def test_serato_markers_roundtrip(self, audio, parse, dump):
+        data = serato_metadata(audio, SeratoTags.MARKERS)
+        entries = parse(data)
+        assert parse(dump(entries)) == entries
+        with pytest.raises(AssertionError):
+            parse(data[:len(data) // 2])
+
+
+    def test_serato_overview(self):
+        # pillow is an optional dependency
+        pytest.importorskip('PIL')
+        from djbabel.serato.overview import parse_overview, waveform_color
+        values = bytes(range(256)) * 15
+        ov, = parse_overview(b'\x01\x05' + values)
+        assert 'img' not in ov.__dict__ # rendered lazily
+        img = ov.img
+        assert img.size == (240, 16)
+        for i in range(0, 240, 7):
+            column = values[16 * i:16 * (i + 1)]
+            factor = len([x for x in column if x < 0x80]) / 16
+            for j, value in enumerate(column):
+                assert img.getpixel((i, j)) == waveform_color(factor, value)
+
+
+    @pytest.mark.parametrize("path", [file_mp3, file_flac, file_m4a])
+    def test_serato_load_audio_tags(self, path):
+        result = load_audio_tags(path)
+        expected = mutagen.File(path, easy=False)
+        assert type(result) is type(expected)
+        assert from_serato(result) == from_serato(expected) # pyright: ignore
+
+
+    @pytest.mark.parametrize("path", [file_mp3, file_flac, file_m4a])
+    def test_serato_load_audio_tags_serato_only(self, path):
+        result = from_serato(load_audio_tags(path, serato_only=True)) # pyright: ignore
+        expected = from_serato(mutagen.File(path, easy=False)) # pyright: ignore
+        # text tags of the database fields are loaded, the others aren't
+        assert (result.title, result.artist, result.comments) == (expected.title, expected.artist, expected.comments)
+        assert result.track_number is None
+        assert (result.markers, result.beatgrid, result.color) == (expected.markers, expected.beatgrid, expected.color)
+        assert (result.loudness, result.data_source) == (expected.loudness, expected.data_source)
+
+
+    @pytest.mark.parametrize("v2_version", [3, 4])
+    def test_serato_load_mp3_tags_skip_frames(self, tmp_path, v2_version):
+        path = tmp_path / 'test.mp3'
+        path.write_bytes(self.file_mp3.read_bytes())
+        audio = mutagen.File(path, easy=False)
+        audio.tags.add(APIC(encoding=3, mime='image/jpeg', type=3, desc='cover', data=b'\xff' * 100000)) # pyright: ignore
+        audio.tags.add(GEOB(encoding=0, mime='text/plain', filename='', desc='Other', data=b'other')) # pyright: ignore
+        audio.save(v2_version=v2_version) # pyright: ignore
+        expected = mutagen.File(path, easy=False)
+
+        result = load_audio_tags(path)
+        assert set(expected.tags.keys()) - set(result.tags.keys()) == {'APIC:cover'} # pyright: ignore
+        assert result.tags.unknown_frames == [] # pyright: ignore
+        assert from_serato(result) == from_serato(expected) # pyright: ignore
+
+
+    def test_serato_load_flac_tags_skip_blocks(self, tmp_path):
+        path = tmp_path / 'test.flac'
+        path.write_bytes(self.file_flac.read_bytes())
+        audio = mutagen.File(path, easy=False)
+        pic = Picture()
+        pic.data = b'\xff' * 100000
+        audio.add_picture(pic) # pyright: ignore
+        audio['other'] = 'other' # pyright: ignore
+        audio.save() # pyright: ignore
+        expected = mutagen.File(path, easy=False)
+
+        result = load_audio_tags(path)
+        assert result.pictures == [] # pyright: ignore
+        assert set(expected.tags.keys()) - set(result.tags.keys()) == {'other'} # pyright: ignore
+        assert from_serato(result) == from_serato(expected) # pyright: ignore
+
+
+    def test_serato_load_m4a_tags_skip_atoms(self, tmp_path):
+        path = tmp_path / 'test.m4a'
+        path.write_bytes(self.file_m4a.read_bytes())
+        audio = mutagen.File(path, easy=False)
+        audio['covr'] = [MP4Cover(b'\xff' * 100000)] # pyright: ignore
+        audio['----:com.other:other'] = [MP4FreeForm(b'other')] # pyright: ignore
+        audio.save() # pyright: ignore
+        expected = mutagen.File(path, easy=False)
+
+        result = load_audio_tags(path)
+        assert set(expected.tags.keys()) - set(result.tags.keys()) == {'covr', '----:com.other:other'} # pyright: ignore
+        assert from_serato(result) == from_serato(expected) # pyright: ignore
+
+
 ###############################################################
 # Write files
 
@@ -391,6 +557,37 @@ class TestSeratoWriteTags:
             result = None
         assert result == expected
 
+    @pytest.mark.parametrize("data, expected", [
+        (b'a' * 72, b'a' * 72),
+        (b'a' * 73, b'a' * 72 + b'\na'),
+        (b'a' * 144, b'a' * 72 + b'\n' + b'a' * 72),
+    ])
+    def test_serato_insert_newlines(self, data, expected):
+        assert insert_newlines(data) == expected
+
+
+    @pytest.mark.parametrize("data, expected", [
+        (b'AAAA', b'AAAA'),
+        (b'AAA=', b'AA'),
+        (b'AA==', b'A'),
+        (b'AB==', b'AB'),
+        (b'AAA\n==', b'AAA\n'),
+    ])
+    def test_serato_remove_b64padding(self, data, expected):
+        assert remove_b64padding(data) == expected
+
+
+    @pytest.mark.parametrize("stag", [SeratoTags.MARKERS2, SeratoTags.ANALYSIS, SeratoTags.OVERVIEW])
+    @pytest.mark.parametrize("size", [0, 1, 2, 100, 1000])
+    def test_serato_envelope_roundtrip(self, stag, size):
+        # MARKERS2 data is base64 text: no '=' chars
+        data = (bytes(b for b in range(256) if b != ord('=')) * 4)[:size]
+        marker = serato_tag_marker(stag)
+        result = parse_serato_envelope(add_envelope(data, stag), marker)
+        assert result[:size] == data
+        assert b64decode_lines(insert_newlines(base64.b64encode(data).rstrip(b'='))) == data
+
+
 ###############################################################
 # Crates
 
@@ -416,6 +613,29 @@ class TestSeratoCrate:
         a.save()                            # pyright: ignore
 
 
+    def write_playlist_copy(self, tmp_path: Path, name: str, clear: bool, **kwargs) -> tuple[APlaylist, list[Path], Path, SeratoWriteReport]:
+        """Copy the reference audio files to 'tmp_path' and write the
+        playlist of their tracks with 'to_serato_playlist' and 'kwargs'.
+
+        Returns:
+          The playlist, the copied files, the crate and the report.
+        """
+        crate = tmp_path / f'{name}.crate'
+        files = [tmp_path / p.name for p in [self.file_mp3, self.file_flac, self.file_m4a]]
+        for ref, p in zip([self.file_mp3_ref, self.file_flac_ref, self.file_m4a_ref], files):
+            p.write_bytes(ref.read_bytes())
+            if clear:
+                self.clear_tags(p)
+
+        tracks = [from_serato(a) for a in [self.audio_mp3_ref, self.audio_flac_ref, self.audio_m4a_ref]] # pyright: ignore
+        for at, p in zip(tracks, files):
+            at.location = p
+
+        apl = APlaylist(name, tracks)
+        report = to_serato_playlist(apl, crate, self.trans, **kwargs)
+        return apl, files, crate, report
+
+
     def test_serato_playlist(self):
         crate = Path("tests") / 'subcrates' / 'crate_write_test.crate'
 
@@ -436,3 +656,309 @@ class TestSeratoCrate:
         apl = read_serato_playlist(crate, self.trans, anchor=Path(""))
 
         assert apl == apl_ref
+        assert read_serato_playlist(crate, self.trans, anchor=Path(""), jobs=3) == apl_ref
+        assert read_serato_playlist(crate, self.trans, anchor=Path(""), jobs=2, processes=True) == apl_ref
+
+
+    @pytest.mark.parametrize("jobs", [1, 3])
+    def test_serato_playlist_jobs(self, tmp_path, monkeypatch, jobs):
+        crate = tmp_path / 'crate_jobs_test.crate'
+
+        for a in [self.file_mp3, self.file_flac, self.file_m4a]:
+            self.clear_tags(a)
+
+        at_mp3 = from_serato(self.audio_mp3_ref) # pyright: ignore
+        at_mp3.location = self.file_mp3
+        at_flac = from_serato(self.audio_flac_ref) # pyright: ignore
+        at_flac.location = self.file_flac
+        at_m4a = from_serato(self.audio_m4a_ref) # pyright: ignore
+        at_m4a.location = self.file_m4a
+        at_missing = from_serato(self.audio_mp3_ref) # pyright: ignore
+        at_missing.location = tmp_path / 'missing.mp3'
+
+        # no existing standard tags: no questions
+        def no_input(prompt):
+            raise AssertionError(prompt)
+        monkeypatch.setattr('builtins.input', no_input)
+
+        apl_ref = APlaylist('crate_jobs_test', [at_mp3, at_missing, at_flac, at_m4a])
+        report = to_serato_playlist(apl_ref, crate, self.trans, jobs=jobs)
+
+        assert report.written == [self.file_mp3, self.file_flac, self.file_m4a]
+        assert [p for p, _ in report.errors] == [at_missing.location]
+        # the crate lists all tracks
+        assert len(list(iter_track_paths(crate.read_bytes()))) == 4
+        for at in [at_mp3, at_flac, at_m4a]:
+            written = from_serato(mutagen.File(at.location, easy=False)) # pyright: ignore
+            assert written == at
+
+
+    @pytest.mark.parametrize("jobs", [1, 3])
+    def test_serato_playlist_jobs_duplicates(self, tmp_path, monkeypatch, jobs):
+        crate = tmp_path / 'crate_duplicates_test.crate'
+        path = tmp_path / self.file_mp3.name
+        path.write_bytes(self.file_mp3_ref.read_bytes())
+
+        at = from_serato(self.audio_mp3_ref) # pyright: ignore
+        at.location = path
+
+        written = []
+        to_serato = serato_write.to_serato
+        def counting_to_serato(at, *args, **kwargs):
+            written.append(at.location)
+            return to_serato(at, *args, **kwargs)
+        monkeypatch.setattr(serato_write, 'to_serato', counting_to_serato)
+
+        apl = APlaylist('crate_duplicates_test', [at, at, at])
+        report = to_serato_playlist(apl, crate, self.trans, 'N', jobs=jobs)
+
+        # a single writer per file, its result for all the entries
+        assert written == [path]
+        assert report.unchanged == [path, path, path]
+        assert len(list(iter_track_paths(crate.read_bytes()))) == 3
+
+
+    def test_serato_playlist_skipped(self, tmp_path):
+        crate = tmp_path / 'crate_skipped_test.crate'
+        at = from_serato(self.audio_mp3_ref) # pyright: ignore
+        # not an audio file: mutagen can't open it
+        at.location = tmp_path / 'unknown.txt'
+        at.location.write_bytes(b'')
+
+        with pytest.warns(UserWarning, match='not accessible'):
+            report = to_serato_playlist(APlaylist('crate_skipped_test', [at]), crate, self.trans, 'N')
+
+        assert report.skipped == [at.location]
+        assert (report.written, report.unchanged, report.errors) == ([], [], [])
+
+
+    def test_serato_playlist_unchanged(self, tmp_path):
+        apl, files, crate, report = self.write_playlist_copy(tmp_path, 'crate_unchanged_test', True, overwrite='Y')
+        assert report.written == files
+        assert report.unchanged == []
+
+        mtimes = [p.stat().st_mtime_ns for p in files]
+        report = to_serato_playlist(apl, crate, self.trans, 'Y')
+        assert report.written == []
+        assert report.unchanged == files
+        assert [p.stat().st_mtime_ns for p in files] == mtimes
+
+        apl.tracks[1].title = 'changed title'
+        report = to_serato_playlist(apl, crate, self.trans, 'Y', jobs=2)
+        assert report.written == [files[1]]
+        assert report.unchanged == [files[0], files[2]]
+
+
+    def test_serato_playlist_padding(self, tmp_path):
+        # the tags don't fit in the cleared files
+        apl, files, crate, report = self.write_playlist_copy(tmp_path, 'crate_padding_test', True, overwrite='Y', headroom=4096)
+        assert report.written == files
+        assert report.rewritten == files
+
+        # longer tags fit in the reserved space
+        sizes = [p.stat().st_size for p in files]
+        for at in apl.tracks:
+            at.comments = 'x' * 2000
+        report = to_serato_playlist(apl, crate, self.trans, 'Y', headroom=4096)
+        assert report.written == files
+        assert report.rewritten == []
+        assert [p.stat().st_size for p in files] == sizes
+
+        # shorter tags keep the padding
+        for at in apl.tracks:
+            at.comments = 'x'
+        report = to_serato_playlist(apl, crate, self.trans, 'Y', headroom=4096)
+        assert report.rewritten == []
+        assert [p.stat().st_size for p in files] == sizes
+
+
+    def test_serato_playlist_patch(self, tmp_path):
+        apl, files, crate, report = self.write_playlist_copy(tmp_path, 'crate_patch_test', False, patch=True)
+        assert report.unchanged == files
+
+        # moving a cue keeps the size of the tags
+        sizes = [p.stat().st_size for p in files]
+        for at in apl.tracks:
+            at.markers[0].start += 1.5
+        report = to_serato_playlist(apl, crate, self.trans, patch=True, jobs=2)
+        assert report.patched == files
+        assert [p.stat().st_size for p in files] == sizes
+        for at in apl.tracks:
+            written = from_serato(mutagen.File(at.location, easy=False)) # pyright: ignore
+            assert written == at
+
+        # without Serato tags in the file, it's saved by mutagen
+        self.clear_tags(files[0])
+        report = to_serato_playlist(apl, crate, self.trans, patch=True)
+        assert report.written == files[:1]
+        assert report.patched == []
+        audio = mutagen.File(files[0], easy=False) # pyright: ignore
+        assert 'GEOB:Serato Markers2' in audio.tags # pyright: ignore
+        # only the Serato tags are written
+        assert 'TIT2' not in audio.tags # pyright: ignore
+
+        # a missing file can't be patched: reported by the normal write path
+        missing = tmp_path / 'missing.mp3'
+        assert patch_serato_payloads(missing, AFormat.MP3, {}) is None
+        at_missing = from_serato(self.audio_mp3_ref) # pyright: ignore
+        at_missing.location = missing
+        report = to_serato_playlist(APlaylist('crate_patch_test', [at_missing]), crate, self.trans, patch=True)
+        assert [p for p, _ in report.errors] == [missing]
+
+
+    def test_serato_locate_m4a_payloads_data_type(self, tmp_path):
+        path = tmp_path / self.file_m4a.name
+        path.write_bytes(self.file_m4a_ref.read_bytes())
+        key = payload_key(SeratoTags.MARKERS2, AFormat.M4A)
+        with open(path, 'rb') as f:
+            assert locate_payloads(f, AFormat.M4A, {key})[key] is not None
+
+        # not the data type written by Serato: left to mutagen
+        audio = mutagen.File(path, easy=False)
+        audio[key] = [MP4FreeForm(bytes(audio[key][0]), dataformat=AtomDataType.JPEG)] # pyright: ignore
+        audio.save() # pyright: ignore
+        with open(path, 'rb') as f:
+            assert locate_payloads(f, AFormat.M4A, {key})[key] is None
+
+
+    def test_serato_resolve_overwrite(self, monkeypatch):
+        at_mp3 = from_serato(self.audio_mp3_ref) # pyright: ignore
+        at_flac = from_serato(self.audio_flac_ref) # pyright: ignore
+        answers = iter(['n', 'y', 'N'])
+        monkeypatch.setattr('builtins.input', lambda prompt: next(answers))
+
+        plan_mp3, overwrite = resolve_overwrite(at_mp3, probe_std_tags(at_mp3), 'n')
+        plan_flac, overwrite = resolve_overwrite(at_flac, probe_std_tags(at_flac), overwrite)
+
+        # title refused, artist accepted, then no to all
+        assert overwrite == 'N'
+        assert (plan_mp3, plan_flac) == (frozenset(['TPE1']), None)
+
+
+    def test_serato_resolve_overwrite_unreadable(self, tmp_path, monkeypatch):
+        at = from_serato(self.audio_mp3_ref) # pyright: ignore
+        # not an audio file: mutagen can't open it
+        at.location = tmp_path / 'unknown.txt'
+        at.location.write_bytes(b'')
+        monkeypatch.setattr('builtins.input', lambda prompt: pytest.fail('unexpected question'))
+
+        assert probe_std_tags(at) == {}
+        assert resolve_overwrite(at, probe_std_tags(at), 'n') == (frozenset(), 'n')
+
+
+    def test_serato_crate_write(self, tmp_path):
+        crate = tmp_path / 'test.crate'
+        locations = [Path('/Music') / f'{i} - é.mp3' for i in range(5)]
+        with open(crate, 'wb') as f:
+            n = write_serato_crate(f, iter(locations))
+        assert n == crate.stat().st_size
+        assert list(crate_track_paths(crate)) == [p.relative_to(p.anchor) for p in locations]
+
+        fields = [
+            Version(value='1.0/Serato ScratchLive Crate'),
+            Sorting(value=[ColumnName(value='#'), ReverseOrder(value=False)]),
+            Track([TrackPath(Path('Music') / 'a.mp3'), Artist('é'), Missing(True)]),
+        ]
+        with open(crate, 'wb') as f:
+            write_fields(f, (e for e in fields))
+        assert parse_fields(crate.read_bytes()) == fields
+        assert parse_fields(memoryview(crate.read_bytes())) == fields
+        with open(crate, 'wb') as f, pytest.raises(ValueError, match="encode_field: field b'tabc'"):
+            write_fields(f, iter([UnknownTextField(b'tabc', 'x')]))
+
+
+    def test_serato_crate_track_paths(self, tmp_path):
+        crate = tmp_path / 'test.crate'
+        paths = [Path('Music') / f'{i} - é.mp3' for i in range(5)]
+        fields = [
+            Version(value='1.0/Serato ScratchLive Crate'),
+            Sorting(value=[ColumnName(value='#'), ReverseOrder(value=False)]),
+            *[Track([TrackPath(p)]) for p in paths],
+            # not a single path: skipped
+            Track([TrackPath(paths[0]), TrackPath(paths[1])]),
+        ]
+        with open(crate, 'wb') as f:
+            write_fields(f, fields)
+
+        with open(crate, 'rb') as f:
+            expected = get_track_paths(take_fields(f))
+        assert expected == paths
+        assert list(iter_track_paths(crate.read_bytes())) == paths
+        assert list(crate_track_paths(crate)) == paths
+
+        crate.write_bytes(b'')
+        assert list(crate_track_paths(crate)) == []
+
+
+    def test_serato_playlist_database(self, tmp_path):
+        crate = tmp_path / 'test.crate'
+        db = tmp_path / 'database V2'
+        offline = Path("tests") / "audio" / "offline.mp3"
+        with open(crate, 'wb') as f:
+            write_fields(f, [Version(value='1.0/Serato ScratchLive Crate'),
+                             Track([TrackPath(self.file_mp3_ref)]),
+                             Track([TrackPath(offline)])])
+        with open(db, 'wb') as f:
+            write_fields(f, [
+                Version(value='2.0/Serato Scratch LIVE Database'),
+                Track([FilePath(self.file_mp3_ref), SongTitle('DB Title'), BPM('126.00'),
+                       Length('00:01.00'), FileSize('0.1MB'), Bitrate('128.0kbps'), Year('0')]),
+                Track([FilePath(Path('not/in/crate.mp3')), SongTitle('Other')]),
+                Track([FileType('mp3'), FilePath(offline), SongTitle('Offline'),
+                       Artist('Someone'), Key('Am'), BPM('126.00'), Length('04:17.45'),
+                       FileSize('9.8MB'), Bitrate('320.0kbps'), SampleRate('44.1k'),
+                       Year('1988'), BeatgridLocked(True)]),
+            ])
+
+        assert set(read_serato_database(db)) == {self.file_mp3_ref, Path('not/in/crate.mp3'), offline}
+        assert set(read_serato_database(db, [offline])) == {offline}
+
+        with pytest.warns(AudioFileInaccessibleWarning):
+            apl = read_serato_playlist(crate, self.trans, anchor=Path(""), database=db)
+        online, off = apl.tracks
+        full = from_serato(self.audio_mp3_ref) # pyright: ignore
+        # metadata from the database, or from the audio file when missing from it
+        assert (online.title, online.artist, online.average_bpm) == ('DB Title', full.artist, 126.0)
+        # year 0 (no year in Serato) is missing
+        assert (online.album, online.genre, online.release_date) == (full.album, full.genre, full.release_date)
+        # Serato tags from the audio file
+        assert (online.markers, online.beatgrid, online.color) == (full.markers, full.beatgrid, full.color)
+        assert (online.loudness, online.data_source) == (full.loudness, full.data_source)
+        # exact values from the audio file, not the rounded database ones
+        assert (online.total_time, online.size, online.bit_rate, online.sample_rate) == (full.total_time, full.size, full.bit_rate, full.sample_rate)
+        assert (off.title, off.artist, off.tonality, off.average_bpm) == ('Offline', 'Someone', 'Am', 126.0)
+        assert (off.total_time, off.size, off.bit_rate, off.sample_rate) == (257.45, 10276045, 320000, 44100.0)
+        assert off.release_date == date(1988, 1, 1)
+        assert off.aformat == AFormat.MP3 and off.location == offline and off.locked
+        assert off.markers == [] and off.beatgrid == []
+
+        with pytest.warns(AudioFileInaccessibleWarning):
+            assert read_serato_playlist(crate, self.trans, anchor=Path(""), database=db, jobs=2, processes=True) == apl
+
+
+    def test_serato_library(self, tmp_path, monkeypatch):
+        crates = {
+            'A': [self.file_mp3_ref, self.file_flac_ref],
+            'A%%B': [self.file_mp3_ref],
+            'A%%B%%C': [self.file_flac_ref, self.file_m4a_ref],
+            'D': [self.file_m4a_ref],
+        }
+        for name, paths in crates.items():
+            with open(tmp_path / f'{name}.crate', 'wb') as f:
+                write_fields(f, [Version(value='1.0/Serato ScratchLive Crate'),
+                                 *[Track([TrackPath(p)]) for p in paths]])
+
+        opened = []
+        def counting_open(path):
+            opened.append(path)
+            return open_serato_audio(path)
+        monkeypatch.setattr(serato_read, 'open_serato_audio', counting_open)
+
+        apls = read_serato_library(tmp_path, self.trans, anchor=Path(""))
+        assert [(apl.folder, apl.name, apl.entries) for apl in apls] == [
+            ((), 'A', 2), (('A',), 'B', 1), (('A', 'B'), 'C', 2), ((), 'D', 1),
+        ]
+        # each file is decoded once and shared
+        assert sorted(opened) == sorted([self.file_mp3_ref, self.file_flac_ref, self.file_m4a_ref])
+        assert apls[0].tracks[0] is apls[1].tracks[0]
+        assert apls[3].tracks == [from_serato(self.audio_m4a_ref)] # pyright: ignore
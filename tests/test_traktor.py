@@ -5,10 +5,11 @@
 from datetime import date
 from pathlib import Path, PurePosixPath, PureWindowsPath
 import pytest
+import warnings
 import xml.etree.ElementTree as ET
 
 from djbabel.traktor.read import aformat_from_path
-from djbabel.traktor.utils import traktor_path
+from djbabel.traktor.utils import TRAKTOR_TEXT_FIELDS, traktor_path
 
 from djbabel.traktor.write import (
     info_tag,
@@ -26,17 +27,12 @@ from djbabel.traktor.write import (
 )
 
 from djbabel.traktor.read import (
-    find_collection_entry,
-    get_info_subtag,
-    get_album_subtag,
-    get_tempo_subtag,
-    get_location,
-    get_loudness,
+    decode_entry,
+    index_collection,
+    stream_traktor_playlist,
     adjust_location,
-    get_musical_key_subtag,
     musical_key_to_classic_key,
-    get_cue_v2_beatgrid,
-    get_cue_v2_cues,
+    read_traktor_library,
     read_traktor_playlist
 )
 
@@ -51,7 +47,8 @@ from djbabel.types import (
     ATrack,
     ATransformation,
     AMarkerType,
-    AMarkerColors
+    AMarkerColors,
+    AudioFileInaccessibleWarning
 )
 
 from djbabel.utils import path_anchor, to_float
@@ -170,8 +167,9 @@ class TestTraktorReadTags:
     pl = root.find('.//NODE[@TYPE="PLAYLIST"]')
     assert pl is not None
     pl_keys = pl.findall('./PLAYLIST/ENTRY/PRIMARYKEY')
-    e0 = find_collection_entry(col, pl_keys[0].get('KEY'))
-    e1 = find_collection_entry(col, pl_keys[1].get('KEY'))
+    index = index_collection(col.iter('ENTRY'))
+    e0 = index[pl_keys[0].attrib['KEY']]
+    e1 = index[pl_keys[1].attrib['KEY']]
 
 
     @pytest.mark.parametrize("path, expected", [
@@ -196,9 +194,8 @@ class TestTraktorReadTags:
         ('genre', "Dance / Pop"),
         ('not_defined', None),
     ])
-    def test_traktor_get_info_subtag(self, fn, expected):
-        assert self.e0 is not None
-        result = get_info_subtag(fn, self.e0)
+    def test_traktor_decode_entry_info(self, fn, expected):
+        result = decode_entry(self.e0).get(fn)
         assert result == expected
 
 
@@ -207,9 +204,8 @@ class TestTraktorReadTags:
         ('album', "Beautiful People (Extended)"),
         ('not_defined', None),
     ])
-    def test_traktor_get_album_subtag(self, fn, expected):
-        assert self.e0 is not None
-        result = get_album_subtag(fn, self.e0)
+    def test_traktor_decode_entry_album(self, fn, expected):
+        result = decode_entry(self.e0).get(fn)
         assert result == expected
 
 
@@ -217,15 +213,13 @@ class TestTraktorReadTags:
         ('average_bpm', 126.999878),
         ('not_defined', None),
     ])
-    def test_traktor_get_tempo_subtag(self, fn, expected):
-        assert self.e0 is not None
-        result = to_float(get_tempo_subtag(fn, self.e0))
+    def test_traktor_decode_entry_tempo(self, fn, expected):
+        result = to_float(decode_entry(self.e0).get(fn))
         assert result == expected
 
 
-    def test_traktor_get_location(self):
-        assert self.e0 is not None
-        result = get_location(self.e0)
+    def test_traktor_decode_entry_location(self):
+        result = decode_entry(self.e0)['location']
         assert result.as_posix() == path_anchor(None).as_posix() + 'Users/myname/Music/David Guetta/Beautiful People - Single/David_Guetta,_Sia_-_Beautiful_People_(Extended).mp3'
 
 
@@ -236,36 +230,31 @@ class TestTraktorReadTags:
         (None, Path(path_anchor(None)).joinpath('Users', 'myname'), Path(path_anchor(None)).joinpath('Music', 'David Guetta', 'Beautiful People - Single/David_Guetta,_Sia_-_Beautiful_People_(Extended).mp3')),
     ])
     def test_traktor_adjust_location(self, anchor, rel, expected):
-        assert self.e0 is not None
-        result = adjust_location(get_location(self.e0), anchor, rel)
+        result = adjust_location(decode_entry(self.e0)['location'], anchor, rel)
         assert result.as_posix() == expected.as_posix()
 
 
-    def test_traktor_get_loudness(self):
-        assert self.e0 is not None
-        result = get_loudness(self.e0)
+    def test_traktor_decode_entry_loudness(self):
+        result = decode_entry(self.e0)['loudness']
         assert result == ALoudness(0.0, 0.0)
 
 
-    def test_traktor_get_musical_key_subtag(self):
-        assert self.e0 is not None
-        result = get_musical_key_subtag('tonality', self.e0)
+    def test_traktor_decode_entry_musical_key(self):
+        result = decode_entry(self.e0)['tonality']
         assert result == '21'
         assert musical_key_to_classic_key(result) == 'Fmin'
 
 
-    def test_traktor_get_beatgrid(self):
-        assert self.e0 is not None
-        result = get_cue_v2_beatgrid(self.e0)
+    def test_traktor_decode_entry_beatgrid(self):
+        result = decode_entry(self.e0)['beatgrid']
         assert result == [ABeatGridBPM(position=0.052261284000000005,
                                       bpm=126.999878,
                                       metro=(4, 4))
                           ]
 
 
-    def test_traktor_get_cues(self):
-        assert self.e0 is not None
-        result = get_cue_v2_cues(self.e0)
+    def test_traktor_decode_entry_cues(self):
+        result = decode_entry(self.e0)['markers']
         assert result == [AMarker(name='n.n.',
                                   color=None,
                                   start=0.052261284000000005,
@@ -283,6 +272,21 @@ class TestTraktorReadTags:
                           ]
 
 
+    @pytest.mark.parametrize("entry", [e0, e1])
+    def test_traktor_decode_entry(self, entry):
+        e = decode_entry(entry)
+        assert set(TRAKTOR_TEXT_FIELDS) <= e.keys()
+        cues = entry.findall('CUE_V2')
+        assert len(e['beatgrid']) + len(e['markers']) == len(cues)
+
+
+    def test_traktor_index_collection(self):
+        index = self.index
+        assert len(index) == 2
+        assert index[self.pl_keys[0].get('KEY')] is self.e0
+        assert index[self.pl_keys[1].get('KEY')] is self.e1
+
+
     def test_traktor_read_playlist(self):
         assert self.e0 is not None
         result = read_traktor_playlist(self.nml_path, None, self.trans)
@@ -292,3 +296,61 @@ class TestTraktorReadTags:
             'Beautiful People (Extended)',
             'You Used To Salsa'
         ]
+
+
+    def test_traktor_stream_playlist(self):
+        nml_version, pl, index = stream_traktor_playlist(self.nml_path, 'test')
+        assert nml_version == 20
+        assert pl.get('NAME') == 'test'
+        assert sorted(index.keys()) == sorted(k.get('KEY') for k in self.pl_keys)
+        e0 = index[self.pl_keys[0].get('KEY')]
+        assert len(e0.findall('CUE_V2')) == 3
+
+
+    def test_traktor_read_playlist_stream(self):
+        result = read_traktor_playlist(self.nml_path, None, self.trans, stream=True)
+        expected = read_traktor_playlist(self.nml_path, None, self.trans)
+        assert result == expected
+
+
+    def test_traktor_read_playlist_jobs(self):
+        with pytest.warns(AudioFileInaccessibleWarning) as expected_warnings:
+            expected = read_traktor_playlist(self.nml_path, None, self.trans)
+        with pytest.warns(AudioFileInaccessibleWarning) as result_warnings:
+            result = read_traktor_playlist(self.nml_path, None, self.trans, jobs=3)
+        assert result == expected
+        # warnings are emitted in playlist order
+        assert ([str(w.message) for w in result_warnings] ==
+                [str(w.message) for w in expected_warnings])
+
+
+    def test_traktor_read_playlist_no_audio(self):
+        with warnings.catch_warnings():
+            # no attempt to open the (missing) audio files
+            warnings.simplefilter('error', AudioFileInaccessibleWarning)
+            result = read_traktor_playlist(self.nml_path, None, self.trans, read_audio=False)
+        with pytest.warns(AudioFileInaccessibleWarning):
+            expected = read_traktor_playlist(self.nml_path, None, self.trans)
+        assert result == expected
+
+
+    def test_traktor_read_library(self, tmp_path):
+        root = ET.parse(self.nml_path).getroot()
+        subnodes = root.find('./PLAYLISTS/NODE/SUBNODES')
+        assert subnodes is not None
+        folder = ET.SubElement(subnodes, 'NODE', TYPE="FOLDER", NAME="house")
+        pl = ET.SubElement(ET.SubElement(folder, 'SUBNODES', COUNT="1"),
+                           'NODE', TYPE="PLAYLIST", NAME="salsa")
+        pl_list = ET.SubElement(pl, 'PLAYLIST', ENTRIES="1", TYPE="LIST")
+        ET.SubElement(ET.SubElement(pl_list, 'ENTRY'),
+                      'PRIMARYKEY', TYPE="TRACK", KEY=self.pl_keys[1].get('KEY'))
+        nml_path = tmp_path / 'collection.nml'
+        ET.ElementTree(root).write(nml_path, "utf-8", True)
+
+        result = read_traktor_library(nml_path, self.trans)
+        assert [(apl.folder, apl.name, apl.entries) for apl in result] == [
+            ((), 'test', 2),
+            (('house',), 'salsa', 1),
+        ]
+        # tracks are decoded once and shared between playlists
+        assert result[1].tracks[0] is result[0].tracks[1]